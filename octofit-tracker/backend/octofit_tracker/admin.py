@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Team, User, Activity, Leaderboard, Workout
+from .models import Team, User, Activity, ActivityRollup, Leaderboard, Workout
 
 
 @admin.register(Team)
@@ -25,6 +25,14 @@ class ActivityAdmin(admin.ModelAdmin):
     ordering = ['-date']
 
 
+@admin.register(ActivityRollup)
+class ActivityRollupAdmin(admin.ModelAdmin):
+    list_display = ['granularity', 'bucket', 'scope', 'scope_id', 'type', 'count',
+                    'duration', 'distance', 'calories']
+    list_filter = ['granularity', 'scope', 'type']
+    ordering = ['-bucket']
+
+
 @admin.register(Leaderboard)
 class LeaderboardAdmin(admin.ModelAdmin):
     list_display = ['rank', 'user_name', 'team_id', 'total_activities', 'total_duration', 
@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class OctofitTrackerConfig(AppConfig):
+    name = 'octofit_tracker'
+
+    def ready(self):
+        # Connect the receivers that keep derived data in step with writes,
+        # and the Mongo command listener before any client is created.
+        from . import (  # noqa: F401
+            expand, leaderboard, metrics, rank_index, recommendations, response_cache, rollups,
+            streams, windows
+        )
@@ -0,0 +1,63 @@
+"""
+Async read endpoints for ASGI deployments.
+
+Under ASGI, Django runs sync views through ``sync_to_async`` with
+``thread_sensitive=True``, which funnels every request of a worker through
+one thread. The views here are async and hand the existing DRF list and
+retrieve actions to a dedicated thread pool instead, so up to
+ASYNC_READ_WORKERS reads run concurrently against the shared pymongo pool
+while the event loop keeps accepting connections. Responses are identical
+to the sync endpoints; only viewsets backed by native pymongo reads are
+exposed, since djongo connections are not meant to be shared across pool
+threads.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import path
+
+from .views import ActivityViewSet, LeaderboardViewSet, UserViewSet
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.ASYNC_READ_WORKERS, thread_name_prefix='async-read'
+)
+
+
+def offload(view):
+    """Wrap a sync view in an async view that runs it on the read pool."""
+    def render(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    run = sync_to_async(render, thread_sensitive=False, executor=_executor)
+
+    async def async_view(request, *args, **kwargs):
+        return await run(request, *args, **kwargs)
+
+    # Django 4.1's csrf_exempt decorator would turn this back into a sync
+    # view; DRF enforces CSRF itself for session-authenticated requests.
+    async_view.csrf_exempt = True
+    return async_view
+
+
+def read_routes(prefix, viewset, basename):
+    return [
+        path(f'{prefix}/', offload(viewset.as_view({'get': 'list'}, basename=basename)),
+             name=f'async-{basename}-list'),
+        path(f'{prefix}/<str:pk>/', offload(viewset.as_view({'get': 'retrieve'}, basename=basename)),
+             name=f'async-{basename}-detail'),
+    ]
+
+
+urlpatterns = [
+    *read_routes('activities', ActivityViewSet, 'activity'),
+    *read_routes('users', UserViewSet, 'user'),
+    *read_routes('leaderboard', LeaderboardViewSet, 'leaderboard'),
+]
@@ -0,0 +1,25 @@
+"""
+djongo on the shared client from ``octofit_tracker.mongo``.
+
+Stock djongo caches a client per database name and closes it whenever
+Django closes the connection, which with CONN_MAX_AGE=0 is after every
+request, dropping the sockets of every thread using that client. Here a
+connection is only a handle on the shared client, and closing it leaves
+the pool open.
+"""
+from djongo.base import DatabaseWrapper as DjongoDatabaseWrapper, DjongoClient
+
+from ... import mongo
+
+
+class DatabaseWrapper(DjongoDatabaseWrapper):
+    def get_new_connection(self, connection_params):
+        self.client_connection = mongo.get_client()
+        database = self.client_connection[connection_params['name']]
+        if self.settings_dict.get('REPLICA'):
+            database = database.with_options(read_preference=mongo.replica_read_preference())
+        self.djongo_connection = DjongoClient(database, connection_params['enforce_schema'])
+        return database
+
+    def _close(self):
+        pass
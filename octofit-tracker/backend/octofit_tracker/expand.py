@@ -0,0 +1,135 @@
+"""
+``?expand=user,team`` on activity, user and leaderboard responses.
+
+References on a page are resolved together: ids are collected from every
+row, looked up in the response cache with one ``get_many`` and the misses
+are read with a single ``$in`` query per collection, so a page costs at
+most two queries whatever its size. Documents stay cached for
+EXPAND_CACHE_TIMEOUT seconds and are dropped when the user or team is
+written.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from rest_framework.exceptions import ValidationError
+
+from .models import Team, User
+from .mongo import get_collection
+from .serializers import parse_fields
+
+# Embedded fields per expansion; timestamps are left out so the documents
+# need no conversion.
+EXPANSIONS = {
+    'user': (User, ['_id', 'name', 'email', 'team_id', 'role']),
+    'team': (Team, ['_id', 'name', 'description']),
+}
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _key(model, _id):
+    return f'expand:{model._meta.db_table}:{_id}'
+
+
+def lookup(model, fields, ids):
+    """Return ``{_id: document}`` for ``ids``, reading only cache misses from Mongo."""
+    ids = {_id for _id in ids if _id is not None}
+    if not ids:
+        return {}
+    keys = {_key(model, _id): _id for _id in ids}
+    found = {keys[key]: document for key, document in _cache().get_many(keys).items()}
+    missing = ids.difference(found)
+    if missing:
+        documents = {
+            document['_id']: document
+            for document in get_collection(model).find({'_id': {'$in': list(missing)}}, fields)
+        }
+        _cache().set_many(
+            {_key(model, _id): document for _id, document in documents.items()},
+            settings.EXPAND_CACHE_TIMEOUT,
+        )
+        found.update(documents)
+    return found
+
+
+def _forget(sender, instance, **kwargs):
+    _cache().delete(_key(sender, instance.pk))
+
+
+post_save.connect(_forget, sender=User)
+post_delete.connect(_forget, sender=User)
+post_save.connect(_forget, sender=Team)
+post_delete.connect(_forget, sender=Team)
+
+
+def parse_expand(value, allowed):
+    names = parse_fields(value)
+    unknown = [name for name in names if name not in allowed]
+    if unknown:
+        raise ValidationError({'expand': [
+            f"Cannot expand {', '.join(unknown)}; choose from {', '.join(allowed)}."
+        ]})
+    return names
+
+
+def expand_rows(rows, names):
+    """
+    Embed the documents named in ``names`` into each row dict. Rows carry
+    ``user_id`` and/or ``team_id``; a row without ``team_id`` (an activity)
+    gets the team of its user.
+    """
+    rows = list(rows)
+    users = {}
+    if 'user' in names or ('team' in names and any('team_id' not in row for row in rows)):
+        users = lookup(User, EXPANSIONS['user'][1], (row.get('user_id') for row in rows))
+
+    def team_id(row):
+        if 'team_id' in row:
+            return row['team_id']
+        user = users.get(row.get('user_id'))
+        return user['team_id'] if user else None
+
+    teams = {}
+    if 'team' in names:
+        teams = lookup(Team, EXPANSIONS['team'][1], (team_id(row) for row in rows))
+
+    for row in rows:
+        if 'team' in names:
+            row['team'] = teams.get(team_id(row))
+        if 'user' in names:
+            row['user'] = users.get(row.get('user_id'))
+    return rows
+
+
+class ExpandMixin:
+    """
+    Accept ``?expand=`` on list and retrieve, embedding the referenced
+    documents named in ``expandable`` into the serialized rows.
+    """
+    expandable = ()
+
+    def requested_expansions(self, request):
+        return parse_expand(request.query_params.get('expand', ''), self.expandable)
+
+    def expand_response(self, request, response):
+        names = self.requested_expansions(request)
+        if not names or response.status_code != 200:
+            return response
+        data = response.data
+        if isinstance(data, dict) and 'results' in data:
+            expand_rows(data['results'], names)
+        elif isinstance(data, dict):
+            expand_rows([data], names)
+        else:
+            expand_rows(data, names)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        self.requested_expansions(request)
+        return self.expand_response(request, super().list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        self.requested_expansions(request)
+        return self.expand_response(request, super().retrieve(request, *args, **kwargs))
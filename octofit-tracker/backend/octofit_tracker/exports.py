@@ -0,0 +1,92 @@
+"""
+Streaming exports: documents are read from a Mongo cursor in
+MONGODB_BATCH_SIZE batches with a projection, formatted as CSV or NDJSON
+and written out one batch per chunk, optionally gzipped, so memory use does
+not grow with the collection.
+"""
+import csv
+import json
+import zlib
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.negotiation import DefaultContentNegotiation
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportNegotiation(DefaultContentNegotiation):
+    """Leave ``?format=`` to the export action instead of picking a renderer with it."""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def _formatters(serializer_class, fields):
+    serializer_fields = serializer_class().fields
+    return [(name, serializer_fields[name].to_representation) for name in fields]
+
+
+def _values(document, formatters):
+    for name, to_representation in formatters:
+        value = document.get(name)
+        yield None if value is None else to_representation(value)
+
+
+def csv_rows(documents, formatters):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in formatters])
+    for document in documents:
+        yield writer.writerow(list(_values(document, formatters)))
+
+
+def ndjson_rows(documents, formatters):
+    names = [name for name, _ in formatters]
+    for document in documents:
+        yield json.dumps(dict(zip(names, _values(document, formatters)))) + '\n'
+
+
+def chunked(rows, size):
+    """Join rows into chunks of ``size`` rows, encoded as UTF-8."""
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield ''.join(chunk).encode()
+            chunk = []
+    if chunk:
+        yield ''.join(chunk).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_response(queryset, serializer_class, fields, export_format, compression, filename):
+    """Stream ``queryset`` (a NativeQuerySet) as a CSV or NDJSON download."""
+    formatters = _formatters(serializer_class, fields)
+    documents = queryset.only(*fields)
+    rows = (csv_rows if export_format == 'csv' else ndjson_rows)(documents, formatters)
+    chunks = chunked(rows, settings.MONGODB_BATCH_SIZE)
+    filename = f'{filename}.{export_format}'
+    content_type = CONTENT_TYPES[export_format]
+    if compression == 'gzip':
+        chunks = gzipped(chunks)
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
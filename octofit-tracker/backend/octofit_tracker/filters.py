@@ -0,0 +1,66 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from .models import User
+from .native import NativeQuerySet
+from .serializers import ActivityFilterSerializer, ActivitySerializer, parse_fields
+
+
+class StableOrderingFilter(OrderingFilter):
+    """OrderingFilter that always ends with ``_id`` so ties sort deterministically."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view) or [])
+        if not any(field.lstrip('-') == '_id' for field in ordering):
+            ordering.append('-_id' if ordering and ordering[0].startswith('-') else '_id')
+        return ordering
+
+
+class ActivityFilterBackend(BaseFilterBackend):
+    """
+    Translate the activity query parameters into queryset lookups, which the
+    native read path turns into a Mongo filter and projection:
+
+    ?user_id=, ?team_id=, ?type=, ?date_after=, ?date_before= and
+    ?fields= (comma-separated sparse fieldset).
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = ActivityFilterSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        lookups = {}
+        for param, lookup in (
+            ('user_id', 'user_id'),
+            ('type', 'type'),
+            ('date_after', 'date__gte'),
+            ('date_before', 'date__lte'),
+        ):
+            if param in params:
+                lookups[lookup] = params[param]
+        if 'team_id' in params:
+            members = NativeQuerySet(User).filter(team_id=params['team_id']).only('_id')
+            member_ids = [member['_id'] for member in members]
+            # Narrow to the one user here rather than relying on how the
+            # queryset combines two lookups on user_id.
+            if 'user_id' in lookups:
+                user_id = lookups.pop('user_id')
+                member_ids = [user_id] if user_id in member_ids else []
+            lookups['user_id__in'] = member_ids
+        if lookups:
+            queryset = queryset.filter(**lookups)
+
+        fields = parse_fields(request.query_params.get('fields', ''))
+        unknown = [name for name in fields if name not in ActivitySerializer.Meta.fields]
+        if unknown:
+            raise ValidationError({'fields': [f'Unknown field: {name}' for name in unknown]})
+        if fields:
+            # The pagination cursor is read from the ordering fields, so they
+            # are always fetched even when not requested.
+            ordering = [
+                field.lstrip('-')
+                for field in StableOrderingFilter().get_ordering(request, queryset, view)
+            ]
+            queryset = queryset.only(*dict.fromkeys(fields + ordering))
+        return queryset
@@ -0,0 +1,107 @@
+"""
+Server-side integer ``_id`` allocation.
+
+Each collection has a document in the ``counters`` collection whose ``seq``
+is the highest id handed out. A process reserves ID_BLOCK_SIZE ids at a
+time with one atomic ``find_one_and_update`` and serves allocations from
+that block in memory, so concurrent creates never collide and most of
+them need no round trip. Blocks are dropped after a fork so parent and
+child never share one; unused ids in a dropped block are simply skipped.
+"""
+import os
+from threading import Lock
+
+from django.conf import settings
+from pymongo import DESCENDING, ReturnDocument
+
+from .mongo import get_db
+
+COUNTERS_COLLECTION = 'counters'
+
+
+def _max_id(db, collection):
+    last = db[collection].find_one({}, {'_id': 1}, sort=[('_id', DESCENDING)])
+    return last['_id'] if last else 0
+
+
+def sync_counter(db, collection):
+    """Raise the counter of ``collection`` to its highest existing ``_id``."""
+    db[COUNTERS_COLLECTION].update_one(
+        {'_id': collection}, {'$max': {'seq': _max_id(db, collection)}}, upsert=True
+    )
+
+
+def sync_counters(db, models):
+    """Sync the counters after documents were written with explicit ids."""
+    for model in models:
+        sync_counter(db, model._meta.db_table)
+
+
+def observe(model, highest_id):
+    """Make sure ``highest_id``, written explicitly, is never allocated."""
+    get_db()[COUNTERS_COLLECTION].update_one(
+        {'_id': model._meta.db_table}, {'$max': {'seq': highest_id}}, upsert=True
+    )
+
+
+class IdAllocator:
+    def __init__(self, block_size=None):
+        self.block_size = block_size or settings.ID_BLOCK_SIZE
+        self._blocks = {}  # collection -> [next id, last id]
+        self._synced = set()
+        self._pid = os.getpid()
+        self._lock = Lock()
+
+    def _reserve(self, collection, size):
+        db = get_db()
+        if collection not in self._synced:
+            # Counters start from existing data the first time a process
+            # allocates, covering documents loaded with explicit ids.
+            sync_counter(db, collection)
+            self._synced.add(collection)
+        counter = db[COUNTERS_COLLECTION].find_one_and_update(
+            {'_id': collection}, {'$inc': {'seq': size}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return counter['seq'] - size + 1, counter['seq']
+
+    def reserve_range(self, model, count):
+        """Reserve ``count`` consecutive ids for ``model``, bypassing the block; return the first."""
+        with self._lock:
+            return self._reserve(model._meta.db_table, count)[0]
+
+    def allocate(self, model, count=1):
+        """Return a list of ``count`` unused ids for ``model``."""
+        collection = model._meta.db_table
+        with self._lock:
+            if self._pid != os.getpid():
+                self._blocks.clear()
+                self._pid = os.getpid()
+            ids = []
+            block = self._blocks.get(collection)
+            while len(ids) < count:
+                if block is None or block[0] > block[1]:
+                    block = list(self._reserve(collection, max(self.block_size, count - len(ids))))
+                    self._blocks[collection] = block
+                take = min(count - len(ids), block[1] - block[0] + 1)
+                ids.extend(range(block[0], block[0] + take))
+                block[0] += take
+            return ids
+
+
+allocator = IdAllocator()
+
+
+def next_id(model):
+    return allocator.allocate(model)[0]
+
+
+def reserve_range(model, count):
+    return allocator.reserve_range(model, count)
+
+
+class AllocatedIdMixin:
+    """Create objects with a server-allocated ``_id``."""
+
+    def perform_create(self, serializer):
+        serializer.save(_id=next_id(self.queryset.model))
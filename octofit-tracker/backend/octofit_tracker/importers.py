@@ -0,0 +1,194 @@
+"""
+Streaming readers and pool workers for ``manage.py import_activities``.
+
+Readers yield raw records (CSV records, NDJSON lines or GPX tracks) without
+building the file in memory. Workers parse a chunk of records into activity
+payloads and validate them with the ActivitySerializer rules, returning
+the documents to write and the per-record errors. CSV and NDJSON records
+reach the workers unparsed, so the main process only splits the file.
+"""
+import csv
+import io
+import json
+import math
+from datetime import datetime
+from xml.etree.ElementTree import iterparse
+
+import django
+
+FORMATS = {
+    '.csv': 'csv',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+    '.gpx': 'gpx',
+}
+
+# GPX activity types as written by common devices and apps.
+GPX_TYPES = {
+    'run': 'running',
+    'running': 'running',
+    'ride': 'cycling',
+    'cycling': 'cycling',
+    'biking': 'cycling',
+    'swim': 'swimming',
+    'swimming': 'swimming',
+}
+
+# Rough kcal per minute, used when a GPX track carries no calorie count.
+CALORIES_PER_MINUTE = {
+    'running': 11,
+    'cycling': 8,
+    'swimming': 9,
+    'strength_training': 6,
+    'yoga': 4,
+}
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def csv_header(path):
+    with open(path, newline='', encoding='utf-8') as stream:
+        return next(csv.reader(stream), [])
+
+
+def read_csv(path):
+    """
+    Yield the raw bytes of each CSV record after the header. A record ends
+    at the first line break outside quotes, i.e. once it holds an even
+    number of quote characters, so quoted fields may span lines.
+    """
+    with open(path, 'rb') as stream:
+        stream.readline()
+        record = b''
+        for line in stream:
+            record += line
+            if record.count(b'"') % 2 == 0:
+                if record.strip():
+                    yield record
+                record = b''
+        if record.strip():
+            yield record
+
+
+def parse_csv_record(record, fields):
+    """Parse one raw CSV record into a dict keyed by ``fields``, like csv.DictReader."""
+    return next(csv.DictReader(io.StringIO(record.decode('utf-8'), newline=''), fieldnames=fields))
+
+
+def read_ndjson(path):
+    with open(path, 'rb') as stream:
+        for line in stream:
+            if line.strip():
+                yield line
+
+
+def read_gpx(path):
+    """
+    Yield one ``{'name', 'type', 'calories', 'points'}`` record per ``<trk>``,
+    where points are ``(lat, lon, time)`` tuples. Parsed elements are
+    cleared as soon as they are read.
+    """
+    track, points, point = None, [], None
+    for event, element in iterparse(path, events=('start', 'end')):
+        tag = _local(element.tag)
+        if event == 'start':
+            if tag == 'trk':
+                track, points = {'name': '', 'type': '', 'calories': None}, []
+            elif tag == 'trkpt':
+                point = [float(element.get('lat')), float(element.get('lon')), None]
+            continue
+        if track is None:
+            element.clear()
+            continue
+        if tag == 'time' and point is not None:
+            point[2] = (element.text or '').strip()
+        elif tag == 'trkpt':
+            points.append(tuple(point))
+            point = None
+        elif tag in ('name', 'type') and point is None:
+            track[tag] = (element.text or '').strip()
+        elif tag == 'calories':
+            track['calories'] = (element.text or '').strip()
+        elif tag == 'trk':
+            track['points'] = points
+            yield track
+            track = None
+        if tag in ('trkpt', 'trk', 'trkseg'):
+            element.clear()
+
+
+READERS = {
+    'csv': read_csv,
+    'ndjson': read_ndjson,
+    'gpx': read_gpx,
+}
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def haversine_km(first, second):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*first, *second))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def gpx_payload(track, user_id):
+    """Summarize a GPX track as an activity payload (without ``_id``)."""
+    timed = [point for point in track['points'] if point[2]]
+    if len(timed) < 2:
+        raise ValueError('Track needs at least two timed points.')
+    start, end = _parse_time(timed[0][2]), _parse_time(timed[-1][2])
+    points = track['points']
+    distance = sum(haversine_km(points[i][:2], points[i + 1][:2]) for i in range(len(points) - 1))
+    activity_type = GPX_TYPES.get(track['type'].lower(), track['type'].lower())
+    duration = round((end - start).total_seconds() / 60)
+    calories = track['calories'] or duration * CALORIES_PER_MINUTE.get(activity_type, 0)
+    return {
+        'user_id': user_id,
+        'type': activity_type,
+        'duration': duration,
+        'distance': round(distance, 2),
+        'calories': calories,
+        'date': start.isoformat(),
+        'notes': track['name'] or 'Imported from GPX',
+    }
+
+
+def init_worker():
+    # Spawned workers (non-fork platforms) start without Django configured.
+    django.setup()
+
+
+def validate_chunk(file_format, records, options):
+    """
+    Validate ``(number, record)`` pairs, returning ``(documents, errors)``.
+    Records without an ``_id`` (all GPX tracks) are left for the caller
+    to number.
+    """
+    from .serializers import BulkActivitySerializer
+
+    serializer = BulkActivitySerializer(many=True)
+    payloads, errors = [], []
+    for number, record in records:
+        try:
+            if file_format == 'csv':
+                record = parse_csv_record(record, options['csv_fields'])
+            elif file_format == 'ndjson':
+                record = json.loads(record)
+            elif file_format == 'gpx':
+                record = gpx_payload(record, options['user_id'])
+        except (ValueError, csv.Error) as exc:
+            errors.append({'record': number, 'errors': {'non_field_errors': [str(exc)]}})
+            continue
+        payloads.append((number, record))
+    valid, invalid = serializer.validate_items(payloads)
+    errors.extend({'record': error['index'], 'errors': error['errors']} for error in invalid)
+    errors.sort(key=lambda error: error['record'])
+    return [dict(data) for _, data in valid], errors
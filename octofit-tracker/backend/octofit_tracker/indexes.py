@@ -0,0 +1,68 @@
+from collections import Counter
+
+from django.apps import apps
+from pymongo import IndexModel
+from pymongo.errors import OperationFailure
+
+
+def declared_indexes():
+    """Map each collection name to the IndexModel specs declared on its model."""
+    return {
+        model._meta.db_table: model.mongo_indexes
+        for model in apps.get_app_config('octofit_tracker').get_models()
+        if getattr(model, 'mongo_indexes', None)
+    }
+
+
+def _in_background(index):
+    options = {key: value for key, value in index.document.items() if key != 'key'}
+    options.setdefault('background', True)
+    return IndexModel(list(index.document['key'].items()), **options)
+
+
+def ensure_indexes(db):
+    """
+    Create every declared index in the background. Existing indexes with the
+    same spec are left alone, so this is safe to run repeatedly.
+
+    Returns ``(created, failed)``: collection -> index names, and
+    collection -> error message for specs that conflict with an existing index.
+    """
+    created, failed = {}, {}
+    for collection, indexes in declared_indexes().items():
+        try:
+            created[collection] = db[collection].create_indexes(
+                [_in_background(index) for index in indexes]
+            )
+        except OperationFailure as exc:
+            failed[collection] = str(exc)
+    return created, failed
+
+
+def _is_covered(fields, index_keys):
+    """True if ``fields`` are all served by a prefix of ``index_keys``."""
+    return fields <= set(index_keys[:len(fields)])
+
+
+def find_unindexed_scans(db):
+    """
+    Group the COLLSCAN queries recorded in ``system.profile`` by collection
+    and filtered fields, keeping only shapes no declared or existing index
+    covers. Returns a Counter of ``(collection, fields)`` -> occurrences.
+    """
+    scans = Counter()
+    known = {}
+    for entry in db['system.profile'].find({'planSummary': 'COLLSCAN'}):
+        collection = entry['ns'].split('.', 1)[1]
+        command = entry.get('command', {})
+        query = command.get('filter', command.get('q', {})) or {}
+        fields = frozenset(key for key in query if not key.startswith('$'))
+        if not fields:
+            continue
+        if collection not in known:
+            known[collection] = [
+                list(index['key']) for index in db[collection].list_indexes()
+            ] + [list(dict(index.document['key'])) for index in declared_indexes().get(collection, [])]
+        if not any(_is_covered(fields, keys) for keys in known[collection]):
+            scans[(collection, tuple(sorted(fields)))] += 1
+    return scans
@@ -0,0 +1,88 @@
+from itertools import islice
+
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+from rest_framework.exceptions import ParseError
+
+from . import ids
+from .models import Activity
+from .mongo import get_collection
+from .serializers import BulkActivitySerializer
+from .signals import activities_changed
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _insert(collection, documents, indexes, errors):
+    """Insert one chunk unordered and return the documents that were written."""
+    if not documents:
+        return []
+    try:
+        collection.insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        failed = set()
+        for error in exc.details['writeErrors']:
+            failed.add(error['index'])
+            errors.append({
+                'index': indexes[error['index']],
+                'errors': {'non_field_errors': [error['errmsg']]},
+            })
+        return [document for position, document in enumerate(documents) if position not in failed]
+    return documents
+
+
+def _assign_ids(documents):
+    """
+    Number documents sent without an ``_id`` from a fresh range above the
+    chunk's explicit ids, raising the counter past those first so the two
+    can never collide.
+    """
+    explicit = [document['_id'] for document in documents if '_id' in document]
+    missing = [document for document in documents if '_id' not in document]
+    if explicit:
+        ids.observe(Activity, max(explicit))
+    if missing:
+        first = ids.reserve_range(Activity, len(missing))
+        for offset, document in enumerate(missing):
+            document['_id'] = first + offset
+
+
+def ingest_activities(items, chunk_size=None):
+    """
+    Validate and insert an iterable of activity payloads in chunks.
+
+    Invalid items and failed writes are reported by their position in
+    ``items``; everything else is written. activities_changed is sent once
+    for the whole batch, so the leaderboard and rollups update once.
+    """
+    chunk_size = chunk_size or settings.ACTIVITY_BULK_CHUNK_SIZE
+    collection = get_collection(Activity)
+    serializer = BulkActivitySerializer(many=True)
+    created, errors = [], []
+
+    for chunk in _chunks(enumerate(items), chunk_size):
+        parse_errors = [(index, item) for index, item in chunk if isinstance(item, ParseError)]
+        for index, item in parse_errors:
+            errors.append({'index': index, 'errors': {'non_field_errors': [str(item.detail)]}})
+        valid, invalid = serializer.validate_items(
+            (index, item) for index, item in chunk if not isinstance(item, ParseError)
+        )
+        errors.extend(invalid)
+        valid, unknown = serializer.validate_users(valid)
+        errors.extend(unknown)
+        indexes = [index for index, _ in valid]
+        documents = [dict(data) for _, data in valid]
+        _assign_ids(documents)
+        created.extend(_insert(collection, documents, indexes, errors))
+
+    if created:
+        activities_changed.send(sender=Activity, added=created, removed=[])
+    errors.sort(key=lambda error: error['index'])
+    return {'created': len(created), 'errors': errors}
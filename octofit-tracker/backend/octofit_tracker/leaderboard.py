@@ -0,0 +1,225 @@
+from collections import namedtuple
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Leaderboard, Team, User
+from .mongo import get_collection
+from .signals import activities_changed
+
+# Field the board is ranked on, highest first. Ties are broken by user_id so
+# every entry has a stable, unique rank.
+RANK_METRIC = settings.LEADERBOARD_RANK_METRIC
+
+TOTAL_FIELDS = ['total_activities', 'total_duration', 'total_distance', 'total_calories']
+
+RankChange = namedtuple('RankChange', ['user_id', 'old_rank', 'new_rank'])
+
+TEAM_STANDINGS_KEY = 'leaderboard:teams'
+
+# Sent after every applied batch with ``changes``, a list of RankChange for
+# each entry whose totals or rank moved, and ``team_deltas``, the per-team
+# ``total_*`` and ``member_count`` increments.
+leaderboard_changed = Signal()
+
+# Serializes the writers of one process only. Ranks stay unique on the
+# assumption that a single process applies activity writes to the board;
+# with several writers, rebuild_leaderboard restores a consistent ranking.
+_lock = Lock()
+
+
+def activity_field(activity, field):
+    if isinstance(activity, dict):
+        return activity[field]
+    return getattr(activity, field)
+
+
+def activity_delta(activity, sign=1):
+    """Return the leaderboard counter delta contributed by one activity."""
+    return {
+        'total_activities': sign,
+        'total_duration': sign * activity_field(activity, 'duration'),
+        'total_distance': sign * activity_field(activity, 'distance'),
+        'total_calories': sign * activity_field(activity, 'calories'),
+    }
+
+
+def collect_deltas(added=(), removed=()):
+    """Fold added and removed activities into one delta per user_id."""
+    deltas = {}
+    for activities, sign in ((added, 1), (removed, -1)):
+        for activity in activities:
+            delta = deltas.setdefault(activity_field(activity, 'user_id'), dict.fromkeys(TOTAL_FIELDS, 0))
+            for field, amount in activity_delta(activity, sign).items():
+                delta[field] += amount
+    return deltas
+
+
+def _new_entry(user_id):
+    # Named like rebuild_leaderboard names an entry whose user is gone.
+    user = User.objects.filter(_id=user_id).first()
+    entry = Leaderboard(
+        _id=user_id,
+        user_id=user_id,
+        user_name=user.name if user else f'User {user_id}',
+        team_id=user.team_id if user else 0,
+        rank=Leaderboard.objects.count() + 1,
+        **dict.fromkeys(TOTAL_FIELDS, 0)
+    )
+    entry.save()
+    return entry
+
+
+def _reposition(entry, old_value):
+    """Move ``entry`` to its new rank, shifting only the entries it passed."""
+    new_value = getattr(entry, RANK_METRIC)
+    if new_value > old_value:
+        passed = Leaderboard.objects.filter(rank__lt=entry.rank).filter(
+            Q(**{f'{RANK_METRIC}__lt': new_value})
+            | Q(**{RANK_METRIC: new_value, 'user_id__gt': entry.user_id})
+        )
+        step = 1
+    elif new_value < old_value:
+        passed = Leaderboard.objects.filter(rank__gt=entry.rank).filter(
+            Q(**{f'{RANK_METRIC}__gt': new_value})
+            | Q(**{RANK_METRIC: new_value, 'user_id__lt': entry.user_id})
+        )
+        step = -1
+    else:
+        return []
+
+    changes = []
+    for other in passed:
+        changes.append(RankChange(other.user_id, other.rank, other.rank + step))
+        other.rank += step
+        other.save(update_fields=['rank'])
+    entry.rank -= step * len(changes)
+    return changes
+
+
+def apply_deltas(deltas):
+    """
+    Apply per-user counter deltas to the board and re-rank the affected entries.
+
+    ``deltas`` maps user_id to a dict of ``total_*`` increments, as built by
+    ``collect_deltas``. Returns the list of RankChange that were applied.
+    """
+    changes = []
+    team_deltas = {}
+    with _lock:
+        for user_id, delta in deltas.items():
+            if not any(delta.values()):
+                continue
+            entry = Leaderboard.objects.filter(user_id=user_id).first()
+            is_new = entry is None
+            if is_new:
+                entry = _new_entry(user_id)
+            team_delta = team_deltas.setdefault(
+                entry.team_id, dict.fromkeys(TOTAL_FIELDS + ['member_count'], 0)
+            )
+            team_delta['member_count'] += int(is_new)
+            for field, amount in delta.items():
+                team_delta[field] += amount
+            old_rank = entry.rank
+            old_value = getattr(entry, RANK_METRIC)
+            for field, amount in delta.items():
+                setattr(entry, field, getattr(entry, field) + amount)
+            entry.total_distance = round(entry.total_distance, 2)
+            changes.extend(_reposition(entry, old_value))
+            entry.save()
+            changes.append(RankChange(user_id, old_rank, entry.rank))
+    if changes:
+        leaderboard_changed.send(sender=Leaderboard, changes=changes, team_deltas=team_deltas)
+    return changes
+
+
+def record_activity_change(added=(), removed=()):
+    """Update the board for activities that were created, updated or deleted."""
+    return apply_deltas(collect_deltas(added=added, removed=removed))
+
+
+@receiver(activities_changed)
+def _on_activities_changed(sender, added=(), removed=(), **kwargs):
+    record_activity_change(added=added, removed=removed)
+
+
+def _standings_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def rank_teams(standings):
+    standings.sort(key=lambda team: (-team[RANK_METRIC], team['team_id']))
+    for rank, team in enumerate(standings, 1):
+        team['rank'] = rank
+    return standings
+
+
+def compute_team_standings():
+    """Total the board per team with a single $group pipeline."""
+    pipeline = [
+        {'$group': {
+            '_id': '$team_id',
+            'member_count': {'$sum': 1},
+            **{field: {'$sum': f'${field}'} for field in TOTAL_FIELDS},
+        }},
+        {'$lookup': {
+            'from': Team._meta.db_table,
+            'localField': '_id',
+            'foreignField': '_id',
+            'as': 'team',
+        }},
+    ]
+    standings = []
+    for row in get_collection(Leaderboard).aggregate(pipeline):
+        standings.append({
+            'team_id': row['_id'],
+            'team_name': row['team'][0]['name'] if row['team'] else f"Team {row['_id']}",
+            'member_count': row['member_count'],
+            **{field: row[field] for field in TOTAL_FIELDS},
+        })
+        standings[-1]['total_distance'] = round(standings[-1]['total_distance'], 2)
+    return rank_teams(standings)
+
+
+def store_team_standings(standings):
+    _standings_cache().set(TEAM_STANDINGS_KEY, standings, settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def team_standings():
+    """Return the cached team standings, computing them on a miss."""
+    standings = _standings_cache().get(TEAM_STANDINGS_KEY)
+    if standings is None:
+        standings = compute_team_standings()
+        store_team_standings(standings)
+    return standings
+
+
+def invalidate_team_standings(**kwargs):
+    _standings_cache().delete(TEAM_STANDINGS_KEY)
+
+
+# Team names are denormalized into the standings.
+post_save.connect(invalidate_team_standings, sender=Team)
+post_delete.connect(invalidate_team_standings, sender=Team)
+
+
+@receiver(leaderboard_changed)
+def _refresh_team_standings(sender, team_deltas=None, **kwargs):
+    # Apply the deltas to the cached standings in place; a team that is not
+    # cached yet forces a recompute on the next read instead.
+    standings = _standings_cache().get(TEAM_STANDINGS_KEY)
+    if standings is None or not team_deltas:
+        return
+    teams = {team['team_id']: team for team in standings}
+    if any(team_id not in teams for team_id in team_deltas):
+        invalidate_team_standings()
+        return
+    for team_id, delta in team_deltas.items():
+        for field, amount in delta.items():
+            teams[team_id][field] += amount
+        teams[team_id]['total_distance'] = round(teams[team_id]['total_distance'], 2)
+    store_team_standings(rank_teams(standings))
@@ -0,0 +1,218 @@
+"""
+Full leaderboard rebuild with NumPy.
+
+Activities are streamed from Mongo with a projection into column arrays,
+totalled per user and per team with grouped reductions, ranked in one
+vectorized pass and written back with bulk upserts.
+
+Each rebuild bumps a generation marker in Mongo. Web workers compare it
+with the one they last saw (``watcher.check()``, at most every
+LEADERBOARD_REBUILD_CHECK_SECONDS) and drop their rank index, cached
+responses and team standings when a rebuild ran in another process, such
+as ``manage.py rebuild_leaderboard``.
+"""
+from threading import Lock
+from time import monotonic
+
+import numpy as np
+from django.conf import settings
+from pymongo import ReplaceOne
+
+from . import leaderboard, rank_index, response_cache
+from .models import Activity, Leaderboard, Team, User
+from .mongo import get_db, replica_read_preference
+
+MARKERS_COLLECTION = 'rebuild_markers'
+MARKER_ID = 'leaderboard'
+
+METRICS = {
+    'calories': 'total_calories',
+    'duration': 'total_duration',
+    'distance': 'total_distance',
+}
+
+RANK_METHODS = ['ordinal', 'competition', 'dense']
+
+
+def load_columns(cursor, fields, dtypes, batch_size):
+    """Read ``fields`` from ``cursor`` into one NumPy array per field."""
+    chunks = {field: [] for field in fields}
+    batch = {field: [] for field in fields}
+    for count, document in enumerate(cursor, 1):
+        for field in fields:
+            batch[field].append(document[field])
+        if count % batch_size == 0:
+            for field in fields:
+                chunks[field].append(np.array(batch[field], dtype=dtypes[field]))
+                batch[field] = []
+    for field in fields:
+        chunks[field].append(np.array(batch[field], dtype=dtypes[field]))
+    return {field: np.concatenate(chunks[field]) for field in fields}
+
+
+def group_totals(keys, columns):
+    """
+    Sum each column per distinct key. Returns the sorted distinct keys, the
+    number of rows per key and a dict of per-key column sums.
+    """
+    unique, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(unique))
+    totals = {}
+    for name, values in columns.items():
+        summed = np.bincount(inverse, weights=values, minlength=len(unique))
+        totals[name] = np.rint(summed).astype(np.int64) if values.dtype.kind == 'i' else summed
+    return unique, counts, totals
+
+
+def assign_ranks(values, ids, method='ordinal'):
+    """
+    Rank ``values`` highest first, breaking ties by ascending ``ids``.
+
+    ``ordinal`` gives every row its position (the ranks the incremental
+    engine maintains), ``competition`` gives ties the same rank and skips the
+    following ones (1, 2, 2, 4) and ``dense`` does not skip (1, 2, 2, 3).
+    """
+    if not len(values):
+        return np.empty(0, dtype=np.int64)
+    order = np.lexsort((ids, -values))
+    positions = np.arange(1, len(values) + 1)
+    if method == 'ordinal':
+        sorted_ranks = positions
+    else:
+        sorted_values = values[order]
+        starts_group = np.r_[True, sorted_values[1:] != sorted_values[:-1]]
+        if method == 'dense':
+            sorted_ranks = np.cumsum(starts_group)
+        else:
+            sorted_ranks = np.maximum.accumulate(np.where(starts_group, positions, 0))
+    ranks = np.empty(len(values), dtype=np.int64)
+    ranks[order] = sorted_ranks
+    return ranks
+
+
+def check_live_ranking(metric, method):
+    """Raise ValueError unless ``metric`` and ``method`` give the ranks the live board keeps."""
+    if method != 'ordinal' or metric != settings.LEADERBOARD_RANK_METRIC:
+        raise ValueError(
+            f'The live leaderboard is ranked ordinally by {settings.LEADERBOARD_RANK_METRIC} '
+            f'(LEADERBOARD_RANK_METRIC); cannot rebuild it with {method} ranks by {metric}.'
+        )
+
+
+def rebuild(db=None, metric=None, method='ordinal', batch_size=None, secondary=False):
+    """
+    Recompute the whole leaderboard from the activities collection.
+
+    The board is live: the incremental engine and the rank index assume
+    unique ordinal ranks on LEADERBOARD_RANK_METRIC, so any other
+    ``method`` or ``metric`` raises ValueError. With ``secondary`` (and MONGODB_REPLICA_READS on) activities and users
+    are scanned on a secondary; the board is always written to and
+    reconciled on the primary. Returns a dict with the number of entries
+    written and removed.
+    """
+    metric = metric or settings.LEADERBOARD_RANK_METRIC
+    check_live_ranking(metric, method)
+    db = db or get_db(read_only=False)
+    source = db
+    if secondary and settings.MONGODB_REPLICA_READS:
+        source = db.with_options(read_preference=replica_read_preference())
+    batch_size = batch_size or settings.MONGODB_BATCH_SIZE
+
+    fields = ['user_id', 'duration', 'distance', 'calories']
+    dtypes = {'user_id': np.int64, 'duration': np.int64, 'distance': np.float64, 'calories': np.int64}
+    cursor = source[Activity._meta.db_table].find(
+        {}, {field: 1 for field in fields} | {'_id': 0}, batch_size=batch_size
+    )
+    columns = load_columns(cursor, fields, dtypes, batch_size)
+    user_ids, counts, totals = group_totals(columns.pop('user_id'), columns)
+    board = {
+        'total_activities': counts,
+        'total_duration': totals['duration'],
+        'total_distance': np.round(totals['distance'], 2),
+        'total_calories': totals['calories'],
+    }
+    ranks = assign_ranks(board[metric], user_ids, method)
+
+    users = {
+        user['_id']: user
+        for user in source[User._meta.db_table].find({}, {'name': 1, 'team_id': 1}, batch_size=batch_size)
+    }
+    team_ids = np.array([users.get(int(user_id), {}).get('team_id', 0) for user_id in user_ids],
+                        dtype=np.int64)
+
+    collection = db[Leaderboard._meta.db_table]
+    requests = []
+    for index, user_id in enumerate(user_ids.tolist()):
+        user = users.get(user_id, {})
+        requests.append(ReplaceOne({'_id': user_id}, {
+            '_id': user_id,
+            'user_id': user_id,
+            'user_name': user.get('name', f'User {user_id}'),
+            'team_id': int(team_ids[index]),
+            'total_activities': int(board['total_activities'][index]),
+            'total_duration': int(board['total_duration'][index]),
+            'total_distance': float(board['total_distance'][index]),
+            'total_calories': int(board['total_calories'][index]),
+            'rank': int(ranks[index]),
+        }, upsert=True))
+        if len(requests) >= batch_size:
+            collection.bulk_write(requests, ordered=False)
+            requests = []
+    if requests:
+        collection.bulk_write(requests, ordered=False)
+
+    existing = np.array([entry['_id'] for entry in collection.find({}, {'_id': 1})], dtype=np.int64)
+    stale = np.setdiff1d(existing, user_ids).tolist()
+    for start in range(0, len(stale), batch_size):
+        collection.delete_many({'_id': {'$in': stale[start:start + batch_size]}})
+
+    teams = {team['_id']: team['name'] for team in db[Team._meta.db_table].find({}, {'name': 1})}
+    team_keys, member_counts, team_totals = group_totals(team_ids, board)
+    leaderboard.store_team_standings(leaderboard.rank_teams([
+        {
+            'team_id': team_id,
+            'team_name': teams.get(team_id, f'Team {team_id}'),
+            'member_count': int(member_counts[index]),
+            **{
+                field: (round(float(team_totals[field][index]), 2) if field == 'total_distance'
+                        else int(team_totals[field][index]))
+                for field in leaderboard.TOTAL_FIELDS
+            },
+        }
+        for index, team_id in enumerate(team_keys.tolist())
+    ]))
+    drop_local_state()
+    db[MARKERS_COLLECTION].update_one({'_id': MARKER_ID}, {'$inc': {'generation': 1}}, upsert=True)
+    return {'entries': len(user_ids), 'removed': len(stale), 'teams': len(team_keys)}
+
+
+def drop_local_state():
+    """Forget this process's derived leaderboard state so it is re-read from Mongo."""
+    rank_index.index.reset()
+    response_cache.invalidate('leaderboard')
+    leaderboard.invalidate_team_standings()
+
+
+class RebuildWatcher:
+    def __init__(self):
+        self.generation = None
+        self.checked_at = None
+        self._lock = Lock()
+
+    def check(self):
+        """Drop local leaderboard state if a rebuild ran since the last check."""
+        with self._lock:
+            now = monotonic()
+            checked_recently = (self.checked_at is not None
+                                and now - self.checked_at < settings.LEADERBOARD_REBUILD_CHECK_SECONDS)
+            if checked_recently:
+                return
+            self.checked_at = now
+            marker = get_db(read_only=False)[MARKERS_COLLECTION].find_one({'_id': MARKER_ID})
+            generation = marker['generation'] if marker else 0
+            if self.generation is not None and generation != self.generation:
+                drop_local_state()
+            self.generation = generation
+
+
+watcher = RebuildWatcher()
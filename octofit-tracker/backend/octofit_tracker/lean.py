@@ -0,0 +1,174 @@
+"""
+Read-only fast path for list responses.
+
+``compile_serializer`` turns a serializer's field set into one function per
+row that reads plain values straight from documents (or instances) with
+the same conversions DRF's fields apply, skipping the per-field
+``get_attribute``/``to_representation`` machinery. ``LeanJSONRenderer``
+encodes responses with orjson when it is installed. Both produce the same
+output as the regular serializers and JSONRenderer; anything they cannot
+reproduce exactly falls back to the regular path.
+"""
+from datetime import timezone as dt_timezone
+from operator import attrgetter, itemgetter
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import fields as drf_fields
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import ISO_8601, api_settings
+
+from .metrics import phase
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+_compiled = {}
+
+
+def _iso_utc(value):
+    if isinstance(value, str):
+        return value
+    if value.tzinfo is not None:
+        value = value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return value.isoformat() + 'Z'
+
+
+def _choice(field):
+    lookup = field.choice_strings_to_values
+
+    def convert(value):
+        if value in ('', None):
+            return value
+        return lookup.get(str(value), value)
+    return convert
+
+
+def _utc_datetimes():
+    return settings.USE_TZ and timezone.get_current_timezone_name() == 'UTC'
+
+
+def _converter(field):
+    """Return the conversion DRF applies for ``field``, or None if it has none we copy."""
+    kind = type(field)
+    if kind is drf_fields.IntegerField:
+        return int
+    if kind is drf_fields.FloatField:
+        return float
+    if kind in (drf_fields.CharField, drf_fields.EmailField):
+        return str
+    if kind is drf_fields.ChoiceField:
+        return _choice(field)
+    if kind is drf_fields.DateTimeField:
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        if (output_format and output_format.lower() == ISO_8601
+                and not hasattr(field, 'timezone') and _utc_datetimes()):
+            return _iso_utc
+    return None
+
+
+def compile_serializer(serializer):
+    """
+    Return ``to_row(item)`` for the fields of a serializer instance, or None
+    when a field needs the regular serializer (custom sources, nested or
+    method fields, non-ISO datetimes...).
+    """
+    fields = [field for field in serializer.fields.values() if not field.write_only]
+    key = (type(serializer), tuple(field.field_name for field in fields), _utc_datetimes())
+    if key in _compiled:
+        return _compiled[key]
+
+    plan = []
+    for field in fields:
+        converter = _converter(field)
+        if converter is None or field.source != field.field_name:
+            _compiled[key] = None
+            return None
+        plan.append((field.field_name, converter))
+    names = [name for name, _ in plan]
+
+    def to_row(item):
+        get = (itemgetter if isinstance(item, dict) else attrgetter)(*names)
+        values = get(item) if len(names) > 1 else (get(item),)
+        return {
+            name: None if value is None else convert(value)
+            for (name, convert), value in zip(plan, values)
+        }
+
+    _compiled[key] = to_row
+    return to_row
+
+
+def serialize_rows(serializer, items):
+    """Serialize ``items`` like ``serializer`` would with ``many=True``."""
+    items = list(items)  # run the query outside the timed phase
+    with phase('serialize'):
+        to_row = compile_serializer(serializer)
+        if to_row is not None:
+            try:
+                return [to_row(item) for item in items]
+            except (KeyError, AttributeError):
+                pass  # a document without one of the fields: let DRF decide
+        return type(serializer)(items, many=True, context=serializer.context).data
+
+
+class LeanListMixin:
+    """Serve ``list`` through ``serialize_rows`` when LEAN_LIST_RESPONSES is on."""
+
+    def list(self, request, *args, **kwargs):
+        if not settings.LEAN_LIST_RESPONSES:
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = serialize_rows(self.get_serializer(), page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(rows)
+        return Response(rows)
+
+
+def _plain_float(value):
+    # Python writes floats outside this range with an exponent (1e+16,
+    # 1e-05) and DRF rejects NaN and infinities; orjson differs on all three.
+    return value == 0 or 1e-4 <= abs(value) < 1e16
+
+
+def _orjson_safe(data):
+    """True if orjson would encode every float in ``data`` as DRF does."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, float):
+            if not _plain_float(value):
+                return False
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return True
+
+
+class LeanJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when the output would be identical."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with phase('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None
+                or not _orjson_safe(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            # DRF's encoder formats datetimes differently (milliseconds), so
+            # they are left to it along with anything orjson does not know.
+            ret = orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
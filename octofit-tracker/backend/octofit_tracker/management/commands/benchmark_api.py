@@ -0,0 +1,371 @@
+import base64
+import http.client
+import json
+import random
+import socket
+import threading
+from datetime import datetime, timezone
+from statistics import mean, quantiles
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from rest_framework.test import APIClient
+
+from octofit_tracker import ids, leaderboard_rebuild, mongo, synthetic
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.models import Activity, Leaderboard, Team, User, Workout
+from octofit_tracker.native import NativeQuerySet
+from octofit_tracker.management.commands.populate_db import Command as PopulateCommand
+
+# Documents generated and inserted per insert_many while seeding.
+SEED_CHUNK_SIZE = 10000
+
+
+def team_payload(number):
+    return {'name': f'Benchmark team {number}', 'description': 'Benchmark', 'created_at': _now()}
+
+
+def user_payload(number):
+    return {
+        'name': f'Benchmark user {number}', 'email': f'benchmark{number}@octofit.test',
+        'team_id': 1, 'role': 'member', 'created_at': _now(),
+    }
+
+
+def activity_payload(number):
+    return {
+        'user_id': 1, 'type': 'running', 'duration': 30, 'distance': 5.0,
+        'calories': 300, 'date': _now(), 'notes': f'Benchmark activity {number}',
+    }
+
+
+def workout_payload(number):
+    return {
+        'name': f'Benchmark workout {number}', 'type': 'yoga', 'difficulty': 'beginner',
+        'duration': 30, 'description': 'Benchmark', 'exercises': ['breathing'],
+    }
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def scenarios(rng, data):
+    """
+    Return ``(endpoint, scenario, method, path_for(n), payload_for(n))``
+    tuples for the five router endpoints. Retrieves and filters pick
+    seeded random ids so runs with the same seed hit the same documents.
+    """
+    users, teams = data['users'], data['teams']
+
+    def pick(first, count):
+        return lambda number: rng.randint(first, first + count - 1)
+
+    user_id, team_id = pick(1, users), pick(1, teams)
+    activity_id = pick(1, data['activities'])
+    workout_id = pick(1, data['workouts'])
+
+    def board_id(number):
+        return rng.choice(data['leaderboard_ids'])
+
+    return [
+        ('teams', 'list', 'GET', lambda n: '/api/teams/', None),
+        ('teams', 'retrieve', 'GET', lambda n: f'/api/teams/{team_id(n)}/', None),
+        ('teams', 'create', 'POST', lambda n: '/api/teams/', team_payload),
+        ('users', 'list', 'GET', lambda n: '/api/users/', None),
+        ('users', 'retrieve', 'GET', lambda n: f'/api/users/{user_id(n)}/', None),
+        ('users', 'expanded', 'GET', lambda n: '/api/users/?expand=team', None),
+        ('users', 'create', 'POST', lambda n: '/api/users/', user_payload),
+        ('activities', 'list', 'GET', lambda n: '/api/activities/', None),
+        ('activities', 'retrieve', 'GET', lambda n: f'/api/activities/{activity_id(n)}/', None),
+        ('activities', 'filtered', 'GET',
+         lambda n: f'/api/activities/?user_id={user_id(n)}&type=running', None),
+        ('activities', 'filtered_team', 'GET', lambda n: f'/api/activities/?team_id={team_id(n)}', None),
+        ('activities', 'create', 'POST', lambda n: '/api/activities/', activity_payload),
+        ('leaderboard', 'list', 'GET', lambda n: '/api/leaderboard/', None),
+        ('leaderboard', 'retrieve', 'GET', lambda n: f'/api/leaderboard/{board_id(n)}/', None),
+        ('leaderboard', 'filtered', 'GET', lambda n: '/api/leaderboard/?window=30d', None),
+        ('leaderboard', 'top', 'GET', lambda n: '/api/leaderboard/top/?k=10', None),
+        ('workouts', 'list', 'GET', lambda n: '/api/workouts/', None),
+        ('workouts', 'retrieve', 'GET', lambda n: f'/api/workouts/{workout_id(n)}/', None),
+        ('workouts', 'create', 'POST', lambda n: '/api/workouts/', workout_payload),
+    ]
+
+
+class TestClientDriver:
+    name = 'test_client'
+
+    def __init__(self):
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(user=_benchmark_user())
+
+    def can_write(self):
+        return True
+
+    def request(self, method, path, payload):
+        if method == 'GET':
+            response = self.client.get(path, HTTP_ACCEPT='application/json')
+        else:
+            response = self.client.post(path, payload, format='json')
+        return response.status_code, len(response.content)
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def setup(self):
+        super().setup()
+        # Headers and body go out in separate writes; without this the body
+        # waits for the client's delayed ACK on every keep-alive request.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTPDriver:
+    """Serve the WSGI app from a threaded server and call it over keep-alive HTTP."""
+    name = 'http'
+
+    def __init__(self, username=None, password=None):
+        self.server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler, allow_reuse_address=True)
+        self.server.set_app(get_wsgi_application())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.connection = http.client.HTTPConnection('127.0.0.1', self.server.server_port)
+        self.headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+        if username:
+            token = base64.b64encode(f'{username}:{password or ""}'.encode()).decode()
+            self.headers['Authorization'] = f'Basic {token}'
+
+    def can_write(self):
+        return 'Authorization' in self.headers
+
+    def request(self, method, path, payload):
+        body = json.dumps(payload) if payload is not None else None
+        self.connection.request(method, path, body=body, headers=self.headers)
+        response = self.connection.getresponse()
+        return response.status, len(response.read())
+
+    def close(self):
+        self.connection.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _benchmark_user():
+    from django.contrib.auth import get_user_model
+    return get_user_model()(username='benchmark')
+
+
+def summarize(latencies, errors, elapsed, sizes):
+    if len(latencies) < 2:
+        return {'requests': len(latencies), 'errors': errors}
+    cuts = quantiles(latencies, n=100)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(mean(latencies), 3),
+        'p50_ms': round(cuts[49], 3),
+        'p95_ms': round(cuts[94], 3),
+        'p99_ms': round(cuts[98], 3),
+        'mean_bytes': round(mean(sizes)),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a benchmark database and time list, retrieve, create and filtered '
+        'requests on every API endpoint through the Django test client and a real '
+        'HTTP server, writing throughput and latency percentiles to JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--teams', type=int, default=10)
+        parser.add_argument('--activities', type=int, default=20000, help='Total activities')
+        parser.add_argument('--days', type=int, default=365, help='Spread activities over this many days')
+        parser.add_argument('--iterations', type=int, default=200, help='Timed requests per scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--database', default='octofit_benchmark',
+            help='Database seeded and dropped on the configured mongod (default octofit_benchmark)',
+        )
+        parser.add_argument(
+            '--mongomock', action='store_true',
+            help='Run against an in-memory mongomock client instead of mongod; it has no '
+                 'indexes, so only compare mongomock runs with each other',
+        )
+        parser.add_argument(
+            '--clients', nargs='+', choices=['test_client', 'http'], default=['test_client', 'http'],
+        )
+        parser.add_argument(
+            '--only', nargs='+', metavar='ENDPOINT',
+            help='Benchmark only these endpoints (teams, users, activities, leaderboard, workouts)',
+        )
+        parser.add_argument('--username', help='Basic auth user for creates over HTTP')
+        parser.add_argument('--password', help='Basic auth password for creates over HTTP')
+        parser.add_argument('--keep', action='store_true', help='Do not drop the benchmark database')
+        parser.add_argument(
+            '--output', help='JSON results file (default benchmark-<UTC timestamp>.json)',
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['teams'] < 1 or options['activities'] < 1:
+            raise CommandError('--users, --teams and --activities must be at least 1.')
+        if options['iterations'] < 2:
+            raise CommandError('--iterations must be at least 2.')
+        started = datetime.now(timezone.utc)
+        self.use_database(options)
+        try:
+            data = self.seed(options)
+            results = self.run_scenarios(data, options)
+        finally:
+            if not options['keep'] and not options['mongomock']:
+                mongo.get_client().drop_database(options['database'])
+
+        report = {
+            'started_at': started.isoformat(),
+            'backend': 'mongomock' if options['mongomock'] else 'mongod',
+            'dataset': {key: data[key] for key in ('users', 'teams', 'activities', 'workouts')},
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'settings': {
+                name: getattr(settings, name)
+                for name in ('NATIVE_READS', 'LEAN_LIST_RESPONSES', 'MONGODB_MAX_POOL_SIZE')
+            },
+            'results': results,
+        }
+        output = options['output'] or f'benchmark-{started:%Y%m%dT%H%M%SZ}.json'
+        with open(output, 'w') as stream:
+            json.dump(report, stream, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {output}'))
+
+    def use_database(self, options):
+        """Point the ORM and octofit_tracker.mongo at the benchmark database."""
+        name = options['database']
+        if options['mongomock']:
+            try:
+                import mongomock
+            except ImportError:
+                raise CommandError('--mongomock needs the mongomock package installed.')
+            # The ORM and native reads both use the shared client.
+            mongo._client = mongomock.MongoClient()
+        elif name == settings.MONGODB_DB_NAME:
+            raise CommandError(f'Refusing to seed and drop the application database {name!r}.')
+        connections['default'].close()
+        settings.DATABASES['default']['NAME'] = name
+        connections['default'].settings_dict['NAME'] = name
+
+    def seed(self, options):
+        db = mongo.get_db()
+        for model in (Team, User, Activity, Workout, Leaderboard):
+            db[model._meta.db_table].delete_many({})
+        db[ids.COUNTERS_COLLECTION].delete_many({})
+        if not options['mongomock']:
+            ensure_indexes(db)
+
+        users, teams, activities = options['users'], options['teams'], options['activities']
+        per_user = -(-activities // users)
+        end_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        start = perf_counter()
+        db.teams.insert_many(synthetic.generate_teams(1, teams, end_date))
+        for first in range(1, users + 1, SEED_CHUNK_SIZE):
+            count = min(SEED_CHUNK_SIZE, users + 1 - first)
+            db.users.insert_many(synthetic.generate_users(first, count, 1, teams, end_date))
+        users_per_chunk = max(1, SEED_CHUNK_SIZE // per_user)
+        inserted = 0
+        for first in range(1, users + 1, users_per_chunk):
+            count = min(users_per_chunk, users + 1 - first)
+            documents = synthetic.generate_activities(
+                options['seed'], first, count, per_user, inserted + 1, end_date, options['days']
+            )[:activities - inserted]
+            if not documents:
+                break
+            db.activities.insert_many(documents)
+            inserted += len(documents)
+        workouts = PopulateCommand().populate_workouts(db)
+        ids.sync_counters(db, [Team, User, Activity, Workout])
+
+        call_command('rebuild_rollups', stdout=self.stdout)
+        leaderboard_rebuild.rebuild()
+        leaderboard_ids = [document['_id'] for document in NativeQuerySet(Leaderboard).only('_id')]
+        self.stdout.write(
+            f'Seeded {teams:,} teams, {users:,} users and {inserted:,} activities '
+            f'in {perf_counter() - start:.1f}s'
+        )
+        return {
+            'users': users, 'teams': teams, 'activities': inserted, 'workouts': workouts,
+            'leaderboard_ids': leaderboard_ids,
+        }
+
+    def drivers(self, options):
+        for name in options['clients']:
+            if name == 'http':
+                yield HTTPDriver(options['username'], options['password'])
+            else:
+                yield TestClientDriver()
+
+    def run_scenarios(self, data, options):
+        results = []
+        self.stdout.write(
+            f'{"client":<13}{"endpoint":<13}{"scenario":<15}{"req/s":>9}'
+            f'{"p50":>10}{"p95":>10}{"p99":>10}{"errors":>8}'
+        )
+        for driver in self.drivers(options):
+            try:
+                rng = random.Random(options['seed'])
+                for endpoint, scenario, method, path_for, payload_for in scenarios(rng, data):
+                    if options['only'] and endpoint not in options['only']:
+                        continue
+                    if method != 'GET' and not driver.can_write():
+                        self.stdout.write(
+                            f'{driver.name:<13}{endpoint:<13}{scenario:<15}'
+                            '  skipped: needs --username/--password'
+                        )
+                        continue
+                    result = self.measure(driver, method, path_for, payload_for, options['iterations'])
+                    results.append({
+                        'client': driver.name, 'endpoint': endpoint, 'scenario': scenario, **result,
+                    })
+                    self.report(driver.name, endpoint, scenario, result)
+            finally:
+                driver.close()
+        return results
+
+    def measure(self, driver, method, path_for, payload_for, iterations):
+        driver.request(method, path_for(0), payload_for(0) if payload_for else None)  # warm up
+        latencies, sizes, errors = [], [], 0
+        begin = perf_counter()
+        for number in range(1, iterations + 1):
+            path = path_for(number)
+            payload = payload_for(number) if payload_for else None
+            start = perf_counter()
+            status, size = driver.request(method, path, payload)
+            elapsed = (perf_counter() - start) * 1000
+            if status >= 400:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            sizes.append(size)
+        return summarize(latencies, errors, perf_counter() - begin, sizes)
+
+    def report(self, client, endpoint, scenario, result):
+        if 'p50_ms' not in result:
+            self.stdout.write(
+                f'{client:<13}{endpoint:<13}{scenario:<15}'
+                f'  too few successful responses ({result["errors"]} errors)'
+            )
+            return
+        self.stdout.write(
+            f'{client:<13}{endpoint:<13}{scenario:<15}{result["throughput"]:>9.0f}'
+            f'{result["p50_ms"]:>8.2f}ms{result["p95_ms"]:>8.2f}ms{result["p99_ms"]:>8.2f}ms'
+            f'{result["errors"]:>8}'
+        )
@@ -0,0 +1,67 @@
+from statistics import mean, median
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.models import Activity, Leaderboard, User
+from octofit_tracker.native import NativeQuerySet
+from octofit_tracker.serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer
+
+TARGETS = [
+    (Activity, ActivitySerializer, ('-date', '-_id')),
+    (Leaderboard, LeaderboardSerializer, ('rank',)),
+    (User, UserSerializer, ('_id',)),
+]
+
+
+class Command(BaseCommand):
+    help = 'Compare list/retrieve latency of the djongo ORM and native pymongo read paths'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=50)
+
+    def measure(self, func, iterations):
+        func()  # warm up connections and caches
+        timings = []
+        for _ in range(iterations):
+            start = perf_counter()
+            func()
+            timings.append((perf_counter() - start) * 1000)
+        return timings
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        page_size = options['page_size']
+
+        self.stdout.write(
+            f'{"endpoint":<24}{"orm p50":>10}{"native p50":>12}{"orm mean":>10}'
+            f'{"native mean":>13}{"speedup":>9}'
+        )
+        for model, serializer_class, ordering in TARGETS:
+            first = NativeQuerySet(model).order_by(*ordering).only('_id')[:1]
+            if not first.exists():
+                raise CommandError(f'No {model.__name__} documents to benchmark; run populate_db first.')
+            pk = first[0]['_id']
+
+            results = {}
+            for path, queryset in (('orm', model.objects.all()), ('native', NativeQuerySet(model))):
+                results[('list', path)] = self.measure(
+                    lambda: serializer_class(
+                        list(queryset.order_by(*ordering)[:page_size]), many=True
+                    ).data,
+                    iterations,
+                )
+                results[('retrieve', path)] = self.measure(
+                    lambda: serializer_class(queryset.get(pk=pk)).data,
+                    iterations,
+                )
+
+            for action in ('list', 'retrieve'):
+                orm, native = results[(action, 'orm')], results[(action, 'native')]
+                self.stdout.write(
+                    f'{model._meta.db_table + " " + action:<24}'
+                    f'{median(orm):>8.2f}ms{median(native):>10.2f}ms'
+                    f'{mean(orm):>8.2f}ms{mean(native):>11.2f}ms'
+                    f'{median(orm) / median(native):>8.1f}x'
+                )
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker.indexes import ensure_indexes, find_unindexed_scans
+from octofit_tracker.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Create the Mongo indexes declared on the octofit models'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--report-scans',
+            action='store_true',
+            help='List profiled collection scans that no index covers '
+                 '(requires database profiling to be enabled)',
+        )
+
+    def handle(self, *args, **options):
+        db = get_db()
+
+        created, failed = ensure_indexes(db)
+        for collection, names in created.items():
+            self.stdout.write(self.style.SUCCESS(f'{collection}: {", ".join(names)}'))
+        for collection, error in failed.items():
+            self.stderr.write(self.style.ERROR(f'{collection}: {error}'))
+
+        if options['report_scans']:
+            if db.command('profile', -1)['was'] == 0:
+                self.stdout.write(self.style.WARNING(
+                    'Profiling is off; enable it with db.setProfilingLevel(1) to record scans.'
+                ))
+            scans = find_unindexed_scans(db)
+            if not scans:
+                self.stdout.write('No unindexed collection scans recorded.')
+            for (collection, fields), count in scans.most_common():
+                self.stdout.write(f'  {collection} filtered on {", ".join(fields)}: {count} scans')
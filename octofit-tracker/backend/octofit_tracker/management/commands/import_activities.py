@@ -0,0 +1,170 @@
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from pymongo import ReplaceOne
+
+from octofit_tracker import ids, importers, leaderboard_rebuild, recommendations
+from octofit_tracker.management.commands.populate_db import positive_int
+from octofit_tracker.models import Activity
+from octofit_tracker.mongo import get_collection
+
+# Validation errors printed before the rest are only counted.
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Import historical activities from a CSV, NDJSON or GPX file with parallel '
+        'validation, ordered upserts on _id and a resumable checkpoint'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file')
+        parser.add_argument(
+            '--format', choices=sorted(set(importers.FORMATS.values())),
+            help='File format (default: from the file extension)',
+        )
+        parser.add_argument(
+            '--chunk-size', type=positive_int, default=settings.ACTIVITY_BULK_CHUNK_SIZE,
+            help='Records validated and upserted per chunk',
+        )
+        parser.add_argument('--workers', type=positive_int, default=os.cpu_count() or 1)
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <file>.checkpoint)')
+        parser.add_argument(
+            '--restart', action='store_true', help='Ignore an existing checkpoint and start over',
+        )
+        parser.add_argument('--user-id', type=int, help='Owner of the imported GPX tracks')
+        parser.add_argument(
+            '--skip-refresh', action='store_true',
+            help='Do not refresh the rollups, leaderboard and recommendations afterwards',
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options['file'])
+        if not path.is_file():
+            raise CommandError(f'{path} does not exist.')
+        file_format = options['format'] or importers.FORMATS.get(path.suffix.lower())
+        if file_format is None:
+            raise CommandError(f'Cannot tell the format of {path.name}; pass --format.')
+        checkpoint_path = Path(options['checkpoint'] or f'{path}.checkpoint')
+
+        stat = path.stat()
+        source = {'file': str(path.resolve()), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        state = self.load_checkpoint(checkpoint_path, source, options['restart'])
+        if file_format == 'gpx' and options['user_id'] is None:
+            raise CommandError('GPX imports need --user-id.')
+        worker_options = {'user_id': options['user_id']}
+        if file_format == 'csv':
+            worker_options['csv_fields'] = importers.csv_header(path)
+
+        if state['records']:
+            self.stdout.write(f"Resuming after record {state['records']:,}")
+        records = islice(enumerate(importers.READERS[file_format](path), 1), state['records'], None)
+        chunks = iter(lambda: list(islice(records, options['chunk_size'])), [])
+
+        collection = get_collection(Activity)
+        workers = options['workers']
+        self.user_ids = set()
+        start = perf_counter()
+        with ProcessPoolExecutor(max_workers=workers, initializer=importers.init_worker) as executor:
+            # Chunks are validated in parallel but written in file order, so
+            # the checkpoint always marks a prefix of the file as imported.
+            pending = deque()
+            for chunk in chunks:
+                pending.append((chunk[-1][0], executor.submit(
+                    importers.validate_chunk, file_format, chunk, worker_options
+                )))
+                if len(pending) >= workers * 2:
+                    self.write_chunk(collection, state, *pending.popleft(), checkpoint_path, start)
+            while pending:
+                self.write_chunk(collection, state, *pending.popleft(), checkpoint_path, start)
+        self.stdout.write('')
+
+        if not options['skip_refresh'] and state['imported']:
+            self.stdout.write('Refreshing rollups, leaderboard and recommendations...')
+            call_command('rebuild_rollups', stdout=self.stdout)
+            leaderboard_rebuild.rebuild()
+            # Users imported by an earlier, interrupted run are not known
+            # here; their lists follow the import when the day changes.
+            recommendations.forget(self.user_ids)
+        checkpoint_path.unlink(missing_ok=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {state['imported']:,} activities from {state['records']:,} records "
+            f"({state['rejected']:,} rejected) in {perf_counter() - start:.1f}s"
+        ))
+
+    def load_checkpoint(self, checkpoint_path, source, restart):
+        fresh = {**source, 'records': 0, 'imported': 0, 'rejected': 0}
+        if restart or not checkpoint_path.exists():
+            return fresh
+        state = json.loads(checkpoint_path.read_text())
+        if {key: state.get(key) for key in source} != source:
+            raise CommandError(
+                f'{checkpoint_path} belongs to a different or modified file; pass --restart.'
+            )
+        return state
+
+    def save_checkpoint(self, checkpoint_path, state):
+        temporary = checkpoint_path.with_name(checkpoint_path.name + '.tmp')
+        temporary.write_text(json.dumps(state))
+        os.replace(temporary, checkpoint_path)
+
+    def assign_ids(self, documents, state, last_record, checkpoint_path):
+        """
+        Number the documents that came without an ``_id`` from a range
+        reserved on the counter. The range is checkpointed before the write,
+        so replaying the chunk after a crash reuses the same ids instead of
+        duplicating the activities.
+        """
+        explicit = [document['_id'] for document in documents if '_id' in document]
+        missing = [document for document in documents if '_id' not in document]
+        # Raise the counter past this chunk's explicit ids before reserving.
+        if explicit:
+            ids.observe(Activity, max(explicit))
+        if missing:
+            pending = state.get('pending')
+            if pending is None or pending['records'] != last_record or pending['count'] != len(missing):
+                pending = {
+                    'records': last_record,
+                    'count': len(missing),
+                    'first_id': ids.reserve_range(Activity, len(missing)),
+                }
+                state['pending'] = pending
+                self.save_checkpoint(checkpoint_path, state)
+            for offset, document in enumerate(missing):
+                document['_id'] = pending['first_id'] + offset
+
+    def write_chunk(self, collection, state, last_record, future, checkpoint_path, start):
+        documents, errors = future.result()
+        self.assign_ids(documents, state, last_record, checkpoint_path)
+        self.user_ids.update(document['user_id'] for document in documents)
+        if documents:
+            collection.bulk_write(
+                [ReplaceOne({'_id': document['_id']}, document, upsert=True) for document in documents],
+                ordered=True,
+            )
+        for error in errors:
+            if state['rejected'] < MAX_REPORTED_ERRORS:
+                self.stderr.write(f"\nRecord {error['record']}: {json.dumps(error['errors'])}")
+            state['rejected'] += 1
+        state['imported'] += len(documents)
+        state['records'] = last_record
+        state.pop('pending', None)
+        self.save_checkpoint(checkpoint_path, state)
+
+        rate = state['imported'] / max(perf_counter() - start, 1e-9)
+        self.stdout.write(
+            f"\r  {state['records']:,} records, {state['imported']:,} imported ({rate:,.0f} docs/s)",
+            ending='',
+        )
+        self.stdout.flush()
+
@@ -0,0 +1,116 @@
+import asyncio
+from statistics import quantiles
+from time import perf_counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+async def read_response(reader):
+    """Read one HTTP/1.1 response and return its status code."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, chunked = None, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        name = name.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding' and 'chunked' in value.lower():
+            chunked = True
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        raise ConnectionError('response without length')
+    return status
+
+
+async def client(url, deadline, latencies, errors):
+    parts = urlsplit(url)
+    target = parts.path + (f'?{parts.query}' if parts.query else '')
+    request = (
+        f'GET {target or "/"} HTTP/1.1\r\nHost: {parts.netloc}\r\n'
+        f'Accept: application/json\r\nConnection: keep-alive\r\n\r\n'
+    ).encode()
+    writer = None
+    while perf_counter() < deadline:
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+            start = perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await read_response(reader)
+            if status == 200:
+                latencies.append((perf_counter() - start) * 1000)
+            else:
+                errors.append(status)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as exc:
+            errors.append(type(exc).__name__)
+            if writer is not None:
+                writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def run(url, concurrency, duration):
+    latencies, errors = [], []
+    deadline = perf_counter() + duration
+    await asyncio.gather(*(client(url, deadline, latencies, errors) for _ in range(concurrency)))
+    return latencies, errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test API endpoints with many concurrent keep-alive clients and report '
+        'requests/second and latency percentiles, e.g. a WSGI deployment '
+        '(gunicorn octofit_tracker.wsgi) against an ASGI one '
+        '(uvicorn octofit_tracker.asgi:application) serving /api/async/'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets', nargs='+', metavar='NAME=URL',
+            help='Endpoints to compare, e.g. wsgi=http://localhost:8000/api/activities/'
+        )
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[100, 250, 500, 1000])
+        parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['targets']:
+            name, sep, url = target.partition('=')
+            if not sep or not url.startswith('http://'):
+                raise CommandError(f'Expected NAME=http://host:port/path, got {target!r}.')
+            targets.append((name, url))
+
+        self.stdout.write(
+            f'{"target":<12}{"clients":>8}{"requests":>10}{"errors":>8}{"req/s":>10}'
+            f'{"p50":>10}{"p95":>10}{"p99":>10}'
+        )
+        for concurrency in options['concurrency']:
+            for name, url in targets:
+                latencies, errors = asyncio.run(run(url, concurrency, options['duration']))
+                if len(latencies) < 2:
+                    self.stdout.write(f'{name:<12}{concurrency:>8}{len(latencies):>10}{len(errors):>8}'
+                                      '  too few successful responses')
+                    continue
+                cuts = quantiles(latencies, n=100)
+                self.stdout.write(
+                    f'{name:<12}{concurrency:>8}{len(latencies):>10}{len(errors):>8}'
+                    f'{len(latencies) / options["duration"]:>10.0f}'
+                    f'{cuts[49]:>8.1f}ms{cuts[94]:>8.1f}ms{cuts[98]:>8.1f}ms'
+                )
@@ -1,31 +1,100 @@
-from django.core.management.base import BaseCommand
-from pymongo import MongoClient
-from datetime import datetime, timedelta
+from argparse import ArgumentTypeError
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from datetime import datetime, timedelta, timezone
+from time import perf_counter
 import random
 
+from octofit_tracker import ids, leaderboard_rebuild, synthetic
+from octofit_tracker.mongo import get_db
+from octofit_tracker.indexes import ensure_indexes
+from octofit_tracker.models import Activity, Team, User, Workout
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise ArgumentTypeError(f'must be a positive integer, got {value}')
+    return number
+
 
 class Command(BaseCommand):
-    help = 'Populate the octofit_db database with test data'
+    help = 'Populate the configured database with test data'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=positive_int,
+            help='Generate this many synthetic users instead of the sample heroes',
+        )
+        parser.add_argument('--teams', type=positive_int, default=10, help='Synthetic teams (default 10)')
+        parser.add_argument(
+            '--activities-per-user', type=positive_int, default=20,
+            help='Synthetic activities per user (default 20)',
+        )
+        parser.add_argument('--days', type=positive_int, default=365, help='Spread activities over this many days')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for reproducible datasets')
+        parser.add_argument(
+            '--chunk-size', type=positive_int, default=10000,
+            help='Documents generated and inserted per chunk',
+        )
+        parser.add_argument('--workers', type=positive_int, default=4, help='Parallel generator processes')
+        parser.add_argument(
+            '--skip-rollups', action='store_true',
+            help='Do not rebuild the activity rollups afterwards',
+        )
+        parser.add_argument(
+            '--append', action='store_true',
+            help='Add synthetic data after the existing documents instead of clearing first',
+        )
+
+    def handle(self, *args, **options):
+        if options['append'] and not options['users']:
+            raise CommandError('--append only applies to synthetic data (--users N).')
+
+        # Connect to MongoDB through the shared client (MONGODB_URI and the
+        # MONGODB_* pool settings)
+        db = get_db()
 
-    def handle(self, *args, **kwargs):
-        # Connect to MongoDB
-        client = MongoClient('localhost', 27017)
-        db = client['octofit_db']
+        self.stdout.write(self.style.SUCCESS(f'Connected to {db.name}'))
 
-        self.stdout.write(self.style.SUCCESS('Connected to octofit_db'))
+        if not options['append']:
+            # Clear existing data
+            self.stdout.write('Clearing existing data...')
+            db.users.delete_many({})
+            db.teams.delete_many({})
+            db.activities.delete_many({})
+            db.leaderboard.delete_many({})
+            db.workouts.delete_many({})
+            db.activity_rollups.delete_many({})
+            db[ids.COUNTERS_COLLECTION].delete_many({})
 
-        # Clear existing data
-        self.stdout.write('Clearing existing data...')
-        db.users.delete_many({})
-        db.teams.delete_many({})
-        db.activities.delete_many({})
-        db.leaderboard.delete_many({})
-        db.workouts.delete_many({})
+        # Create the indexes declared on the models (including unique email)
+        created, failed = ensure_indexes(db)
+        for collection, names in created.items():
+            self.stdout.write(self.style.SUCCESS(f'Indexes on {collection}: {", ".join(names)}'))
+        for collection, error in failed.items():
+            self.stderr.write(self.style.ERROR(f'{collection}: {error}'))
 
-        # Create unique index on email field
-        db.users.create_index('email', unique=True)
-        self.stdout.write(self.style.SUCCESS('Created unique index on email field'))
+        if options['users']:
+            counts = self.populate_synthetic(db, options)
+        else:
+            counts = self.populate_sample(db)
+        if not options['append']:
+            counts['Workouts'] = self.populate_workouts(db)
 
+        # Start the id counters after the documents inserted with explicit ids
+        ids.sync_counters(db, [Team, User, Activity, Workout])
+
+        if not options['skip_rollups']:
+            call_command('rebuild_rollups', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS('Database population completed successfully!'))
+        self.stdout.write(self.style.SUCCESS(f'Summary:'))
+        for label, count in counts.items():
+            self.stdout.write(f'  - {label}: {count}')
+
+    def populate_sample(self, db):
         # Insert Teams
         teams_data = [
             {
@@ -185,6 +254,14 @@ class Command(BaseCommand):
         db.leaderboard.insert_many(leaderboard_data)
         self.stdout.write(self.style.SUCCESS(f'Inserted {len(leaderboard_data)} leaderboard entries'))
 
+        return {
+            'Teams': len(teams_data),
+            'Users': len(users_data),
+            'Activities': len(activities_data),
+            'Leaderboard entries': len(leaderboard_data),
+        }
+
+    def populate_workouts(self, db):
         # Insert Workouts (Personalized workout suggestions)
         workouts_data = [
             {
@@ -281,13 +358,84 @@ class Command(BaseCommand):
         db.workouts.insert_many(workouts_data)
         self.stdout.write(self.style.SUCCESS(f'Inserted {len(workouts_data)} workouts'))
 
-        # Close connection
-        client.close()
+        return len(workouts_data)
 
-        self.stdout.write(self.style.SUCCESS('Database population completed successfully!'))
-        self.stdout.write(self.style.SUCCESS(f'Summary:'))
-        self.stdout.write(f'  - Teams: {len(teams_data)}')
-        self.stdout.write(f'  - Users: {len(users_data)}')
-        self.stdout.write(f'  - Activities: {len(activities_data)}')
-        self.stdout.write(f'  - Leaderboard entries: {len(leaderboard_data)}')
-        self.stdout.write(f'  - Workouts: {len(workouts_data)}')
+    def _next_id(self, db, collection):
+        # Past both the stored documents and any id block already handed out.
+        last = db[collection].find_one({}, {'_id': 1}, sort=[('_id', -1)])
+        counter = db[ids.COUNTERS_COLLECTION].find_one({'_id': collection}) or {}
+        return max(last['_id'] if last else 0, counter.get('seq', 0)) + 1
+
+    def _run_chunks(self, executor, collection, tasks, total, workers):
+        """Submit generator chunks with a bounded queue and report throughput."""
+        done = 0
+        start = perf_counter()
+        pending = set()
+
+        def collect(finished):
+            nonlocal done
+            for future in finished:
+                done += future.result()
+            rate = done / max(perf_counter() - start, 1e-9)
+            self.stdout.write(f'\r  {collection}: {done:,}/{total:,} ({rate:,.0f} docs/s)', ending='')
+            self.stdout.flush()
+
+        for args in tasks:
+            pending.add(executor.submit(synthetic.insert_chunk, collection, args))
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        if pending:
+            finished, _ = wait(pending)
+            collect(finished)
+        self.stdout.write('')
+        return done
+
+    def populate_synthetic(self, db, options):
+        users, teams = options['users'], options['teams']
+        per_user, chunk_size = options['activities_per_user'], options['chunk_size']
+        workers, seed, days = options['workers'], options['seed'], options['days']
+        # Anchor dates to today's midnight so a seed reproduces the same data
+        # throughout the day.
+        end_date = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+        first_team_id = self._next_id(db, 'teams')
+        first_user_id = self._next_id(db, 'users')
+        first_activity_id = self._next_id(db, 'activities')
+        users_per_chunk = max(1, chunk_size // max(per_user, 1))
+
+        team_tasks = [
+            (start, min(chunk_size, first_team_id + teams - start), end_date)
+            for start in range(first_team_id, first_team_id + teams, chunk_size)
+        ]
+        user_tasks = (
+            (start, min(chunk_size, first_user_id + users - start), first_team_id, teams, end_date)
+            for start in range(first_user_id, first_user_id + users, chunk_size)
+        )
+        activity_tasks = (
+            (
+                seed, start, min(users_per_chunk, first_user_id + users - start), per_user,
+                first_activity_id + (start - first_user_id) * per_user, end_date, days,
+            )
+            for start in range(first_user_id, first_user_id + users, users_per_chunk)
+        )
+
+        self.stdout.write(
+            f'Generating {teams:,} teams, {users:,} users and {users * per_user:,} activities '
+            f'with {workers} workers (seed {seed})'
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=synthetic.init_worker,
+        ) as executor:
+            counts = {
+                'Teams': self._run_chunks(executor, 'teams', team_tasks, teams, workers),
+                'Users': self._run_chunks(executor, 'users', user_tasks, users, workers),
+                'Activities': self._run_chunks(
+                    executor, 'activities', activity_tasks, users * per_user, workers
+                ),
+            }
+
+        self.stdout.write('Building leaderboard...')
+        counts['Leaderboard entries'] = leaderboard_rebuild.rebuild(db, batch_size=chunk_size)['entries']
+        return counts
@@ -0,0 +1,48 @@
+from time import perf_counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from octofit_tracker.leaderboard_rebuild import METRICS, RANK_METHODS, check_live_ranking, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the whole leaderboard from the activities collection'
+
+    def add_arguments(self, parser):
+        default_metric = next(
+            (name for name, field in METRICS.items() if field == settings.LEADERBOARD_RANK_METRIC),
+            'calories',
+        )
+        parser.add_argument(
+            '--metric', choices=list(METRICS), default=default_metric,
+            help=f'Total to rank by; must match LEADERBOARD_RANK_METRIC (default {default_metric})',
+        )
+        parser.add_argument(
+            '--method', choices=RANK_METHODS, default='ordinal',
+            help='How ties are ranked; only ordinal keeps the unique ranks the '
+                 'incremental updates maintain, so others are refused (default ordinal)',
+        )
+        parser.add_argument('--batch-size', type=int, help='Documents read and written per batch')
+        parser.add_argument(
+            '--secondary', action='store_true',
+            help='Scan activities and users on a secondary when MONGODB_REPLICA_READS is on',
+        )
+
+    def handle(self, *args, **options):
+        metric = METRICS[options['metric']]
+        try:
+            check_live_ranking(metric, options['method'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        start = perf_counter()
+        result = rebuild(
+            metric=metric,
+            method=options['method'],
+            batch_size=options['batch_size'],
+            secondary=options['secondary'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {result['entries']} leaderboard entries for {result['teams']} teams, "
+            f"removed {result['removed']} stale entries in {perf_counter() - start:.2f}s"
+        ))
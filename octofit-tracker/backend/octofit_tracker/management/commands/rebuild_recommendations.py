@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import recommendations
+
+
+class Command(BaseCommand):
+    help = ("Precompute every user's recommended workouts into the response cache; "
+            'only useful when it is shared (RESPONSE_CACHE_REDIS_URL)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Users scored per batch')
+
+    def handle(self, *args, **options):
+        count = recommendations.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Cached recommendations for {count} users'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from octofit_tracker import rollups
+from octofit_tracker.models import Activity
+from octofit_tracker.native import NativeQuerySet
+
+
+class Command(BaseCommand):
+    help = 'Recompute the activity rollups from the activities collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--secondary', action='store_true',
+            help='Scan activities on a secondary when MONGODB_REPLICA_READS is on',
+        )
+
+    def handle(self, *args, **options):
+        activities = NativeQuerySet(Activity, read_only=options['secondary']).only(
+            'user_id', 'type', 'duration', 'distance', 'calories', 'date'
+        ).order_by()
+        count = rollups.rebuild(activities)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollups'))
@@ -0,0 +1,294 @@
+"""
+Per-route request metrics, exposed at ``/metrics`` in the Prometheus text
+format.
+
+``InstrumentationMiddleware`` times every request and attributes to it:
+
+- the Mongo commands it ran, from pymongo command monitoring (this covers
+  djongo's client as well as ``octofit_tracker.mongo``),
+- the time spent in ORM queries, i.e. djongo's SQL translation plus its
+  round trips, through a database execute wrapper,
+- the ``serialize`` and ``render`` phases timed with ``phase()``,
+- the response size.
+
+The pool gauges from ``mongo.pool_stats`` are exported alongside. Metrics
+are kept per process; scrape every worker. Requests slower than
+SLOW_REQUEST_SECONDS are logged to ``octofit_tracker.slow`` with the same
+breakdown.
+"""
+import logging
+from asyncio import iscoroutinefunction
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from pymongo import monitoring
+
+from .mongo import pool_stats
+
+logger = logging.getLogger('octofit_tracker.slow')
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the response size histogram buckets, in bytes.
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('octofit_request_stats', default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.commands = {}  # command name -> [count, seconds]
+        self.phases = {}  # phase -> seconds
+
+    def add_command(self, name, seconds):
+        entry = self.commands.setdefault(name, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def add_phase(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+
+@contextmanager
+def phase(name):
+    """Attribute the time spent in the block to ``name`` on the current request."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        stats.add_phase(name, perf_counter() - start)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        self.latency = {}  # (method, route) -> Histogram
+        self.sizes = {}  # (method, route) -> Histogram
+        self.commands = {}  # (method, route, command) -> [count, seconds]
+        self.phases = {}  # (method, route, phase) -> seconds
+
+    def record(self, method, route, seconds, size, stats):
+        labels = (method, route)
+        with self._lock:
+            self.latency.setdefault(labels, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            if size is not None:
+                self.sizes.setdefault(labels, Histogram(SIZE_BUCKETS)).observe(size)
+            for name, (count, command_seconds) in stats.commands.items():
+                entry = self.commands.setdefault((*labels, name), [0, 0.0])
+                entry[0] += count
+                entry[1] += command_seconds
+            for name, phase_seconds in stats.phases.items():
+                key = (*labels, name)
+                self.phases[key] = self.phases.get(key, 0.0) + phase_seconds
+
+    def exposition(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            _histogram(lines, 'octofit_request_duration_seconds', 'Request latency by route.',
+                       self.latency)
+            _histogram(lines, 'octofit_response_size_bytes', 'Response body size by route.',
+                       self.sizes)
+            _counter(lines, 'octofit_mongo_commands_total', 'Mongo commands run by route.',
+                     ('method', 'route', 'command'),
+                     {key: count for key, (count, _) in self.commands.items()})
+            _counter(lines, 'octofit_mongo_command_seconds_total', 'Time spent in Mongo commands by route.',
+                     ('method', 'route', 'command'),
+                     {key: seconds for key, (_, seconds) in self.commands.items()})
+            _counter(lines, 'octofit_phase_seconds_total',
+                     'Time spent in ORM queries, serialization and rendering by route.',
+                     ('method', 'route', 'phase'), self.phases)
+        _pool_metrics(lines, pool_stats.snapshot())
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram(lines, name, help_text, histograms):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+    for labels, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip((*histogram.buckets, '+Inf'), histogram.counts):
+            cumulative += count
+            label_text = _labels(('method', 'route'), labels, le=bound)
+            lines.append(f'{name}_bucket{label_text} {cumulative}')
+        label_text = _labels(('method', 'route'), labels)
+        lines.append(f'{name}_sum{label_text} {_number(histogram.sum)}')
+        lines.append(f'{name}_count{label_text} {cumulative}')
+
+
+def _counter(lines, name, help_text, label_names, values):
+    lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+    for labels, value in sorted(values.items()):
+        lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+
+
+# Gauges and counters exported for each connection pool in mongo.pool_stats.
+POOL_METRICS = [
+    ('octofit_mongo_pool_max_size', 'gauge', 'max_size', 'Configured maximum pool size.'),
+    ('octofit_mongo_pool_connections', 'gauge', 'open', 'Open connections.'),
+    ('octofit_mongo_pool_in_use', 'gauge', 'in_use', 'Connections checked out.'),
+    ('octofit_mongo_pool_waiting', 'gauge', 'waiting', 'Threads waiting for a connection.'),
+    ('octofit_mongo_pool_checkouts_total', 'counter', 'checkouts', 'Successful checkouts.'),
+    ('octofit_mongo_pool_wait_seconds_total', 'counter', 'wait_seconds',
+     'Time spent waiting for a connection.'),
+    ('octofit_mongo_pool_cleared_total', 'counter', 'cleared', 'Times the pool was cleared.'),
+]
+
+
+def _pool_metrics(lines, pools):
+    for name, kind, key, help_text in POOL_METRICS:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for address, pool in sorted(pools.items()):
+            lines.append(f'{name}{_labels(("address",), (address,))} {_number(pool[key])}')
+    _counter(lines, 'octofit_mongo_pool_checkout_failures_total',
+             'Failed checkouts by reason; "timeout" means the pool was saturated.',
+             ('address', 'reason'),
+             {(address, reason): count
+              for address, pool in pools.items() for reason, count in pool['failures'].items()})
+
+
+registry = Registry()
+
+
+class CommandListener(monitoring.CommandListener):
+    """Charge every Mongo command to the request that ran it."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.add_command(event.command_name, event.duration_micros / 1e6)
+
+
+monitoring.register(CommandListener())
+
+
+def _time_orm_query(execute, sql, params, many, context):
+    with phase('orm'):
+        return execute(sql, params, many, context)
+
+
+def _route(request):
+    # URL names keep the label set small: one per route, not per path.
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route
+
+
+def _size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class InstrumentationMiddleware:
+    # Hybrid so async views and event streams are not pushed through a
+    # thread under ASGI. ORM time is only attributed on the sync path: async
+    # views run their queries on executor threads with their own connections.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = perf_counter()
+        try:
+            with connections['default'].execute_wrapper(_time_orm_query):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, perf_counter() - start, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._record(request, response, perf_counter() - start, stats)
+
+    def _record(self, request, response, seconds, stats):
+        route = _route(request)
+        size = _size(response)
+        registry.record(request.method, route, seconds, size, stats)
+        if seconds >= settings.SLOW_REQUEST_SECONDS:
+            log_slow_request(request, response, seconds, size, stats)
+        return response
+
+
+def log_slow_request(request, response, seconds, size, stats):
+    commands = ', '.join(
+        f'{name} x{count} {command_seconds * 1000:.1f}ms'
+        for name, (count, command_seconds)
+        in sorted(stats.commands.items(), key=lambda item: -item[1][1])
+    )
+    phases = ', '.join(
+        f'{name} {phase_seconds * 1000:.1f}ms' for name, phase_seconds in sorted(stats.phases.items())
+    )
+    logger.warning(
+        'Slow request %s %s -> %s in %.1fms (%s bytes); mongo: %s; phases: %s',
+        request.method, request.get_full_path(), response.status_code, seconds * 1000,
+        'streamed' if size is None else size, commands or 'none', phases or 'none',
+    )
+
+
+def metrics_view(request):
+    return HttpResponse(registry.exposition(), content_type=CONTENT_TYPE)
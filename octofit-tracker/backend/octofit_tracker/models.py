@@ -1,4 +1,8 @@
 from djongo import models
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# Each model lists the Mongo indexes its hot queries need in ``mongo_indexes``.
+# They are created by ``manage.py ensure_indexes``.
 
 
 class Team(models.Model):
@@ -32,6 +36,13 @@ class User(models.Model):
     role = models.CharField(max_length=50, choices=ROLE_CHOICES)
     created_at = models.DateTimeField()
 
+    mongo_indexes = [
+        # Mongo's default name, which databases seeded by the original
+        # populate_db already use; a different name would conflict.
+        IndexModel([('email', ASCENDING)], name='email_1', unique=True),
+        IndexModel([('team_id', ASCENDING)], name='team_id'),
+    ]
+
     class Meta:
         db_table = 'users'
 
@@ -57,6 +68,11 @@ class Activity(models.Model):
     date = models.DateTimeField()
     notes = models.TextField()
 
+    mongo_indexes = [
+        IndexModel([('user_id', ASCENDING), ('date', DESCENDING)], name='user_id_date'),
+        IndexModel([('date', DESCENDING), ('_id', DESCENDING)], name='date_id'),
+    ]
+
     class Meta:
         db_table = 'activities'
         verbose_name_plural = 'Activities'
@@ -65,6 +81,57 @@ class Activity(models.Model):
         return f"{self.type} - {self.duration}min"
 
 
+class ActivityRollup(models.Model):
+    """
+    Pre-aggregated activity totals for one time bucket of one user, team or
+    the whole app, either for a single activity type or for all of them.
+    Maintained by ``octofit_tracker.rollups``.
+    """
+    GRANULARITY_CHOICES = [
+        ('day', 'Day'),
+        ('week', 'Week'),
+        ('month', 'Month'),
+    ]
+
+    SCOPE_CHOICES = [
+        ('user', 'User'),
+        ('team', 'Team'),
+        ('all', 'All'),
+    ]
+
+    TYPE_ALL = 'all'
+
+    _id = models.CharField(max_length=200, primary_key=True)
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()  # start of the day, ISO week or month (UTC)
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    scope_id = models.IntegerField()  # user or team _id, 0 for scope 'all'
+    type = models.CharField(max_length=100)  # activity type or TYPE_ALL
+    count = models.IntegerField()
+    duration = models.IntegerField()  # minutes
+    distance = models.FloatField()  # km
+    calories = models.IntegerField()
+
+    mongo_indexes = [
+        IndexModel(
+            [('scope', ASCENDING), ('scope_id', ASCENDING), ('granularity', ASCENDING),
+             ('type', ASCENDING), ('bucket', ASCENDING)],
+            name='scope_granularity_type_bucket',
+        ),
+        IndexModel(
+            [('granularity', ASCENDING), ('scope', ASCENDING), ('type', ASCENDING),
+             ('bucket', ASCENDING)],
+            name='granularity_scope_type_bucket',
+        ),
+    ]
+
+    class Meta:
+        db_table = 'activity_rollups'
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d} {self.scope} {self.scope_id} {self.type}"
+
+
 class Leaderboard(models.Model):
     _id = models.IntegerField(primary_key=True)
     user_id = models.IntegerField()
@@ -76,6 +143,12 @@ class Leaderboard(models.Model):
     total_calories = models.IntegerField()
     rank = models.IntegerField()
 
+    mongo_indexes = [
+        IndexModel([('rank', ASCENDING)], name='rank'),
+        IndexModel([('user_id', ASCENDING)], name='user_id_unique', unique=True),
+        IndexModel([('team_id', ASCENDING), ('rank', ASCENDING)], name='team_id_rank'),
+    ]
+
     class Meta:
         db_table = 'leaderboard'
         ordering = ['rank']
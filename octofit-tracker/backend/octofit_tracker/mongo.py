@@ -0,0 +1,217 @@
+"""
+The one MongoClient per process.
+
+Every Mongo access goes through ``get_client``: native queries, management
+commands and the ORM, whose ``octofit_tracker.backends.djongo`` engine
+hands djongo this client instead of letting it open (and close) its own.
+The client is created lazily with the pool, timeout, read preference and
+compression options from settings, and is dropped in forked children so
+gunicorn workers and process pools never share the parent's sockets.
+``pool_stats`` tracks how busy each pool is.
+
+With MONGODB_REPLICA_READS on, reads made inside ``replica_reads()`` (safe
+requests, see ``octofit_tracker.replicas``) or with ``read_only=True`` use
+``secondaryPreferred`` with a MONGODB_REPLICA_MAX_STALENESS_SECONDS bound.
+Everything else, and every write, goes to the primary.
+"""
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock, local
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from pymongo import MongoClient, monitoring
+from pymongo.read_preferences import SecondaryPreferred
+
+_client = None
+_lock = Lock()
+
+# The database alias read through secondaries (see octofit_tracker.replicas).
+REPLICA_ALIAS = 'replica'
+
+_replica_scope = ContextVar('octofit_replica_reads', default=False)
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Per-server pool occupancy from pymongo's connection pool events:
+    open and checked-out connections, threads waiting for one, checkout
+    counts, time spent waiting and failed checkouts by reason (``timeout``
+    means the pool was saturated for MONGODB_WAIT_QUEUE_TIMEOUT_MS).
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._waiting_since = local()
+        self.reset()
+
+    def reset(self):
+        self.pools = {}
+
+    def _pool(self, address):
+        address = '%s:%s' % address
+        pool = self.pools.get(address)
+        if pool is None:
+            pool = self.pools[address] = {
+                'max_size': settings.MONGODB_MAX_POOL_SIZE,
+                'open': 0,
+                'in_use': 0,
+                'waiting': 0,
+                'checkouts': 0,
+                'wait_seconds': 0.0,
+                'failures': {},
+                'cleared': 0,
+            }
+        return pool
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                address: {**pool, 'failures': dict(pool['failures'])}
+                for address, pool in self.pools.items()
+            }
+
+    def _update(self, address, **changes):
+        with self._lock:
+            pool = self._pool(address)
+            for name, change in changes.items():
+                pool[name] += change
+
+    def _waited(self):
+        started = getattr(self._waiting_since, 'value', None)
+        self._waiting_since.value = None
+        return perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        max_size = event.options.get('maxPoolSize', settings.MONGODB_MAX_POOL_SIZE)
+        with self._lock:
+            self._pool(event.address)['max_size'] = max_size
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools.pop('%s:%s' % event.address, None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._waiting_since.value = perf_counter()
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        waited = self._waited()
+        with self._lock:
+            pool = self._pool(event.address)
+            pool['waiting'] -= 1
+            pool['wait_seconds'] += waited
+            pool['failures'][event.reason] = pool['failures'].get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, in_use=1, checkouts=1, wait_seconds=self._waited())
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+
+pool_stats = PoolStats()
+
+
+def client_options():
+    """Keyword arguments for MongoClient, from the ``default`` database and MONGODB_* settings."""
+    options = {
+        **settings.DATABASES['default'].get('CLIENT', {}),
+        'appname': 'octofit-tracker',
+        'connect': False,
+        'maxPoolSize': settings.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGODB_MIN_POOL_SIZE,
+        'maxIdleTimeMS': settings.MONGODB_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': settings.MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+        'connectTimeoutMS': settings.MONGODB_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': settings.MONGODB_SOCKET_TIMEOUT_MS,
+        'readPreference': settings.MONGODB_READ_PREFERENCE,
+        'event_listeners': [pool_stats],
+    }
+    if settings.MONGODB_COMPRESSORS:
+        options['compressors'] = settings.MONGODB_COMPRESSORS
+    return options
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = MongoClient(**client_options())
+    return _client
+
+
+def replica_read_preference():
+    return SecondaryPreferred(max_staleness=settings.MONGODB_REPLICA_MAX_STALENESS_SECONDS)
+
+
+def replica_reads_active():
+    """Whether reads in the current context may go to a secondary."""
+    return settings.MONGODB_REPLICA_READS and _replica_scope.get()
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let the reads in the block (and the ORM, via the router) use secondaries."""
+    token = _replica_scope.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_scope.reset(token)
+
+
+def pin_primary():
+    """Send the rest of the current context's reads to the primary."""
+    _replica_scope.set(False)
+
+
+def get_db(read_only=None):
+    """
+    Return the ``default`` database. ``read_only=True`` reads from a
+    secondary when replica reads are enabled, ``False`` always from the
+    primary, and ``None`` follows the current ``replica_reads()`` scope.
+    """
+    if read_only is None:
+        read_only = _replica_scope.get()
+    if read_only and settings.MONGODB_REPLICA_READS:
+        # Same database name as the ORM's ``replica`` alias reads.
+        name = settings.DATABASES.get(REPLICA_ALIAS, settings.DATABASES['default'])['NAME']
+        return get_client()[name].with_options(read_preference=replica_read_preference())
+    return get_client()[settings.DATABASES['default']['NAME']]
+
+
+def get_collection(model, read_only=None):
+    return get_db(read_only)[model._meta.db_table]
+
+
+def _after_fork():
+    # The parent's client, its sockets and monitor threads are unusable in
+    # the child; drop them without closing so the parent's pool is left
+    # alone, and let the first query in the child open its own pool.
+    global _client, _lock
+    _client = None
+    _lock = Lock()
+    pool_stats.reset()
+    for connection in connections.all(initialized_only=True):
+        if connection.vendor == 'djongo':
+            connection.connection = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
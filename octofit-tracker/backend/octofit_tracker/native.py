@@ -0,0 +1,163 @@
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+
+from . import mongo
+
+LOOKUP_OPERATORS = {
+    'exact': '$eq',
+    'gt': '$gt',
+    'gte': '$gte',
+    'lt': '$lt',
+    'lte': '$lte',
+    'in': '$in',
+    'ne': '$ne',
+}
+
+
+class NativeQuerySet:
+    """
+    Read-only stand-in for a Django QuerySet that queries Mongo through
+    pymongo instead of djongo's SQL translator.
+
+    Supports the subset DRF uses for list and retrieve actions (filter,
+    order_by, slicing, iteration, count and get) plus ``only`` for
+    projections. Results are plain documents, which the serializers read like
+    model instances. Whether it may read from a secondary is fixed when it is
+    created (``read_only``, or else the current ``mongo.replica_reads()``
+    scope), so a cursor consumed after the request, as exports are, still
+    reads from where the request would have.
+    """
+
+    def __init__(self, model, query=None, projection=None, ordering=None, offset=0, limit=None,
+                 read_only=None):
+        self.model = model
+        self.read_only = mongo.replica_reads_active() if read_only is None else read_only
+        self.query = query or {}
+        self.projection = projection
+        self.ordering = list(model._meta.ordering if ordering is None else ordering)
+        self.offset = offset
+        self.limit = limit
+
+    def _clone(self, **changes):
+        state = {
+            'query': dict(self.query),
+            'projection': self.projection,
+            'ordering': self.ordering,
+            'offset': self.offset,
+            'limit': self.limit,
+            'read_only': self.read_only,
+        }
+        state.update(changes)
+        return NativeQuerySet(self.model, **state)
+
+    def _field_name(self, name):
+        return self.model._meta.pk.name if name == 'pk' else name
+
+    def _to_python(self, name, value):
+        field = self.model._meta.get_field(name)
+        if isinstance(value, (list, tuple, set)):
+            return [field.to_python(item) for item in value]
+        return field.to_python(value)
+
+    def filter(self, **lookups):
+        query = dict(self.query)
+        for lookup, value in lookups.items():
+            name, _, operator = lookup.partition('__')
+            name = self._field_name(name)
+            operator = operator or 'exact'
+            if operator not in LOOKUP_OPERATORS:
+                raise ValueError(f'Unsupported lookup: {lookup}')
+            value = self._to_python(name, value)
+            # Every lookup is an operator, so lookups on the same field merge
+            # into one condition; repeating an operator ANDs the two.
+            condition = dict(query.get(name, {}))
+            if LOOKUP_OPERATORS[operator] in condition:
+                query['$and'] = [*query.get('$and', []), {name: {LOOKUP_OPERATORS[operator]: value}}]
+                continue
+            condition[LOOKUP_OPERATORS[operator]] = value
+            query[name] = condition
+        return self._clone(query=query)
+
+    def where(self, query):
+        """Add a raw Mongo filter document."""
+        return self._clone(query={'$and': [self.query, query]} if self.query else dict(query))
+
+    def order_by(self, *fields):
+        return self._clone(ordering=fields)
+
+    def only(self, *fields):
+        return self._clone(projection=[self._field_name(name) for name in fields])
+
+    def all(self):
+        return self._clone()
+
+    def _sort(self):
+        return [
+            (self._field_name(name.lstrip('-')), DESCENDING if name.startswith('-') else ASCENDING)
+            for name in self.ordering
+        ]
+
+    def _cursor(self):
+        cursor = mongo.get_collection(self.model, self.read_only).find(self.query, self.projection)
+        cursor.batch_size(settings.MONGODB_BATCH_SIZE)
+        if self.ordering:
+            cursor = cursor.sort(self._sort())
+        if self.offset:
+            cursor = cursor.skip(self.offset)
+        if self.limit is not None:
+            cursor = cursor.limit(self.limit)
+        return cursor
+
+    def __iter__(self):
+        if self.limit == 0:
+            return iter(())
+        return iter(self._cursor())
+
+    def __getitem__(self, key):
+        if isinstance(key, int):
+            results = list(self[key:key + 1])
+            if not results:
+                raise IndexError('NativeQuerySet index out of range')
+            return results[0]
+        start = self.offset + (key.start or 0)
+        if key.stop is None:
+            limit = self.limit
+        else:
+            limit = key.stop - (key.start or 0)
+            if self.limit is not None:
+                limit = min(limit, self.limit - (key.start or 0))
+        return self._clone(offset=start, limit=max(limit, 0) if limit is not None else None)
+
+    def count(self):
+        if self.limit == 0:
+            return 0
+        options = {'skip': self.offset} if self.offset else {}
+        if self.limit is not None:
+            options['limit'] = self.limit
+        return mongo.get_collection(self.model, self.read_only).count_documents(self.query, **options)
+
+    def exists(self):
+        return bool(list(self[:1]))
+
+    def get(self, **lookups):
+        results = list(self.filter(**lookups)[:2])
+        if not results:
+            raise self.model.DoesNotExist(f'{self.model.__name__} matching query does not exist.')
+        if len(results) > 1:
+            raise self.model.MultipleObjectsReturned(
+                f'get() returned more than one {self.model.__name__}.'
+            )
+        return results[0]
+
+
+class NativeReadMixin:
+    """
+    Serve list and retrieve actions from a NativeQuerySet when
+    ``NATIVE_READS`` is enabled; writes keep using the ORM.
+    """
+    native_read_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        if settings.NATIVE_READS and self.action in self.native_read_actions:
+            return NativeQuerySet(self.queryset.model)
+        return super().get_queryset()
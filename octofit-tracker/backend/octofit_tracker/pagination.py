@@ -0,0 +1,65 @@
+import json
+from bisect import bisect_left, bisect_right
+
+from django.conf import settings
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that seeks on the ordering key instead of scanning an
+    OFFSET. Viewsets choose their key with an ``ordering`` attribute.
+    """
+    ordering = '_id'
+    page_size_query_param = 'page_size'
+    max_page_size = settings.API_MAX_PAGE_SIZE
+
+    def get_ordering(self, request, queryset, view):
+        has_ordering_filter = any(
+            hasattr(backend, 'get_ordering') for backend in getattr(view, 'filter_backends', [])
+        )
+        if has_ordering_filter or not getattr(view, 'ordering', None):
+            return super().get_ordering(request, queryset, view)
+        ordering = view.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+
+class RankedListPagination(KeysetPagination):
+    """
+    KeysetPagination over an in-memory list sorted by ``key``: the cursor
+    holds the key of the row a page ended (or, going back, started) on, so
+    pages stay in place as rows ahead of them move.
+    """
+
+    def paginate_list(self, items, key, request):
+        """Return ``(page, offset)``: the rows of this page and the position of its first row."""
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        if cursor is None:
+            start = 0
+        else:
+            try:
+                position = tuple(json.loads(cursor.position))
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if cursor.reverse:
+                end = bisect_left(items, position, key=key)
+                start = max(end - self.page_size, 0)
+            else:
+                start = bisect_right(items, position, key=key)
+        page = items[start:start + self.page_size]
+        self.next_position = json.dumps(key(page[-1])) if start + len(page) < len(items) else None
+        self.previous_position = json.dumps(key(page[0])) if page and start > 0 else None
+        return page, start
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if self.previous_position is None:
+            return None
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=self.previous_position))
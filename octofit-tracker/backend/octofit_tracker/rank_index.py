@@ -0,0 +1,102 @@
+"""
+In-memory order statistics over the leaderboard.
+
+Entries are kept in a SortedKeyList ordered like the board (RANK_METRIC
+highest first, ties by user_id), so the entry at a rank and the rank of a
+user are both O(log n) lookups and top-K or neighbour queries only touch
+the slice they return. The index is loaded from Mongo on first use, follows
+leaderboard_changed in this process and is reloaded every
+RANK_INDEX_RESEED_SECONDS to pick up changes made by other workers.
+"""
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.dispatch import receiver
+from sortedcontainers import SortedKeyList
+
+from .leaderboard import RANK_METRIC, leaderboard_changed
+from .models import Leaderboard
+from .native import NativeQuerySet
+
+
+def _sort_key(entry):
+    return (-entry[RANK_METRIC], entry['user_id'])
+
+
+class RankIndex:
+    def __init__(self):
+        self.entries = SortedKeyList(key=_sort_key)
+        self.by_user = {}
+        self.loaded_at = None
+        self._lock = Lock()
+
+    def _load(self):
+        board = list(NativeQuerySet(Leaderboard, ordering=()))
+        self.entries = SortedKeyList(board, key=_sort_key)
+        self.by_user = {entry['user_id']: entry for entry in board}
+        self.loaded_at = monotonic()
+
+    def _ensure_loaded(self):
+        if self.loaded_at is None or monotonic() - self.loaded_at > settings.RANK_INDEX_RESEED_SECONDS:
+            self._load()
+
+    def _ranked(self, start, stop):
+        return [
+            dict(entry, rank=rank)
+            for rank, entry in enumerate(self.entries.islice(start, stop), start + 1)
+        ]
+
+    def top(self, k):
+        """Return the first ``k`` entries with their ranks."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._ranked(0, k)
+
+    def around(self, user_id, neighbors=0):
+        """
+        Return ``(rank, entries)`` for ``user_id`` and up to ``neighbors``
+        entries on either side, or ``(None, [])`` if the user is not ranked.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self.by_user.get(user_id)
+            if entry is None:
+                return None, []
+            position = self.entries.index(entry)
+            start = max(position - neighbors, 0)
+            return position + 1, self._ranked(start, position + neighbors + 1)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self.entries)
+
+    def update(self, user_ids):
+        """Re-read the given users' entries and move them to their new positions."""
+        with self._lock:
+            if self.loaded_at is None:
+                return
+            fresh = {
+                entry['user_id']: entry
+                for entry in NativeQuerySet(Leaderboard, ordering=()).filter(user_id__in=list(user_ids))
+            }
+            for user_id in user_ids:
+                current = self.by_user.pop(user_id, None)
+                if current is not None:
+                    self.entries.remove(current)
+                if user_id in fresh:
+                    self.by_user[user_id] = fresh[user_id]
+                    self.entries.add(fresh[user_id])
+
+    def reset(self):
+        with self._lock:
+            self.loaded_at = None
+
+
+index = RankIndex()
+
+
+@receiver(leaderboard_changed)
+def _on_leaderboard_changed(sender, changes=(), **kwargs):
+    index.update({change.user_id for change in changes})
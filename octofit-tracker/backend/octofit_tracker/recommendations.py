@@ -0,0 +1,219 @@
+"""
+Workout recommendations for ``/api/users/<id>/recommended-workouts/``.
+
+A user's profile comes from their activities over the last
+RECOMMENDATION_WINDOW_DAYS: the share of minutes spent on each activity
+type, the typical session length and a fitness level from weekly volume
+and calories burned per minute. Profiles and the workout catalog are
+feature matrices, so scoring one user or every user against every workout
+is the same handful of NumPy operations.
+
+Each user's top RECOMMENDATION_COUNT is cached until that user's
+activities change, the catalog does (through the ``workouts`` response
+cache version) or the UTC day ends, so activities ageing out of the window
+are dropped from the profile within a day. ``manage.py rebuild_recommendations`` fills the cache for
+everyone ahead of time when the cache is shared through Redis.
+"""
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+
+from . import response_cache
+from .leaderboard import activity_field
+from .models import Activity, User, Workout
+from .mongo import get_collection
+from .native import NativeQuerySet
+from .rollups import to_utc
+from .serializers import WorkoutSerializer
+from .signals import activities_changed
+
+TYPES = [choice for choice, _ in Activity.ACTIVITY_TYPE_CHOICES]
+TYPE_INDEX = {activity_type: index for index, activity_type in enumerate(TYPES)}
+
+# Difficulty levels, in the same units as a profile's fitness level.
+DIFFICULTY_LEVELS = {choice: level for level, (choice, _) in enumerate(Workout.DIFFICULTY_CHOICES)}
+
+# How much each fit contributes to a workout's score, which is in [0, 1].
+WEIGHTS = {'type': 0.5, 'duration': 0.25, 'difficulty': 0.25}
+
+# Session length assumed for users with no recent activity.
+DEFAULT_SESSION_MINUTES = 30
+
+# Each multiple of these weekly minutes, and of these calories per minute
+# above the first, moves a user up one difficulty level.
+LEVEL_WEEKLY_MINUTES = 150
+LEVEL_CALORIES_PER_MINUTE = 4
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _today(now=None):
+    return to_utc(now or datetime.now(timezone.utc)).date()
+
+
+def _key(user_id, catalog_version, day):
+    # Keyed by day so lists follow activities ageing out of the window.
+    return f'recommendations:{catalog_version}:{day:%Y-%m-%d}:{user_id}'
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1)
+
+
+def build_profiles(groups, user_ids=(), window_days=None):
+    """
+    Profile columns from per-user, per-type activity totals: ``groups`` are
+    dicts with ``user_id``, ``type``, ``count``, ``duration`` and
+    ``calories``. ``user_ids`` without groups get the default profile.
+    """
+    window_days = window_days or settings.RECOMMENDATION_WINDOW_DAYS
+    groups = [group for group in groups if group['type'] in TYPE_INDEX]
+    ids = np.array(sorted({*user_ids, *(group['user_id'] for group in groups)}), dtype=np.int64)
+    rows = np.searchsorted(ids, np.array([group['user_id'] for group in groups], dtype=np.int64))
+    columns = np.array([TYPE_INDEX[group['type']] for group in groups], dtype=np.int64)
+
+    minutes = np.zeros((len(ids), len(TYPES)))
+    np.add.at(minutes, (rows, columns), [group['duration'] for group in groups])
+    counts = np.bincount(rows, weights=[group['count'] for group in groups], minlength=len(ids))
+    calories = np.bincount(rows, weights=[group['calories'] for group in groups], minlength=len(ids))
+
+    total = minutes.sum(axis=1)
+    active = total > 0
+    safe_total = np.where(active, total, 1)
+    weekly_minutes = total * 7 / window_days
+    calories_per_minute = calories / safe_total
+    level = (np.clip(weekly_minutes / LEVEL_WEEKLY_MINUTES, 0, 2)
+             + np.clip(calories_per_minute / LEVEL_CALORIES_PER_MINUTE - 1, 0, 2)) / 2
+    return {
+        'user_id': ids,
+        # Users with no recent activity get an even mix: every type fits equally.
+        'mix': _unit_rows(np.where(active[:, None], minutes, 1.0)),
+        'session': np.where(active, total / np.maximum(counts, 1), DEFAULT_SESSION_MINUTES),
+        'level': np.where(active, level, 0.0),
+    }
+
+
+def profiles(user_ids=None, now=None):
+    """Profiles of ``user_ids``, or of every user with recent activity, from one aggregation."""
+    since = to_utc(now or datetime.now(timezone.utc)) - timedelta(days=settings.RECOMMENDATION_WINDOW_DAYS)
+    match = {'date': {'$gte': since}}
+    if user_ids is not None:
+        match['user_id'] = {'$in': list(user_ids)}
+    groups = get_collection(Activity).aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': {'user_id': '$user_id', 'type': '$type'},
+            'count': {'$sum': 1},
+            'duration': {'$sum': '$duration'},
+            'calories': {'$sum': '$calories'},
+        }},
+    ])
+    return build_profiles(
+        [{**group.pop('_id'), **group} for group in groups], user_ids or (),
+    )
+
+
+def build_catalog(workouts):
+    """Feature columns for workout rows; ``mixed`` workouts spread evenly over every type."""
+    mix = np.zeros((len(workouts), len(TYPES)))
+    for row, workout in enumerate(workouts):
+        if workout['type'] in TYPE_INDEX:
+            mix[row, TYPE_INDEX[workout['type']]] = 1.0
+        else:
+            mix[row] = 1.0
+    return {
+        '_id': np.array([workout['_id'] for workout in workouts], dtype=np.int64),
+        'mix': _unit_rows(mix),
+        'duration': np.array([workout['duration'] for workout in workouts], dtype=np.float64),
+        'level': np.array([DIFFICULTY_LEVELS.get(workout['difficulty'], 0) for workout in workouts],
+                          dtype=np.float64),
+    }
+
+
+def score(profiles, catalog):
+    """
+    Score every workout for every profile: a (users, workouts) matrix of
+    the weighted type, duration and difficulty fits, each in [0, 1].
+    """
+    type_fit = profiles['mix'] @ catalog['mix'].T
+    session = profiles['session'][:, None]
+    duration = np.maximum(catalog['duration'][None, :], 1)
+    duration_fit = np.minimum(session, duration) / np.maximum(session, duration)
+    difficulty_fit = 1 - np.abs(profiles['level'][:, None] - catalog['level'][None, :]) / 2
+    return (WEIGHTS['type'] * type_fit
+            + WEIGHTS['duration'] * duration_fit
+            + WEIGHTS['difficulty'] * difficulty_fit)
+
+
+def top(scores, workout_ids, n):
+    """Column indexes of the ``n`` best workouts per row, ties broken by workout _id."""
+    order = np.lexsort((np.broadcast_to(workout_ids, scores.shape), -scores))
+    return order[:, :n]
+
+
+def load_catalog():
+    """Return the serialized workouts and their feature columns."""
+    workouts = WorkoutSerializer(Workout.objects.order_by('_id'), many=True).data
+    return workouts, build_catalog(workouts)
+
+
+def compute(user_ids, catalog=None, now=None):
+    """
+    Return ``{user_id: [workout rows with a score, best first]}`` for
+    ``user_ids``; ``catalog`` is a ``load_catalog()`` result to reuse.
+    """
+    workouts, catalog = catalog or load_catalog()
+    if not workouts:
+        return {user_id: [] for user_id in user_ids}
+    users = profiles(user_ids, now=now)
+    scores = score(users, catalog)
+    best = top(scores, catalog['_id'], settings.RECOMMENDATION_COUNT)
+    return {
+        int(user_id): [
+            {**workouts[column], 'score': round(float(scores[row, column]), 4)}
+            for column in best[row]
+        ]
+        for row, user_id in enumerate(users['user_id'])
+    }
+
+
+def recommended_workouts(user_id):
+    """The cached top RECOMMENDATION_COUNT workouts for one user, computed on a miss."""
+    key = _key(user_id, response_cache.version('workouts'), _today())
+    rows = _cache().get(key)
+    if rows is None:
+        rows = compute([user_id])[user_id]
+        _cache().set(key, rows, settings.RECOMMENDATION_CACHE_TIMEOUT)
+    return rows
+
+
+def rebuild(batch_size=None, now=None):
+    """Compute and cache every user's recommendations. Returns the number of users."""
+    batch_size = batch_size or settings.MONGODB_BATCH_SIZE
+    catalog_version, day = response_cache.version('workouts'), _today(now)
+    catalog = load_catalog()
+    user_ids = [user['_id'] for user in NativeQuerySet(User).only('_id').order_by('_id')]
+    for start in range(0, len(user_ids), batch_size):
+        batch = compute(user_ids[start:start + batch_size], catalog=catalog, now=now)
+        _cache().set_many(
+            {_key(user_id, catalog_version, day): rows for user_id, rows in batch.items()},
+            settings.RECOMMENDATION_CACHE_TIMEOUT,
+        )
+    return len(user_ids)
+
+
+def forget(user_ids):
+    """Drop the cached lists of ``user_ids`` so they are recomputed on the next read."""
+    catalog_version, day = response_cache.version('workouts'), _today()
+    _cache().delete_many([_key(user_id, catalog_version, day) for user_id in user_ids])
+
+
+@receiver(activities_changed)
+def _on_activities_changed(sender, added=(), removed=(), **kwargs):
+    forget({activity_field(activity, 'user_id') for activity in [*added, *removed]})
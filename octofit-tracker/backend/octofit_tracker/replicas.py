@@ -0,0 +1,74 @@
+"""
+Read-replica routing.
+
+``ReplicaRoutingMiddleware`` opens a ``mongo.replica_reads()`` scope for
+safe (GET, HEAD, OPTIONS) requests, so their native reads and, through
+``ReplicaRouter``, their ORM reads go to secondaries. Unsafe requests stay
+on the primary and, when they succeed, set a cookie that keeps the same
+client's reads on the primary for MONGODB_REPLICA_MAX_STALENESS_SECONDS,
+so it reads its own writes. All of it is inert unless
+MONGODB_REPLICA_READS is on.
+"""
+from asyncio import iscoroutinefunction
+
+from asgiref.sync import markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+
+from . import mongo
+
+REPLICA_ALIAS = mongo.REPLICA_ALIAS
+PIN_COOKIE = 'octofit_primary'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return REPLICA_ALIAS if mongo.replica_reads_active() else 'default'
+
+    def db_for_write(self, model, **hints):
+        # A write inside a read scope makes the rest of it read-your-writes.
+        mongo.pin_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # both aliases are the same database
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.MONGODB_REPLICA_READS:
+            return self.get_response(request)
+        with mongo.replica_reads(self._replica_eligible(request)):
+            response = self.get_response(request)
+        return self._pin(request, response)
+
+    async def __acall__(self, request):
+        if not settings.MONGODB_REPLICA_READS:
+            return await self.get_response(request)
+        with mongo.replica_reads(self._replica_eligible(request)):
+            response = await self.get_response(request)
+        return self._pin(request, response)
+
+    def _replica_eligible(self, request):
+        return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+    def _pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.MONGODB_REPLICA_MAX_STALENESS_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -0,0 +1,123 @@
+from hashlib import sha1
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+from .models import Leaderboard, Team, User, Workout
+
+# Models whose writes invalidate a cached namespace. Leaderboard responses
+# carry user names and, with ?expand=, embedded users and teams.
+INVALIDATED_BY = {
+    Leaderboard: 'leaderboard',
+    Team: 'leaderboard',
+    User: 'leaderboard',
+    Workout: 'workouts',
+}
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def _version_key(namespace):
+    return f'responses:{namespace}:version'
+
+
+def version(namespace):
+    """The current version of ``namespace``; it changes whenever the namespace is invalidated."""
+    return _cache().get_or_set(_version_key(namespace), 1, None)
+
+
+def invalidate(namespace):
+    """Drop every cached response in ``namespace`` by bumping its version."""
+    cache = _cache()
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), 1, None)
+
+
+def response_key(namespace, request, variant=''):
+    path = request.get_full_path().encode()
+    media_type = getattr(request, 'accepted_media_type', '')
+    return f'responses:{namespace}:{version(namespace)}:{media_type}:{variant}:{sha1(path).hexdigest()}'
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def _cacheable(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is None or renderer.format != 'api'
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _invalidate_on_write(sender, **kwargs):
+    namespace = INVALIDATED_BY.get(sender)
+    if namespace:
+        invalidate(namespace)
+
+
+class CachedResponseMixin:
+    """
+    Cache the rendered bytes of list and retrieve responses per path and
+    query string, with ETag / If-None-Match support. Browsable API (HTML)
+    responses are personalised and never cached. Entries are dropped when
+    a model mapped to ``cache_namespace`` in INVALIDATED_BY is written.
+    """
+    cache_namespace = None
+
+    def cache_variant(self, request):
+        """Extra key part for responses that change without a write, such as time windows."""
+        return ''
+
+    def cached(self, handler, request, *args, **kwargs):
+        # The browsable API's HTML carries the user's name and CSRF token.
+        if not _cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = response_key(self.cache_namespace, request, self.cache_variant(request))
+        entry = _cache().get(key)
+        if entry is None:
+            self._response_cache_key = key
+            return handler(request, *args, **kwargs)
+
+        if _not_modified(request, entry['etag']):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(entry['content'], content_type=entry['content_type'])
+        response['ETag'] = entry['etag']
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(self, '_response_cache_key', None)
+        if key is None or response.status_code != 200:
+            return response
+
+        response.render()
+        etag = quote_etag(sha1(response.content).hexdigest())
+        _cache().set(key, {
+            'content': response.content,
+            'content_type': response['Content-Type'],
+            'etag': etag,
+        }, settings.RESPONSE_CACHE_TIMEOUT)
+        if _not_modified(request, etag):
+            response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,137 @@
+from datetime import timedelta, timezone
+
+from django.conf import settings
+from django.dispatch import receiver
+from pymongo import UpdateOne
+
+from .leaderboard import activity_field
+from .models import ActivityRollup, User
+from .mongo import get_collection
+from .native import NativeQuerySet
+from .signals import activities_changed
+
+GRANULARITIES = [choice for choice, _ in ActivityRollup.GRANULARITY_CHOICES]
+
+METRICS = ['count', 'duration', 'distance', 'calories']
+
+
+def to_utc(date):
+    """Return ``date`` as a naive UTC datetime, the way Mongo stores it."""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def bucket_start(date, granularity):
+    day = to_utc(date).replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def rollup_id(granularity, bucket, scope, scope_id, activity_type):
+    return f'{granularity}:{bucket:%Y-%m-%d}:{scope}:{scope_id}:{activity_type}'
+
+
+def team_ids(user_ids):
+    """Map user _id to team_id with one projected query."""
+    users = NativeQuerySet(User).filter(_id__in=list(user_ids)).only('_id', 'team_id')
+    return {user['_id']: user['team_id'] for user in users}
+
+
+def accumulate(rollups, activities, teams, sign=1):
+    """
+    Add the contribution of ``activities`` to ``rollups``, a dict of rollup
+    _id to document, creating documents as needed.
+    """
+    for activity in activities:
+        user_id = activity_field(activity, 'user_id')
+        scopes = [('user', user_id), ('all', 0)]
+        if user_id in teams:
+            scopes.append(('team', teams[user_id]))
+        amounts = {
+            'count': sign,
+            'duration': sign * activity_field(activity, 'duration'),
+            'distance': sign * activity_field(activity, 'distance'),
+            'calories': sign * activity_field(activity, 'calories'),
+        }
+        for granularity in GRANULARITIES:
+            bucket = bucket_start(activity_field(activity, 'date'), granularity)
+            for scope, scope_id in scopes:
+                for activity_type in (activity_field(activity, 'type'), ActivityRollup.TYPE_ALL):
+                    key = rollup_id(granularity, bucket, scope, scope_id, activity_type)
+                    rollup = rollups.setdefault(key, {
+                        '_id': key,
+                        'granularity': granularity,
+                        'bucket': bucket,
+                        'scope': scope,
+                        'scope_id': scope_id,
+                        'type': activity_type,
+                        **dict.fromkeys(METRICS, 0),
+                    })
+                    for metric, amount in amounts.items():
+                        rollup[metric] += amount
+    return rollups
+
+
+def record_activity_change(added=(), removed=()):
+    """Apply created, updated or deleted activities to the rollups as $inc upserts."""
+    teams = team_ids({activity_field(activity, 'user_id') for activity in [*added, *removed]})
+    rollups = accumulate({}, added, teams)
+    accumulate(rollups, removed, teams, sign=-1)
+    updates = [
+        UpdateOne(
+            {'_id': key},
+            {
+                '$inc': {metric: rollup[metric] for metric in METRICS},
+                '$setOnInsert': {
+                    field: rollup[field]
+                    for field in ('granularity', 'bucket', 'scope', 'scope_id', 'type')
+                },
+            },
+            upsert=True,
+        )
+        for key, rollup in rollups.items()
+        if any(rollup[metric] for metric in METRICS)
+    ]
+    if updates:
+        get_collection(ActivityRollup).bulk_write(updates, ordered=False)
+
+
+@receiver(activities_changed)
+def _on_activities_changed(sender, added=(), removed=(), **kwargs):
+    record_activity_change(added=added, removed=removed)
+
+
+def rebuild(activities, chunk_size=None):
+    """
+    Recompute every rollup from an iterable of activity documents, replacing
+    the current contents of the collection. Returns the number of rollups.
+    """
+    chunk_size = chunk_size or settings.ACTIVITY_BULK_CHUNK_SIZE
+    teams = {user['_id']: user['team_id'] for user in NativeQuerySet(User).only('_id', 'team_id')}
+    rollups = accumulate({}, activities, teams)
+
+    collection = get_collection(ActivityRollup)
+    collection.delete_many({})
+    documents = list(rollups.values())
+    for start in range(0, len(documents), chunk_size):
+        collection.insert_many(documents[start:start + chunk_size], ordered=False)
+    return len(documents)
+
+
+def query(granularity, scope, scope_id=0, activity_type=ActivityRollup.TYPE_ALL, start=None, end=None):
+    """Return the rollups for one series, oldest bucket first."""
+    lookups = {
+        'granularity': granularity,
+        'scope': scope,
+        'scope_id': scope_id,
+        'type': activity_type,
+    }
+    if start is not None:
+        lookups['bucket__gte'] = bucket_start(start, granularity)
+    if end is not None:
+        lookups['bucket__lte'] = to_utc(end)
+    return NativeQuerySet(ActivityRollup).filter(**lookups).order_by('bucket')
@@ -1,23 +1,97 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import Team, User, Activity, Leaderboard, Workout
+from .models import Team, User, Activity, ActivityRollup, Leaderboard, Workout
+from .native import NativeQuerySet
 
 
 class TeamSerializer(serializers.ModelSerializer):
     class Meta:
         model = Team
         fields = ['_id', 'name', 'description', 'created_at']
+        read_only_fields = ['_id']
 
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['_id', 'name', 'email', 'team_id', 'role', 'created_at']
+        read_only_fields = ['_id']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+def parse_fields(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsMixin:
+    """Limit GET responses to the fields named in ``?fields=a,b,c``."""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return fields
+        requested = request.query_params.get('fields')
+        if not requested:
+            return fields
+        requested = set(parse_fields(requested))
+        return {name: field for name, field in fields.items() if name in requested}
+
+
+class ActivitySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Activity
         fields = ['_id', 'user_id', 'type', 'duration', 'distance', 'calories', 'date', 'notes']
+        read_only_fields = ['_id']
+
+    def validate_user_id(self, value):
+        if not NativeQuerySet(User).filter(_id=value).count():
+            raise serializers.ValidationError(f'User {value} does not exist.')
+        return value
+
+
+class ActivityBulkListSerializer(serializers.ListSerializer):
+    def validate_items(self, items):
+        """
+        Validate ``(index, payload)`` pairs item by item, returning the valid
+        ``(index, validated_data)`` pairs and a list of per-item errors.
+        """
+        valid, errors = [], []
+        for index, item in items:
+            try:
+                valid.append((index, self.child.run_validation(item)))
+            except serializers.ValidationError as exc:
+                errors.append({'index': index, 'errors': exc.detail})
+        return valid, errors
+
+    def validate_users(self, valid):
+        """
+        Split validated ``(index, validated_data)`` pairs into those whose
+        user exists and per-item errors for the rest, with one query.
+        """
+        errors = []
+        user_ids = {data['user_id'] for _, data in valid}
+        known = {user['_id'] for user in NativeQuerySet(User).filter(_id__in=user_ids).only('_id')}
+        for index, data in valid:
+            if data['user_id'] not in known:
+                errors.append({'index': index, 'errors': {
+                    'user_id': [f"User {data['user_id']} does not exist."],
+                }})
+        return [(index, data) for index, data in valid if data['user_id'] in known], errors
+
+
+class BulkActivitySerializer(ActivitySerializer):
+    # Migrations may keep their own ids; items without one are numbered by
+    # the allocator. There is no per-row uniqueness query on _id: duplicates
+    # are reported by the insert itself.
+    class Meta(ActivitySerializer.Meta):
+        read_only_fields = []
+        extra_kwargs = {'_id': {'validators': [], 'required': False}}
+        list_serializer_class = ActivityBulkListSerializer
+
+    def validate_user_id(self, value):
+        # The bulk endpoint checks the whole batch with validate_users;
+        # import_activities loads history whose users may not exist yet.
+        return value
 
 
 class LeaderboardSerializer(serializers.ModelSerializer):
@@ -27,7 +101,69 @@ class LeaderboardSerializer(serializers.ModelSerializer):
                   'total_duration', 'total_distance', 'total_calories', 'rank']
 
 
+class TeamStandingSerializer(serializers.Serializer):
+    team_id = serializers.IntegerField()
+    team_name = serializers.CharField()
+    member_count = serializers.IntegerField()
+    total_activities = serializers.IntegerField()
+    total_duration = serializers.IntegerField()
+    total_distance = serializers.FloatField()
+    total_calories = serializers.IntegerField()
+    rank = serializers.IntegerField()
+
+
 class WorkoutSerializer(serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = ['_id', 'name', 'type', 'difficulty', 'duration', 'description', 'exercises']
+        read_only_fields = ['_id']
+
+
+class ActivityFilterSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField(required=False)
+    team_id = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(choices=Activity.ACTIVITY_TYPE_CHOICES, required=False)
+    date_after = serializers.DateTimeField(required=False)
+    date_before = serializers.DateTimeField(required=False)
+
+
+class ActivityRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ActivityRollup
+        fields = ['bucket', 'count', 'duration', 'distance', 'calories']
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    compression = serializers.ChoiceField(choices=['gzip'], required=False)
+
+
+class TopQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(min_value=1, max_value=settings.API_MAX_PAGE_SIZE, default=10)
+
+
+class RankQuerySerializer(serializers.Serializer):
+    neighbors = serializers.IntegerField(min_value=0, max_value=settings.API_MAX_PAGE_SIZE, default=0)
+
+
+class RecommendationQuerySerializer(serializers.Serializer):
+    k = serializers.IntegerField(
+        min_value=1, max_value=settings.RECOMMENDATION_COUNT, default=settings.RECOMMENDATION_COUNT
+    )
+
+
+class StatsQuerySerializer(serializers.Serializer):
+    granularity = serializers.ChoiceField(choices=ActivityRollup.GRANULARITY_CHOICES, default='day')
+    user_id = serializers.IntegerField(required=False)
+    team_id = serializers.IntegerField(required=False)
+    type = serializers.ChoiceField(
+        choices=Activity.ACTIVITY_TYPE_CHOICES + [(ActivityRollup.TYPE_ALL, 'All')],
+        default=ActivityRollup.TYPE_ALL
+    )
+    start = serializers.DateTimeField(required=False)
+    end = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'user_id' in data and 'team_id' in data:
+            raise serializers.ValidationError('Pass either user_id or team_id, not both.')
+        return data
@@ -56,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'octofit_tracker.metrics.InstrumentationMiddleware',
+    'octofit_tracker.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -97,7 +99,7 @@ if MONGODB_URI:
     # Use authenticated MongoDB connection string for production or secured environments
     DATABASES = {
         'default': {
-            'ENGINE': 'djongo',
+            'ENGINE': 'octofit_tracker.backends.djongo',
             'NAME': MONGODB_DB_NAME,
             'ENFORCE_SCHEMA': False,
             'CLIENT': {
@@ -109,7 +111,7 @@ else:
     # Fallback to local MongoDB instance for development
     DATABASES = {
         'default': {
-            'ENGINE': 'djongo',
+            'ENGINE': 'octofit_tracker.backends.djongo',
             'NAME': MONGODB_DB_NAME,
             'ENFORCE_SCHEMA': False,
             'CLIENT': {
@@ -119,6 +121,78 @@ else:
         }
     }
 
+# Reads from safe requests (and rebuilds run with --secondary) go to
+# secondaries through the ``replica`` alias and octofit_tracker.mongo when
+# MONGODB_REPLICA_READS is on. It shares the default client and pool, reads
+# with secondaryPreferred and never from a secondary lagging more than
+# MONGODB_REPLICA_MAX_STALENESS_SECONDS (at least 90), which is also how
+# long a client that wrote keeps reading from the primary. The alias only
+# changes the read preference: its NAME (read by both the ORM and native
+# reads) should be the default database's, and its CLIENT host settings are
+# ignored in favour of the shared client.
+MONGODB_REPLICA_READS = os.environ.get('MONGODB_REPLICA_READS', 'False').lower() in ('true', '1', 'yes')
+MONGODB_REPLICA_MAX_STALENESS_SECONDS = int(os.environ.get('MONGODB_REPLICA_MAX_STALENESS_SECONDS', '120'))
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'REPLICA': True,
+    'TEST': {'MIRROR': 'default'},
+}
+DATABASE_ROUTERS = ['octofit_tracker.replicas.ReplicaRouter']
+
+# Every Mongo access (the ORM, native reads and management commands) shares
+# one pooled client per process from octofit_tracker.mongo, configured here.
+# With NATIVE_READS enabled, list/retrieve on activities, users and the
+# leaderboard bypass djongo's SQL translation.
+MONGODB_MAX_POOL_SIZE = int(os.environ.get('MONGODB_MAX_POOL_SIZE', '100'))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get('MONGODB_MIN_POOL_SIZE', '0'))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get('MONGODB_MAX_IDLE_TIME_MS', '300000'))
+# How long a request waits for a free pooled connection before failing.
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGODB_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGODB_CONNECT_TIMEOUT_MS', '5000'))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGODB_SERVER_SELECTION_TIMEOUT_MS', '10000'))
+# 0 lets a single command run as long as it needs (rebuilds, imports).
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGODB_SOCKET_TIMEOUT_MS', '0'))
+MONGODB_READ_PREFERENCE = os.environ.get('MONGODB_READ_PREFERENCE', 'primary')
+# Wire compression, e.g. "zstd,zlib" (zstd and snappy need their Python packages).
+MONGODB_COMPRESSORS = os.environ.get('MONGODB_COMPRESSORS', '')
+MONGODB_BATCH_SIZE = int(os.environ.get('MONGODB_BATCH_SIZE', '500'))
+NATIVE_READS = os.environ.get('NATIVE_READS', 'True').lower() in ('true', '1', 'yes')
+
+# Threads per ASGI worker serving the async read endpoints under /api/async/.
+# Keep it at or below MONGODB_MAX_POOL_SIZE so reads do not queue for sockets.
+ASYNC_READ_WORKERS = int(os.environ.get('ASYNC_READ_WORKERS', '32'))
+
+# Leaderboard event stream (ASGI only): events buffered per client before it
+# is told to resync, and the idle interval between keepalive comments.
+LEADERBOARD_STREAM_QUEUE_SIZE = int(os.environ.get('LEADERBOARD_STREAM_QUEUE_SIZE', '100'))
+LEADERBOARD_STREAM_KEEPALIVE_SECONDS = int(os.environ.get('LEADERBOARD_STREAM_KEEPALIVE_SECONDS', '15'))
+
+
+# Caches
+# Rendered leaderboard and workout responses are kept in the ``responses``
+# cache. The in-process LRU is per worker; point RESPONSE_CACHE_REDIS_URL at
+# a Redis instance to share entries (and invalidations) between workers.
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', '300'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+if os.environ.get('RESPONSE_CACHE_REDIS_URL'):
+    CACHES[RESPONSE_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('RESPONSE_CACHE_REDIS_URL'),
+    }
+else:
+    CACHES[RESPONSE_CACHE_ALIAS] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'octofit-responses',
+        'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))},
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -161,6 +235,75 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST framework
+# Lists are paginated with keyset cursors; clients may ask for a smaller or
+# larger page with ?page_size= up to API_MAX_PAGE_SIZE.
+
+API_MAX_PAGE_SIZE = int(os.environ.get('API_MAX_PAGE_SIZE', '500'))
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'octofit_tracker.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', '50')),
+    'DEFAULT_RENDERER_CLASSES': [
+        'octofit_tracker.lean.LeanJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
+# Serialize list responses through the compiled read-only path in
+# octofit_tracker.lean instead of the DRF field machinery.
+LEAN_LIST_RESPONSES = os.environ.get('LEAN_LIST_RESPONSES', 'True').lower() in ('true', '1', 'yes')
+
+# Requests taking at least this long are logged to octofit_tracker.slow
+# with their Mongo command and phase breakdown.
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'octofit_tracker.slow': {'handlers': ['console'], 'level': 'WARNING', 'propagate': False},
+    },
+}
+
+# Leaderboard field ranked highest-first: total_calories, total_duration or
+# total_distance.
+LEADERBOARD_RANK_METRIC = os.environ.get('LEADERBOARD_RANK_METRIC', 'total_calories')
+
+# Windowed leaderboards (?window=7d|30d|week|month on /api/leaderboard/):
+# longest rolling window allowed, and how often each worker re-reads its
+# window state from the daily rollups to pick up other workers' writes.
+WINDOW_MAX_DAYS = int(os.environ.get('WINDOW_MAX_DAYS', '366'))
+WINDOW_RESEED_SECONDS = int(os.environ.get('WINDOW_RESEED_SECONDS', '60'))
+
+# How often each worker reloads the in-memory rank index behind
+# /api/leaderboard/top/ and /api/leaderboard/rank/<user_id>/.
+RANK_INDEX_RESEED_SECONDS = int(os.environ.get('RANK_INDEX_RESEED_SECONDS', '60'))
+
+# How often each worker checks whether a leaderboard rebuild ran in another
+# process (manage.py rebuild_leaderboard) and drops its leaderboard caches.
+LEADERBOARD_REBUILD_CHECK_SECONDS = int(os.environ.get('LEADERBOARD_REBUILD_CHECK_SECONDS', '5'))
+
+# How long user and team documents embedded by ?expand= stay cached.
+EXPAND_CACHE_TIMEOUT = int(os.environ.get('EXPAND_CACHE_TIMEOUT', '60'))
+
+# Workout recommendations (/api/users/<id>/recommended-workouts/): how many
+# are kept per user, how many days of activity a profile covers, and how
+# long a cached list lives when the user logs nothing new.
+RECOMMENDATION_COUNT = int(os.environ.get('RECOMMENDATION_COUNT', '10'))
+RECOMMENDATION_WINDOW_DAYS = int(os.environ.get('RECOMMENDATION_WINDOW_DAYS', '28'))
+RECOMMENDATION_CACHE_TIMEOUT = int(os.environ.get('RECOMMENDATION_CACHE_TIMEOUT', '86400'))
+
+# Ids reserved per process and collection at a time by octofit_tracker.ids.
+ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', '100'))
+
+# Number of activities validated and written per insert_many call by
+# /api/activities/bulk/.
+ACTIVITY_BULK_CHUNK_SIZE = int(os.environ.get('ACTIVITY_BULK_CHUNK_SIZE', '1000'))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = False
 
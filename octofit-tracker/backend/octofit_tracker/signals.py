@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent by every Activity write path (the viewset, bulk ingestion and imports)
+# with ``added`` and ``removed``: lists of Activity instances or documents.
+# Derived data such as the leaderboard and the rollups update from it.
+activities_changed = Signal()
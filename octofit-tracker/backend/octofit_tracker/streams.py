@@ -0,0 +1,146 @@
+"""
+Server-Sent Events stream of leaderboard rank changes.
+
+``leaderboard_stream`` is a plain ASGI app mounted by ``asgi.py`` at
+STREAM_PATH (Django 4.1 cannot stream from async views). Every connection
+subscribes a bounded queue to the process-wide ``broadcaster``, which is
+fed from ``leaderboard_changed`` on whatever thread applied the write.
+A client that falls LEADERBOARD_STREAM_QUEUE_SIZE events behind has its
+backlog dropped and receives a single ``resync`` event telling it to
+refetch the board, so one slow reader never holds memory or blocks the
+writers. Each worker process only pushes the writes it applied itself.
+"""
+import asyncio
+import json
+from itertools import count
+from threading import Lock
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from .leaderboard import leaderboard_changed
+
+STREAM_PATH = '/api/leaderboard/stream/'
+
+RESYNC = {'event': 'resync', 'data': {}}
+
+
+class Broadcaster:
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self._subscribers = {}  # queue -> event loop it belongs to
+        self._lock = Lock()
+        self._ids = count(1)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    @staticmethod
+    def _offer(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop the backlog and ask the client to refetch.
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+
+    def publish(self, event, data):
+        """Queue an event for every subscriber; safe to call from any thread."""
+        event = {'id': next(self._ids), 'event': event, 'data': data}
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:  # loop closed under us
+                self.unsubscribe(queue)
+
+
+broadcaster = Broadcaster(settings.LEADERBOARD_STREAM_QUEUE_SIZE)
+
+
+@receiver(leaderboard_changed)
+def _publish_rank_changes(sender, changes=(), **kwargs):
+    if not len(broadcaster):
+        return
+    moved = [
+        {'user_id': change.user_id, 'old_rank': change.old_rank, 'new_rank': change.new_rank}
+        for change in changes
+        if change.old_rank != change.new_rank
+    ]
+    if moved:
+        broadcaster.publish('rank', {'changes': moved})
+
+
+def format_event(event):
+    lines = [f"event: {event['event']}", f"data: {json.dumps(event['data'])}"]
+    if 'id' in event:
+        lines.insert(0, f"id: {event['id']}")
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+def _cors_headers(scope):
+    origin = dict(scope['headers']).get(b'origin', b'').decode('latin-1')
+    if origin and (settings.CORS_ALLOW_ALL_ORIGINS or origin in settings.CORS_ALLOWED_ORIGINS):
+        headers = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'vary', b'origin')]
+        if settings.CORS_ALLOW_CREDENTIALS:
+            headers.append((b'access-control-allow-credentials', b'true'))
+        return headers
+    return []
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def leaderboard_stream(scope, receive, send):
+    if scope['method'] != 'GET':
+        await send({'type': 'http.response.start', 'status': 405, 'headers': [(b'allow', b'GET')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    queue = broadcaster.subscribe()
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                *_cors_headers(scope),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': b': connected\n\n', 'more_body': True})
+        while True:
+            next_event = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {next_event, disconnected},
+                timeout=settings.LEADERBOARD_STREAM_KEEPALIVE_SECONDS,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if disconnected in done:
+                next_event.cancel()
+                break
+            if next_event in done:
+                body = format_event(next_event.result())
+            else:
+                next_event.cancel()
+                body = b': keepalive\n\n'
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(queue)
+        disconnected.cancel()
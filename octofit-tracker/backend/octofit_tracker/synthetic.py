@@ -0,0 +1,90 @@
+"""
+Reproducible synthetic data for load and capacity testing.
+
+Each user's activities come from a ``random.Random`` seeded with the run seed
+and the user id, so a dataset is identical no matter how it is chunked, how
+many workers build it or in which order the chunks complete.
+"""
+import random
+from datetime import timedelta
+
+from .models import Activity
+from .mongo import get_db
+
+ACTIVITY_TYPES = [choice for choice, _ in Activity.ACTIVITY_TYPE_CHOICES]
+
+_worker_db = None
+
+
+def team_for_user(user_id, first_team_id, teams):
+    return first_team_id + (user_id % teams)
+
+
+def generate_teams(first_id, count, created_at):
+    return [
+        {
+            '_id': team_id,
+            'name': f'Team {team_id}',
+            'description': f'Synthetic team {team_id}',
+            'created_at': created_at,
+        }
+        for team_id in range(first_id, first_id + count)
+    ]
+
+
+def generate_users(first_id, count, first_team_id, teams, created_at):
+    return [
+        {
+            '_id': user_id,
+            'name': f'User {user_id}',
+            'email': f'user{user_id}@octofit.test',
+            'team_id': team_for_user(user_id, first_team_id, teams),
+            'role': 'member',
+            'created_at': created_at,
+        }
+        for user_id in range(first_id, first_id + count)
+    ]
+
+
+def generate_activities(seed, first_user_id, user_count, per_user,
+                        first_activity_id, end_date, days):
+    activities = []
+    activity_id = first_activity_id
+    for user_id in range(first_user_id, first_user_id + user_count):
+        rng = random.Random(f'{seed}:{user_id}')
+        for _ in range(per_user):
+            duration = rng.randint(15, 120)
+            activities.append({
+                '_id': activity_id,
+                'user_id': user_id,
+                'type': rng.choice(ACTIVITY_TYPES),
+                'duration': duration,
+                'distance': round(rng.uniform(1, 20), 2),
+                'calories': duration * rng.randint(5, 12),
+                'date': end_date - timedelta(seconds=rng.randint(0, days * 86400)),
+                'notes': f'User {user_id} training session',
+            })
+            activity_id += 1
+    return activities
+
+
+GENERATORS = {
+    'teams': generate_teams,
+    'users': generate_users,
+    'activities': generate_activities,
+}
+
+
+def init_worker():
+    # Forked workers start without the parent's client and open their own
+    # pool on first use (see octofit_tracker.mongo).
+    global _worker_db
+    _worker_db = get_db()
+
+
+def insert_chunk(collection, args):
+    """Generate one chunk in a worker and write it with an unordered insert_many."""
+    documents = GENERATORS[collection](*args)
+    if documents:
+        _worker_db[collection].insert_many(documents, ordered=False)
+    return len(documents)
@@ -1,8 +1,38 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock, skipUnless
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
 from rest_framework.test import APITestCase
 from rest_framework import status
-from datetime import datetime
+from rest_framework.renderers import JSONRenderer
+from datetime import datetime, timedelta, timezone
 from .models import Team, User, Activity, Leaderboard, Workout
+from . import (
+    exports, ids, metrics, mongo, importers, leaderboard, recommendations, replicas, rollups, synthetic,
+    windows
+)
+from .rank_index import index as rank_index
+from .indexes import _is_covered, declared_indexes
+from . import leaderboard_rebuild
+from .leaderboard_rebuild import assign_ranks, group_totals
+from .management.commands.benchmark_api import summarize
+from .management.commands.loadtest import read_response
+from .lean import LeanJSONRenderer, compile_serializer, serialize_rows
+from .native import NativeQuerySet
+from .serializers import (
+    ActivitySerializer, LeaderboardSerializer, TeamSerializer, UserSerializer, WorkoutSerializer
+)
+from .streams import RESYNC, Broadcaster, format_event
 
 
 class TeamModelTest(TestCase):
@@ -106,6 +136,17 @@ class ActivityAPITest(APITestCase):
         response = self.client.get('/api/activities/')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_unknown_user_is_rejected(self):
+        self.client.force_authenticate(user=get_user_model()(username='coach'))
+        response = self.client.post('/api/activities/', {
+            'user_id': 404, 'type': 'running', 'duration': 30, 'distance': 5.0, 'calories': 300,
+            'date': '2024-01-01T10:00:00Z', 'notes': 'Ghost run',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('user_id', response.data)
+        self.assertFalse(Activity.objects.exists())
+        self.assertFalse(Leaderboard.objects.exists())
+
 
 class LeaderboardAPITest(APITestCase):
     def test_leaderboard_list_endpoint(self):
@@ -128,3 +169,1094 @@ class APIRootTest(APITestCase):
         self.assertIn('activities', response.data)
         self.assertIn('leaderboard', response.data)
         self.assertIn('workouts', response.data)
+
+
+class PaginationAPITest(APITestCase):
+    def setUp(self):
+        for _id in range(1, 6):
+            Team.objects.create(
+                _id=_id, name=f'Team {_id}', description='', created_at=datetime.now()
+            )
+
+    def test_list_is_cursor_paginated(self):
+        response = self.client.get('/api/teams/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([team['_id'] for team in response.data['results']], [1, 2])
+        self.assertIsNotNone(response.data['next'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([team['_id'] for team in response.data['results']], [3, 4])
+
+
+class LeaderboardDeltaTest(SimpleTestCase):
+    def test_collect_deltas_nets_added_and_removed(self):
+        added = [
+            {'user_id': 1, 'duration': 30, 'distance': 5.0, 'calories': 300},
+            {'user_id': 2, 'duration': 10, 'distance': 1.0, 'calories': 100},
+        ]
+        removed = [{'user_id': 1, 'duration': 20, 'distance': 2.0, 'calories': 200}]
+        deltas = leaderboard.collect_deltas(added=added, removed=removed)
+        self.assertEqual(deltas[1], {
+            'total_activities': 0, 'total_duration': 10,
+            'total_distance': 3.0, 'total_calories': 100,
+        })
+        self.assertEqual(deltas[2]['total_activities'], 1)
+
+
+class LeaderboardEngineTest(TestCase):
+    def setUp(self):
+        for _id, calories in ((1, 500), (2, 300), (3, 100)):
+            User.objects.create(
+                _id=_id, name=f'User {_id}', email=f'user{_id}@test.com',
+                team_id=1, role='hero', created_at=datetime.now()
+            )
+            Leaderboard.objects.create(
+                _id=_id, user_id=_id, user_name=f'User {_id}', team_id=1,
+                total_activities=1, total_duration=30, total_distance=5.0,
+                total_calories=calories, rank=_id
+            )
+
+    def ranks(self):
+        return {entry.user_id: entry.rank for entry in Leaderboard.objects.all()}
+
+    def activity(self, user_id, calories):
+        return {'user_id': user_id, 'duration': 30, 'distance': 5.0, 'calories': calories}
+
+    def test_moving_up_shifts_only_passed_entries(self):
+        leaderboard.record_activity_change(added=[self.activity(3, 250)])
+        self.assertEqual(self.ranks(), {1: 1, 2: 3, 3: 2})
+        self.assertEqual(Leaderboard.objects.get(user_id=3).total_calories, 350)
+
+    def test_moving_down_on_removal(self):
+        leaderboard.record_activity_change(removed=[self.activity(1, 450)])
+        self.assertEqual(self.ranks(), {1: 3, 2: 1, 3: 2})
+
+    def test_new_user_gets_entry(self):
+        User.objects.create(
+            _id=4, name='User 4', email='user4@test.com',
+            team_id=2, role='hero', created_at=datetime.now()
+        )
+        leaderboard.record_activity_change(added=[self.activity(4, 1000)])
+        self.assertEqual(self.ranks(), {1: 2, 2: 3, 3: 4, 4: 1})
+
+    def test_entry_without_user_is_named_like_the_rebuild(self):
+        leaderboard.record_activity_change(added=[self.activity(5, 50)])
+        entry = Leaderboard.objects.get(user_id=5)
+        self.assertEqual((entry.user_name, entry.team_id, entry.rank), ('User 5', 0, 4))
+
+
+class ActivityBulkAPITest(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model()(username='sync'))
+        User.objects.create(
+            _id=1, name='Test User', email='test@test.com',
+            team_id=1, role='hero', created_at=datetime.now()
+        )
+
+    def activity(self, _id, **overrides):
+        payload = {
+            '_id': _id, 'user_id': 1, 'type': 'running', 'duration': 30,
+            'distance': 5.0, 'calories': 300, 'date': '2024-01-01T10:00:00Z',
+            'notes': 'Synced',
+        }
+        payload.update(overrides)
+        return payload
+
+    def test_bulk_json_array(self):
+        response = self.client.post(
+            '/api/activities/bulk/', [self.activity(1), self.activity(2)], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Activity.objects.count(), 2)
+        self.assertEqual(Leaderboard.objects.get(user_id=1).total_calories, 600)
+
+    def test_bulk_ndjson_reports_errors_per_item(self):
+        body = '\n'.join([
+            json.dumps(self.activity(1)),
+            'not json',
+            json.dumps(self.activity(2, type='skydiving')),
+            json.dumps(self.activity(1)),
+        ])
+        response = self.client.post(
+            '/api/activities/bulk/', body, content_type='application/x-ndjson'
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2, 3])
+
+    def test_non_list_bodies_and_items_are_rejected(self):
+        for body in (5, 'activities', {'user_id': 1}):
+            response = self.client.post('/api/activities/bulk/', body, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/api/activities/bulk/', [5, ['x']], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error['index'] for error in response.data['errors']], [0, 1])
+
+    def test_unknown_users_are_rejected_per_item(self):
+        response = self.client.post(
+            '/api/activities/bulk/', [self.activity(1), self.activity(2, user_id=404)], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['index'], 1)
+        self.assertIn('user_id', response.data['errors'][0]['errors'])
+        self.assertEqual(Leaderboard.objects.get(user_id=1).total_calories, 300)
+
+    def test_allocated_ids_skip_explicit_ids_in_the_batch(self):
+        counter = ids.allocator.allocate(Activity)[0]
+        generated = self.activity(None)
+        del generated['_id']
+        response = self.client.post(
+            '/api/activities/bulk/', [generated, self.activity(counter + 1)], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created'], 2)
+        self.assertGreater(Activity.objects.exclude(_id=counter + 1).get()._id, counter + 1)
+
+
+class IndexSpecTest(SimpleTestCase):
+    def test_hot_query_patterns_are_declared(self):
+        keys = {
+            collection: [list(index.document['key']) for index in indexes]
+            for collection, indexes in declared_indexes().items()
+        }
+        self.assertIn(['user_id', 'date'], keys['activities'])
+        self.assertIn(['team_id'], keys['users'])
+        self.assertIn(['rank'], keys['leaderboard'])
+        self.assertIn(['team_id', 'rank'], keys['leaderboard'])
+
+    def test_email_index_keeps_its_original_name(self):
+        # Databases seeded before indexes were declared already have email_1.
+        names = {index.document['name'] for index in declared_indexes()['users']}
+        self.assertIn('email_1', names)
+
+    def test_covering_requires_index_prefix(self):
+        self.assertTrue(_is_covered(frozenset(['user_id']), ['user_id', 'date']))
+        self.assertTrue(_is_covered(frozenset(['date', 'user_id']), ['user_id', 'date']))
+        self.assertFalse(_is_covered(frozenset(['date']), ['user_id', 'date']))
+
+
+class NativeQuerySetTest(TestCase):
+    def setUp(self):
+        for _id in range(1, 4):
+            Activity.objects.create(
+                _id=_id, user_id=_id, type='running', duration=30, distance=5.0,
+                calories=100 * _id, date=datetime(2024, 1, _id, 10, 0), notes='Run'
+            )
+
+    def test_matches_orm_serialization(self):
+        orm = ActivitySerializer(Activity.objects.order_by('_id'), many=True).data
+        native = ActivitySerializer(NativeQuerySet(Activity).order_by('_id'), many=True).data
+        self.assertEqual(orm, native)
+
+    def test_filter_slice_and_get(self):
+        queryset = NativeQuerySet(Activity).filter(calories__gte='200').order_by('-calories')
+        self.assertEqual([doc['_id'] for doc in queryset], [3, 2])
+        self.assertEqual(queryset.count(), 2)
+        self.assertEqual([doc['_id'] for doc in queryset[1:]], [2])
+        self.assertEqual(NativeQuerySet(Activity).get(pk='1')['calories'], 100)
+        with self.assertRaises(Activity.DoesNotExist):
+            NativeQuerySet(Activity).get(pk=99)
+
+
+class NativeFilterMergeTest(SimpleTestCase):
+    def test_lookups_on_one_field_are_all_kept(self):
+        queryset = NativeQuerySet(Activity).filter(user_id=1, user_id__in=[2, 3])
+        self.assertEqual(queryset.query, {'user_id': {'$eq': 1, '$in': [2, 3]}})
+        queryset = NativeQuerySet(Activity).filter(user_id__in=[2, 3]).filter(user_id=1)
+        self.assertEqual(queryset.query, {'user_id': {'$in': [2, 3], '$eq': 1}})
+
+    def test_repeated_operator_is_anded(self):
+        queryset = NativeQuerySet(Activity).filter(calories__gte=100).filter(calories__gte=200)
+        self.assertEqual(queryset.query, {'calories': {'$gte': 100}, '$and': [{'calories': {'$gte': 200}}]})
+
+
+class ResponseCacheAPITest(APITestCase):
+    def create_workout(self, _id):
+        return Workout.objects.create(
+            _id=_id, name=f'Workout {_id}', type='yoga', difficulty='beginner',
+            duration=30, description='Stretch', exercises=['breathing']
+        )
+
+    def test_etag_and_not_modified(self):
+        self.create_workout(1)
+        response = self.client.get('/api/workouts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+
+        response = self.client.get('/api/workouts/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_write_invalidates_cached_response(self):
+        self.create_workout(1)
+        first = self.client.get('/api/workouts/')
+        self.create_workout(2)
+        second = self.client.get('/api/workouts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(second.content)['results']), 2)
+
+    def test_browsable_api_is_not_cached(self):
+        self.create_workout(1)
+        response = self.client.get('/api/workouts/', HTTP_ACCEPT='text/html')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('ETag', response)
+
+
+class ActivityFilterAPITest(APITestCase):
+    def setUp(self):
+        for _id, team_id in ((1, 1), (2, 2)):
+            User.objects.create(
+                _id=_id, name=f'User {_id}', email=f'user{_id}@test.com',
+                team_id=team_id, role='hero', created_at=datetime.now()
+            )
+        for _id, (user_id, activity_type, day) in enumerate(
+            [(1, 'running', 1), (1, 'yoga', 2), (2, 'running', 3), (2, 'cycling', 4)], 1
+        ):
+            Activity.objects.create(
+                _id=_id, user_id=user_id, type=activity_type, duration=30, distance=5.0,
+                calories=100 * _id, date=datetime(2024, 1, day, 10, 0), notes='Session'
+            )
+
+    def ids(self, **params):
+        response = self.client.get('/api/activities/', params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [activity['_id'] for activity in response.data['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.ids(user_id=1), [2, 1])
+        self.assertEqual(self.ids(team_id=2), [4, 3])
+        self.assertEqual(self.ids(type='running'), [3, 1])
+        self.assertEqual(self.ids(date_after='2024-01-02T00:00:00Z', date_before='2024-01-03T23:59:59Z'), [3, 2])
+        self.assertEqual(self.ids(user_id=1, team_id=1), [2, 1])
+        self.assertEqual(self.ids(user_id=1, team_id=2), [])
+
+    def test_ordering(self):
+        self.assertEqual(self.ids(ordering='calories'), [1, 2, 3, 4])
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/activities/', {'fields': '_id,calories'})
+        self.assertEqual(set(response.data['results'][0]), {'_id', 'calories'})
+
+    def test_invalid_parameters(self):
+        response = self.client.get('/api/activities/', {'fields': 'password'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/activities/', {'type': 'skydiving'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RollupBucketTest(SimpleTestCase):
+    def test_bucket_start(self):
+        date = datetime(2024, 5, 16, 18, 30)  # a Thursday
+        self.assertEqual(rollups.bucket_start(date, 'day'), datetime(2024, 5, 16))
+        self.assertEqual(rollups.bucket_start(date, 'week'), datetime(2024, 5, 13))
+        self.assertEqual(rollups.bucket_start(date, 'month'), datetime(2024, 5, 1))
+
+    def test_accumulate_covers_every_scope_and_type(self):
+        activity = {
+            'user_id': 1, 'type': 'running', 'duration': 30, 'distance': 5.0,
+            'calories': 300, 'date': datetime(2024, 5, 16, 18, 30),
+        }
+        result = rollups.accumulate({}, [activity], {1: 7})
+        # 3 granularities x (user, team, all) x (running, all)
+        self.assertEqual(len(result), 18)
+        team_day = result[rollups.rollup_id('day', datetime(2024, 5, 16), 'team', 7, 'all')]
+        self.assertEqual((team_day['count'], team_day['calories']), (1, 300))
+
+
+class StatsAPITest(APITestCase):
+    def setUp(self):
+        User.objects.create(
+            _id=1, name='Test User', email='test@test.com',
+            team_id=1, role='hero', created_at=datetime.now()
+        )
+        activities = [
+            {'_id': _id, 'user_id': 1, 'type': 'running', 'duration': 30, 'distance': 5.0,
+             'calories': 100, 'date': datetime(2024, 1, day, 10, 0), 'notes': ''}
+            for _id, day in ((1, 1), (2, 2), (3, 9))
+        ]
+        rollups.record_activity_change(added=activities)
+
+    def test_weekly_user_series(self):
+        response = self.client.get('/api/stats/', {'granularity': 'week', 'user_id': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([bucket['count'] for bucket in response.data['results']], [2, 1])
+
+    def test_range_query(self):
+        response = self.client.get('/api/stats/', {
+            'team_id': 1, 'start': '2024-01-02T00:00:00Z', 'end': '2024-01-31T00:00:00Z'
+        })
+        self.assertEqual([bucket['calories'] for bucket in response.data['results']], [100, 100])
+
+
+class TeamLeaderboardAPITest(APITestCase):
+    def setUp(self):
+        for _id, name in ((1, 'Team Marvel'), (2, 'Team DC')):
+            Team.objects.create(_id=_id, name=name, description='', created_at=datetime.now())
+        for _id, team_id, calories in ((1, 1, 500), (2, 1, 300), (3, 2, 700)):
+            User.objects.create(
+                _id=_id, name=f'User {_id}', email=f'user{_id}@test.com',
+                team_id=team_id, role='hero', created_at=datetime.now()
+            )
+            Leaderboard.objects.create(
+                _id=_id, user_id=_id, user_name=f'User {_id}', team_id=team_id,
+                total_activities=1, total_duration=30, total_distance=5.0,
+                total_calories=calories, rank=0
+            )
+        leaderboard.invalidate_team_standings()
+
+    def standings(self):
+        response = self.client.get('/api/teams/leaderboard/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return {team['team_name']: (team['rank'], team['total_calories'], team['member_count'])
+                for team in response.data}
+
+    def test_team_totals(self):
+        self.assertEqual(self.standings(), {'Team Marvel': (1, 800, 2), 'Team DC': (2, 700, 1)})
+
+    def test_refreshed_by_activity_writes(self):
+        self.standings()
+        leaderboard.record_activity_change(added=[
+            {'user_id': 3, 'duration': 30, 'distance': 5.0, 'calories': 200}
+        ])
+        self.assertEqual(self.standings(), {'Team Marvel': (2, 800, 2), 'Team DC': (1, 900, 1)})
+
+
+class SyntheticDataTest(SimpleTestCase):
+    def test_activities_do_not_depend_on_chunking(self):
+        end_date = datetime(2024, 6, 1)
+        whole = synthetic.generate_activities(42, 1, 6, 3, 1, end_date, 30)
+        chunked = (
+            synthetic.generate_activities(42, 1, 2, 3, 1, end_date, 30)
+            + synthetic.generate_activities(42, 3, 4, 3, 7, end_date, 30)
+        )
+        self.assertEqual(whole, chunked)
+        self.assertEqual([activity['_id'] for activity in whole], list(range(1, 19)))
+
+    def test_users_are_spread_over_teams(self):
+        users = synthetic.generate_users(1, 6, 10, 3, datetime(2024, 1, 1))
+        self.assertEqual({user['team_id'] for user in users}, {10, 11, 12})
+
+    def test_sizes_must_be_positive(self):
+        for option in ('--teams', '--chunk-size', '--users', '--days', '--workers', '--activities-per-user'):
+            for value in ('0', '-5'):
+                with self.assertRaises(CommandError):
+                    call_command('populate_db', option, value)
+
+
+class LeaderboardRebuildTest(SimpleTestCase):
+    def test_group_totals(self):
+        keys, counts, totals = group_totals(
+            np.array([3, 1, 3, 2]),
+            {'calories': np.array([100, 200, 300, 400]), 'distance': np.array([1.5, 2.0, 2.5, 3.0])},
+        )
+        self.assertEqual(keys.tolist(), [1, 2, 3])
+        self.assertEqual(counts.tolist(), [1, 1, 2])
+        self.assertEqual(totals['calories'].tolist(), [200, 400, 400])
+        self.assertEqual(totals['distance'].tolist(), [2.0, 3.0, 4.0])
+
+    def test_rank_methods(self):
+        values = np.array([50, 80, 80, 20])
+        ids = np.array([1, 2, 3, 4])
+        self.assertEqual(assign_ranks(values, ids, 'ordinal').tolist(), [3, 1, 2, 4])
+        self.assertEqual(assign_ranks(values, ids, 'competition').tolist(), [3, 1, 1, 4])
+        self.assertEqual(assign_ranks(values, ids, 'dense').tolist(), [2, 1, 1, 3])
+
+    def test_live_board_keeps_ordinal_ranks_on_the_rank_metric(self):
+        with self.assertRaises(ValueError):
+            leaderboard_rebuild.rebuild(method='dense')
+        other = next(field for field in leaderboard_rebuild.METRICS.values()
+                     if field != settings.LEADERBOARD_RANK_METRIC)
+        with self.assertRaises(ValueError):
+            leaderboard_rebuild.rebuild(metric=other)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_leaderboard', '--method', 'competition')
+
+
+class RebuildWatcherTest(TestCase):
+    def test_rebuild_in_another_process_drops_local_state(self):
+        watcher = leaderboard_rebuild.RebuildWatcher()
+        with mock.patch.object(leaderboard_rebuild, 'drop_local_state') as drop:
+            watcher.check()
+            mongo.get_db()[leaderboard_rebuild.MARKERS_COLLECTION].update_one(
+                {'_id': leaderboard_rebuild.MARKER_ID}, {'$inc': {'generation': 1}}, upsert=True
+            )
+            watcher.check()  # within LEADERBOARD_REBUILD_CHECK_SECONDS
+            drop.assert_not_called()
+            watcher.checked_at = None
+            watcher.check()
+            drop.assert_called_once()
+
+
+class WindowBoardTest(SimpleTestCase):
+    def test_window_start(self):
+        today = datetime(2024, 5, 16)  # a Thursday
+        self.assertEqual(windows.window_start('7d', today), datetime(2024, 5, 10))
+        self.assertEqual(windows.window_start('week', today), datetime(2024, 5, 13))
+        self.assertEqual(windows.window_start('month', today), datetime(2024, 5, 1))
+        for window in ('0d', '9999d', 'year'):
+            with self.assertRaises(ValueError):
+                windows.window_start(window, today)
+
+    def test_expired_days_are_subtracted(self):
+        board = windows.SlidingWindowBoard('7d')
+        board.start = datetime(2024, 5, 10)
+        board._add(1, datetime(2024, 5, 10), [1, 30, 5.0, 300])
+        board._add(1, datetime(2024, 5, 12), [1, 30, 5.0, 100])
+        board._add(2, datetime(2024, 5, 11), [1, 30, 5.0, 200])
+        board._add(2, datetime(2024, 5, 1), [1, 30, 5.0, 900])
+        self.assertEqual([user_id for user_id, _ in sorted(board.totals.items(),
+                          key=lambda item: -item[1][3])], [1, 2])
+        board._advance(datetime(2024, 5, 17))
+        self.assertEqual(board.totals, {1: [1, 30, 5.0, 100], 2: [1, 30, 5.0, 200]})
+        board._advance(datetime(2024, 5, 18))
+        self.assertEqual(board.totals, {1: [1, 30, 5.0, 100]})
+
+    def test_board_due_for_reseed_skips_deltas(self):
+        board = windows.SlidingWindowBoard('7d')
+        board.seeded_at = -1e9  # long overdue: the next read reseeds from the rollups
+        board.apply([{'user_id': 1, 'date': datetime.now(timezone.utc), 'duration': 30,
+                      'distance': 5.0, 'calories': 300}], 1)
+        self.assertEqual(board.totals, {})
+
+    def test_equivalent_windows_share_a_board(self):
+        self.assertIs(windows.get_board('007d'), windows.get_board('7d'))
+        self.assertEqual(windows.normalize_window('month'), 'month')
+
+
+class WindowedLeaderboardAPITest(APITestCase):
+    def setUp(self):
+        today = datetime.utcnow()
+        for _id in (1, 2):
+            User.objects.create(
+                _id=_id, name=f'User {_id}', email=f'user{_id}@test.com',
+                team_id=1, role='hero', created_at=datetime.now()
+            )
+        activities = [
+            {'_id': _id, 'user_id': user_id, 'type': 'running', 'duration': 30, 'distance': 5.0,
+             'calories': calories, 'date': today - timedelta(days=days_ago), 'notes': ''}
+            for _id, user_id, calories, days_ago in ((1, 1, 100, 1), (2, 2, 900, 40), (3, 2, 50, 2))
+        ]
+        rollups.record_activity_change(added=activities)
+        windows._boards.clear()
+
+    def test_rolling_window(self):
+        response = self.client.get('/api/leaderboard/', {'window': '7d'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(entry['user_id'], entry['rank'], entry['total_calories'])
+             for entry in response.data['results']],
+            [(1, 1, 100), (2, 2, 50)],
+        )
+
+    def test_pages_follow_cursors(self):
+        first = self.client.get('/api/leaderboard/', {'window': '7d', 'page_size': 1}).json()
+        self.assertEqual(set(first), {'next', 'previous', 'results'})
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in first['results']], [(1, 1)])
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in second['results']], [(2, 2)])
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(second['previous']).json()['results'], first['results'])
+
+    def test_cached_board_follows_the_window_start(self):
+        self.assertEqual(len(self.client.get('/api/leaderboard/', {'window': '7d'}).data['results']), 2)
+        later = windows._today() + timedelta(days=7)
+        with mock.patch.object(windows, '_today', return_value=later):
+            response = self.client.get('/api/leaderboard/', {'window': '7d'})
+        self.assertEqual(response.json()['results'], [])
+
+    def test_invalid_window(self):
+        response = self.client.get('/api/leaderboard/', {'window': 'fortnight'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class RankQueryAPITest(APITestCase):
+    def setUp(self):
+        for _id, calories in ((1, 100), (2, 500), (3, 300), (4, 300), (5, 50)):
+            Leaderboard.objects.create(
+                _id=_id, user_id=_id, user_name=f'User {_id}', team_id=1,
+                total_activities=1, total_duration=30, total_distance=5.0,
+                total_calories=calories, rank=0
+            )
+        rank_index.reset()
+
+    def test_top_k(self):
+        response = self.client.get('/api/leaderboard/top/', {'k': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(entry['user_id'], entry['rank']) for entry in response.data],
+                         [(2, 1), (3, 2), (4, 3)])
+
+    def test_rank_with_neighbors(self):
+        response = self.client.get('/api/leaderboard/rank/4/', {'neighbors': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['rank'], 3)
+        self.assertEqual([entry['user_id'] for entry in response.data['results']], [3, 4, 1])
+
+    def test_follows_leaderboard_updates(self):
+        self.client.get('/api/leaderboard/top/')
+        entry = Leaderboard.objects.get(_id=5)
+        entry.total_calories = 1000
+        entry.save()
+        leaderboard.leaderboard_changed.send(
+            sender=Leaderboard, changes=[leaderboard.RankChange(5, 5, 1)], team_deltas={}
+        )
+        response = self.client.get('/api/leaderboard/rank/5/')
+        self.assertEqual(response.data['rank'], 1)
+
+    def test_unranked_user(self):
+        response = self.client.get('/api/leaderboard/rank/99/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AsyncReadAPITest(TestCase):
+    def setUp(self):
+        for _id in (1, 2, 3):
+            Activity.objects.create(
+                _id=_id, user_id=1, type='running', duration=30, distance=5.0,
+                calories=100, date=datetime(2024, 1, _id), notes=''
+            )
+
+    async def test_list_matches_sync_endpoint(self):
+        response = await self.async_client.get('/api/async/activities/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([activity['_id'] for activity in response.json()['results']], [3, 2])
+
+    async def test_retrieve(self):
+        response = await self.async_client.get('/api/async/activities/2/')
+        self.assertEqual(response.json()['_id'], 2)
+
+
+class LoadTestClientTest(SimpleTestCase):
+    def parse(self, raw):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(raw)
+            reader.feed_eof()
+            return await read_response(reader), await reader.read()
+        return asyncio.run(read())
+
+    def test_content_length_response(self):
+        self.assertEqual(
+            self.parse(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}HTTP/1.1'),
+            (200, b'HTTP/1.1'),
+        )
+
+    def test_chunked_response(self):
+        self.assertEqual(
+            self.parse(b'HTTP/1.1 404 Not Found\r\nTransfer-Encoding: chunked\r\n\r\n'
+                       b'2\r\n{}\r\n0\r\n\r\n'),
+            (404, b''),
+        )
+
+
+class BroadcasterTest(SimpleTestCase):
+    def test_slow_subscriber_is_told_to_resync(self):
+        async def scenario():
+            broadcaster = Broadcaster(queue_size=2)
+            fast, slow = broadcaster.subscribe(), broadcaster.subscribe()
+            for number in range(3):
+                broadcaster.publish('rank', {'n': number})
+                await asyncio.sleep(0)
+                if number < 2:
+                    await fast.get()
+            await asyncio.sleep(0)
+            return (await fast.get())['data'], [slow.get_nowait() for _ in range(slow.qsize())]
+        latest, backlog = asyncio.run(scenario())
+        self.assertEqual(latest, {'n': 2})
+        self.assertEqual(backlog, [RESYNC])
+
+    def test_format_event(self):
+        self.assertEqual(
+            format_event({'id': 7, 'event': 'rank', 'data': {'changes': []}}),
+            b'id: 7\nevent: rank\ndata: {"changes": []}\n\n',
+        )
+
+
+class ExportFormatTest(SimpleTestCase):
+    def test_csv_chunks_are_gzipped_incrementally(self):
+        formatters = exports._formatters(LeaderboardSerializer, ['user_id', 'user_name'])
+        documents = ({'user_id': _id, 'user_name': f'User, {_id}'} for _id in range(1, 6))
+        chunks = list(exports.chunked(exports.csv_rows(documents, formatters), 2))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(b''.join(chunks).decode().splitlines()[:2], ['user_id,user_name', '1,"User, 1"'])
+        self.assertEqual(gzip.decompress(b''.join(exports.gzipped(iter(chunks)))), b''.join(chunks))
+
+
+class ExportAPITest(APITestCase):
+    def setUp(self):
+        for _id in (1, 2, 3):
+            Activity.objects.create(
+                _id=_id, user_id=_id % 2, type='running', duration=30, distance=5.0,
+                calories=100, date=datetime(2024, 1, _id), notes=''
+            )
+
+    def test_filtered_ndjson_export(self):
+        response = self.client.get('/api/activities/export/', {
+            'format': 'ndjson', 'user_id': 1, 'fields': '_id,calories', 'ordering': '_id'
+        })
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{'_id': 1, 'calories': 100}, {'_id': 3, 'calories': 100}])
+
+    def test_invalid_format(self):
+        response = self.client.get('/api/activities/export/', {'format': 'xml'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+GPX_TRACK = b"""<?xml version="1.0"?>
+<gpx version="1.1" xmlns="http://www.topografix.com/GPX/1/1">
+  <trk><name>Morning Run</name><type>Run</type><trkseg>
+    <trkpt lat="47.00" lon="8.0"><time>2024-03-01T07:00:00Z</time></trkpt>
+    <trkpt lat="47.01" lon="8.0"><time>2024-03-01T07:05:00Z</time></trkpt>
+    <trkpt lat="47.02" lon="8.0"><time>2024-03-01T07:10:00Z</time></trkpt>
+  </trkseg></trk>
+</gpx>
+"""
+
+
+class ActivityImportTest(SimpleTestCase):
+    def test_gpx_track_summary(self):
+        with tempfile.NamedTemporaryFile(suffix='.gpx') as gpx:
+            gpx.write(GPX_TRACK)
+            gpx.flush()
+            tracks = list(importers.read_gpx(gpx.name))
+        self.assertEqual(len(tracks), 1)
+        payload = importers.gpx_payload(tracks[0], user_id=7)
+        self.assertEqual((payload['type'], payload['duration'], payload['distance']), ('running', 10, 2.22))
+        self.assertEqual(payload['notes'], 'Morning Run')
+
+    def test_validate_chunk_reports_records(self):
+        good = {'_id': 1, 'user_id': 1, 'type': 'yoga', 'duration': 30, 'distance': 0,
+                'calories': 90, 'date': '2024-01-01T08:00:00Z', 'notes': 'flow'}
+        documents, errors = importers.validate_chunk('ndjson', [
+            (1, json.dumps(good).encode()),
+            (2, b'{not json'),
+            (3, json.dumps(dict(good, _id=2, type='bogus')).encode()),
+        ], {})
+        self.assertEqual([document['_id'] for document in documents], [1])
+        self.assertEqual([error['record'] for error in errors], [2, 3])
+
+    def test_csv_records_are_parsed_by_the_workers(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as source:
+            source.write(
+                b'_id,user_id,type,duration,distance,calories,date,notes\n'
+                b'1,1,yoga,30,0,90,2024-01-01T08:00:00Z,"flow, then\n""rest"""\n'
+                b'\n'
+                b'2,1,bogus,30,0,90,2024-01-01T09:00:00Z,x\n'
+            )
+            source.flush()
+            fields = importers.csv_header(source.name)
+            records = list(enumerate(importers.read_csv(source.name), 1))
+        self.assertEqual(len(records), 2)
+        documents, errors = importers.validate_chunk('csv', records, {'csv_fields': fields})
+        self.assertEqual([document['notes'] for document in documents], ['flow, then\n"rest"'])
+        self.assertEqual([error['record'] for error in errors], [2])
+
+    def test_sizes_must_be_positive(self):
+        with tempfile.NamedTemporaryFile(suffix='.ndjson') as source:
+            for option in ('--chunk-size', '--workers'):
+                with self.assertRaises(CommandError):
+                    call_command('import_activities', source.name, option, '0', stdout=io.StringIO())
+
+
+def sample_activities(count):
+    return [
+        {'_id': _id, 'user_id': _id % 7, 'type': ['running', 'yoga', 'swimming'][_id % 3],
+         'duration': 30 + _id % 50, 'distance': _id / 7, 'calories': 100 + _id,
+         'date': datetime(2024, 1, 1, 6, 30) + timedelta(minutes=_id, milliseconds=_id % 1000),
+         'notes': f'Séance {_id} \u2028 🏃' if _id % 2 else ''}
+        for _id in range(1, count + 1)
+    ]
+
+
+class LeanSerializerParityTest(SimpleTestCase):
+    def assertParity(self, serializer_class, items):
+        expected = serializer_class(items, many=True).data
+        self.assertIsNotNone(compile_serializer(serializer_class()))
+        self.assertEqual(serialize_rows(serializer_class(), items), expected)
+        self.assertEqual(LeanJSONRenderer().render(expected), JSONRenderer().render(expected))
+
+    def test_activities(self):
+        activities = sample_activities(50)
+        activities[0]['date'] = datetime(2024, 5, 1, 12, 0, tzinfo=timezone(timedelta(hours=2)))
+        self.assertParity(ActivitySerializer, activities)
+
+    def test_users_and_teams(self):
+        created_at = datetime(2024, 2, 29, 23, 59, 59, 999000)
+        self.assertParity(UserSerializer, [
+            {'_id': 1, 'name': 'Zoë', 'email': 'zoe@example.com', 'team_id': 2,
+             'role': 'hero', 'created_at': created_at},
+        ])
+        self.assertParity(TeamSerializer, [
+            {'_id': 2, 'name': 'Team DC', 'description': 'Justice', 'created_at': created_at},
+        ])
+
+    def test_leaderboard_instances(self):
+        self.assertParity(LeaderboardSerializer, [
+            Leaderboard(_id=1, user_id=1, user_name='Tony', team_id=1, total_activities=3,
+                        total_duration=90, total_distance=12.35, total_calories=900, rank=1),
+        ])
+
+    def test_large_page(self):
+        activities = sample_activities(2000)
+        self.assertEqual(
+            LeanJSONRenderer().render(serialize_rows(ActivitySerializer(), activities)),
+            JSONRenderer().render(ActivitySerializer(activities, many=True).data),
+        )
+
+    def test_floats_drf_writes_with_an_exponent(self):
+        data = {'large': 1e16, 'small': 0.00001, 'plain': 12.35, 'zero': 0.0, 'nested': [-2.5e-7]}
+        self.assertEqual(LeanJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_non_finite_floats_are_rejected_like_drf(self):
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                JSONRenderer().render({'value': value})
+            with self.assertRaises(ValueError):
+                LeanJSONRenderer().render({'value': value})
+
+    def test_unsupported_fields_fall_back(self):
+        self.assertIsNone(compile_serializer(WorkoutSerializer()))
+
+    def test_missing_field_falls_back(self):
+        activity = sample_activities(1)[0]
+        del activity['notes']
+        with self.assertRaises(KeyError):
+            ActivitySerializer([activity], many=True).data
+        with self.assertRaises(KeyError):
+            serialize_rows(ActivitySerializer(), [activity])
+
+
+class IdAllocationTest(APITestCase):
+    def setUp(self):
+        self.client.force_authenticate(user=get_user_model()(username='coach'))
+        Team.objects.create(_id=5, name='Team Marvel', description='', created_at=datetime.now())
+
+    def test_allocators_hand_out_disjoint_blocks(self):
+        first, second = ids.IdAllocator(block_size=3), ids.IdAllocator(block_size=3)
+        allocated = first.allocate(Team, 2) + second.allocate(Team, 2) + first.allocate(Team, 2)
+        self.assertEqual(len(set(allocated)), 6)
+        self.assertGreater(min(allocated), 5)
+
+    def test_ranges_sync_the_counter_once_per_process(self):
+        allocator = ids.IdAllocator()
+        with mock.patch.object(ids, 'sync_counter', wraps=ids.sync_counter) as sync:
+            first = allocator.reserve_range(Team, 3)
+            second = allocator.reserve_range(Team, 3)
+        self.assertEqual(sync.call_count, 1)
+        self.assertGreater(first, 5)
+        self.assertEqual(second, first + 3)
+
+    def test_create_ignores_client_ids(self):
+        created = [
+            self.client.post('/api/teams/', {
+                '_id': 5, 'name': name, 'description': 'Justice League', 'created_at': '2024-01-01T00:00:00Z'
+            }, format='json')
+            for name in ('Team DC', 'Team X')
+        ]
+        self.assertEqual([response.status_code for response in created], [status.HTTP_201_CREATED] * 2)
+        new_ids = [response.data['_id'] for response in created]
+        self.assertNotIn(5, new_ids)
+        self.assertEqual(Team.objects.filter(_id__in=new_ids).count(), 2)
+
+
+class ExpandAPITest(APITestCase):
+    def setUp(self):
+        Team.objects.create(_id=1, name='Team Marvel', description='', created_at=datetime.now())
+        User.objects.create(
+            _id=1, name='Tony Stark', email='tony@marvel.com', team_id=1,
+            role='hero', created_at=datetime.now()
+        )
+        for _id in (1, 2):
+            Activity.objects.create(
+                _id=_id, user_id=1, type='running', duration=30, distance=5.0,
+                calories=300, date=datetime(2024, 1, _id, tzinfo=timezone.utc), notes=''
+            )
+
+    def test_activities_embed_user_and_team(self):
+        response = self.client.get('/api/activities/', {'expand': 'user,team'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for row in response.json()['results']:
+            self.assertEqual(row['user']['name'], 'Tony Stark')
+            self.assertEqual(row['team']['name'], 'Team Marvel')
+
+    def test_renamed_team_is_not_served_from_cache(self):
+        self.client.get('/api/users/', {'expand': 'team'})
+        Team.objects.filter(_id=1).update(name='Avengers')
+        Team.objects.get(_id=1).save()
+        response = self.client.get('/api/users/1/', {'expand': 'team'})
+        self.assertEqual(response.json()['team']['name'], 'Avengers')
+
+    def test_renamed_team_is_not_served_from_the_leaderboard_cache(self):
+        Leaderboard.objects.create(
+            _id=1, user_id=1, user_name='Tony Stark', team_id=1, total_activities=2,
+            total_duration=60, total_distance=10.0, total_calories=600, rank=1
+        )
+        first = self.client.get('/api/leaderboard/', {'expand': 'team'})
+        self.assertEqual(first.json()['results'][0]['team']['name'], 'Team Marvel')
+        team = Team.objects.get(_id=1)
+        team.name = 'Avengers'
+        team.save()
+        response = self.client.get('/api/leaderboard/', {'expand': 'team'})
+        self.assertEqual(response.json()['results'][0]['team']['name'], 'Avengers')
+
+    def test_unknown_expansion_is_rejected(self):
+        response = self.client.get('/api/users/', {'expand': 'user'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('expand', response.json())
+
+
+class InstrumentationTest(SimpleTestCase):
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_mongo_commands_and_phases_are_charged_to_the_route(self):
+        listener = metrics.CommandListener()
+
+        def view(request):
+            event = type('Event', (), {'command_name': 'find', 'duration_micros': 2000})()
+            listener.succeeded(event)
+            listener.succeeded(event)
+            with metrics.phase('serialize'):
+                pass
+            return HttpResponse(b'[]')
+
+        request = type('Request', (), {'method': 'GET', 'resolver_match': None})()
+        with self.settings(SLOW_REQUEST_SECONDS=60):
+            metrics.InstrumentationMiddleware(view)(request)
+
+        text = metrics.registry.exposition()
+        self.assertIn(
+            'octofit_mongo_commands_total{method="GET",route="unmatched",command="find"} 2', text
+        )
+        self.assertIn('octofit_request_duration_seconds_count{method="GET",route="unmatched"} 1', text)
+        self.assertIn('octofit_response_size_bytes_sum{method="GET",route="unmatched"} 2', text)
+        self.assertIn('octofit_phase_seconds_total{method="GET",route="unmatched",phase="serialize"}', text)
+
+    def test_async_requests_stay_async(self):
+        async def view(request):
+            return HttpResponse(b'{}')
+
+        middleware = metrics.InstrumentationMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        request = type('Request', (), {'method': 'GET', 'resolver_match': None})()
+        with self.settings(SLOW_REQUEST_SECONDS=60):
+            asyncio.run(middleware(request))
+        self.assertIn('octofit_request_duration_seconds_count{method="GET",route="unmatched"} 1',
+                      metrics.registry.exposition())
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn('route="api-root"', response.content.decode())
+
+
+class BenchmarkSummaryTest(SimpleTestCase):
+    def test_percentiles_and_throughput(self):
+        latencies = [float(ms) for ms in range(1, 101)]
+        result = summarize(latencies, errors=3, elapsed=2.0, sizes=[100] * 100)
+        self.assertEqual(result['requests'], 100)
+        self.assertEqual(result['errors'], 3)
+        self.assertEqual(result['throughput'], 50.0)
+        self.assertAlmostEqual(result['p50_ms'], 50.5)
+        self.assertLess(result['p95_ms'], result['p99_ms'])
+
+    def test_too_few_samples(self):
+        self.assertEqual(summarize([1.0], errors=0, elapsed=1.0, sizes=[10]), {'requests': 1, 'errors': 0})
+
+
+class MongoClientLifecycleTest(SimpleTestCase):
+    def event(self, **attributes):
+        return type('Event', (), {'address': ('db', 27017), **attributes})()
+
+    def test_pool_stats_track_saturation(self):
+        stats = mongo.PoolStats()
+        stats.connection_created(self.event())
+        stats.connection_check_out_started(self.event())
+        stats.connection_checked_out(self.event())
+        stats.connection_check_out_started(self.event())
+        stats.connection_check_out_failed(self.event(reason='timeout'))
+        pool = stats.snapshot()['db:27017']
+        self.assertEqual((pool['open'], pool['in_use'], pool['waiting'], pool['checkouts']), (1, 1, 0, 1))
+        self.assertEqual(pool['failures'], {'timeout': 1})
+
+    def test_client_options_come_from_settings(self):
+        with self.settings(MONGODB_MAX_POOL_SIZE=7, MONGODB_READ_PREFERENCE='secondaryPreferred',
+                           MONGODB_COMPRESSORS='zlib'):
+            options = mongo.client_options()
+        self.assertEqual(options['maxPoolSize'], 7)
+        self.assertEqual(options['readPreference'], 'secondaryPreferred')
+        self.assertEqual(options['compressors'], 'zlib')
+        self.assertIn(mongo.pool_stats, options['event_listeners'])
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork()')
+    def test_forked_child_drops_the_parent_client(self):
+        previous, mongo._client = mongo._client, object()
+        try:
+            pid = os.fork()
+            if pid == 0:
+                os._exit(0 if mongo._client is None else 1)
+            _, status = os.waitpid(pid, 0)
+            self.assertEqual(os.waitstatus_to_exitcode(status), 0)
+        finally:
+            mongo._client = previous
+
+
+class ReplicaRoutingTest(SimpleTestCase):
+    def test_router_follows_the_replica_scope(self):
+        router = replicas.ReplicaRouter()
+        with self.settings(MONGODB_REPLICA_READS=True):
+            self.assertEqual(router.db_for_read(Activity), 'default')
+            with mongo.replica_reads():
+                self.assertEqual(router.db_for_read(Activity), 'replica')
+                self.assertEqual(router.db_for_write(Activity), 'default')
+                self.assertEqual(router.db_for_read(Activity), 'default')
+
+    def test_read_only_database_uses_bounded_secondaries(self):
+        with self.settings(MONGODB_REPLICA_READS=True, MONGODB_REPLICA_MAX_STALENESS_SECONDS=90):
+            preference = mongo.get_db(read_only=True).read_preference
+            self.assertEqual((preference.name, preference.max_staleness), ('SecondaryPreferred', 90))
+            with mongo.replica_reads():
+                self.assertEqual(mongo.get_db(read_only=False).read_preference.name, 'Primary')
+        with mongo.replica_reads():
+            self.assertEqual(mongo.get_db().read_preference.name, 'Primary')
+
+    def test_middleware_pins_clients_after_a_write(self):
+        seen = []
+
+        def view(request):
+            seen.append(mongo.replica_reads_active())
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        middleware = replicas.ReplicaRoutingMiddleware(view)
+        factory = RequestFactory()
+        with self.settings(MONGODB_REPLICA_READS=True):
+            middleware(factory.get('/api/activities/'))
+            response = middleware(factory.post('/api/activities/'))
+            factory.cookies[replicas.PIN_COOKIE] = '1'
+            middleware(factory.get('/api/activities/'))
+        self.assertEqual(seen, [True, False, False])
+        self.assertEqual(response.cookies[replicas.PIN_COOKIE]['max-age'], 120)
+
+    def test_middleware_is_async_capable(self):
+        async def view(request):
+            return HttpResponse(mongo.replica_reads_active())
+
+        middleware = replicas.ReplicaRoutingMiddleware(view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        with self.settings(MONGODB_REPLICA_READS=True):
+            response = asyncio.run(middleware(RequestFactory().get('/api/async/activities/')))
+        self.assertEqual(response.content, b'True')
+
+    def test_secondary_reads_use_the_replica_database_name(self):
+        with self.settings(MONGODB_REPLICA_READS=True), \
+                mock.patch.dict(settings.DATABASES['replica'], NAME='octofit_copy'):
+            self.assertEqual(mongo.get_db(read_only=True).name, 'octofit_copy')
+
+
+class RecommendationScoringTest(SimpleTestCase):
+    workouts = [
+        {'_id': 1, 'type': 'running', 'difficulty': 'advanced', 'duration': 60},
+        {'_id': 2, 'type': 'yoga', 'difficulty': 'beginner', 'duration': 30},
+        {'_id': 3, 'type': 'mixed', 'difficulty': 'intermediate', 'duration': 45},
+    ]
+
+    def test_profiles_follow_the_activity_mix(self):
+        profiles = recommendations.build_profiles([
+            {'user_id': 7, 'type': 'running', 'count': 12, 'duration': 720, 'calories': 8640},
+        ], user_ids=[3], window_days=28)
+        self.assertEqual(profiles['user_id'].tolist(), [3, 7])
+        self.assertEqual(profiles['session'].tolist(), [30, 60])
+        self.assertEqual(profiles['level'].round(2).tolist(), [0, 1.6])
+        self.assertAlmostEqual(float(profiles['mix'][1] @ profiles['mix'][1]), 1.0)
+
+    def test_scores_rank_matching_workouts_first(self):
+        profiles = recommendations.build_profiles([
+            {'user_id': 1, 'type': 'running', 'count': 12, 'duration': 720, 'calories': 8640},
+            {'user_id': 2, 'type': 'yoga', 'count': 4, 'duration': 120, 'calories': 360},
+        ], window_days=28)
+        catalog = recommendations.build_catalog(self.workouts)
+        scores = recommendations.score(profiles, catalog)
+        self.assertEqual(scores.shape, (2, 3))
+        self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+        best = recommendations.top(scores, catalog['_id'], 2)
+        self.assertEqual(catalog['_id'][best].tolist(), [[1, 3], [2, 3]])
+
+    def test_lists_are_cached_per_day(self):
+        first, second = datetime(2024, 5, 1, 23, 59), datetime(2024, 5, 2, 0, 1)
+        self.assertNotEqual(
+            recommendations._key(1, 1, recommendations._today(first)),
+            recommendations._key(1, 1, recommendations._today(second)),
+        )
+
+    def test_ties_are_broken_by_workout_id(self):
+        scores = np.array([[0.5, 0.9, 0.5]])
+        self.assertEqual(recommendations.top(scores, np.array([9, 4, 2]), 3).tolist(), [[1, 2, 0]])
+
+
+class RecommendedWorkoutsAPITest(APITestCase):
+    def setUp(self):
+        User.objects.create(
+            _id=1, name='Tony Stark', email='tony@marvel.com', team_id=1,
+            role='hero', created_at=datetime.now()
+        )
+        for _id, workout_type in ((1, 'running'), (2, 'yoga')):
+            Workout.objects.create(
+                _id=_id, name=workout_type, type=workout_type, difficulty='beginner',
+                duration=30, description='', exercises=[]
+            )
+        # Allocated ids, so the activity created through the API cannot collide.
+        Activity.objects.create(
+            _id=ids.next_id(Activity), user_id=1, type='yoga', duration=30, distance=0.0,
+            calories=100, date=datetime.now(timezone.utc), notes=''
+        )
+
+    def test_recommendations_are_cached_until_the_user_logs_activity(self):
+        url = '/api/users/1/recommended-workouts/'
+        first = self.client.get(url).json()['results']
+        self.assertEqual([row['_id'] for row in first], [2, 1])
+
+        # Written behind the API's back: nothing announces it, so the list stays cached.
+        Activity.objects.create(
+            _id=ids.next_id(Activity), user_id=1, type='running', duration=300, distance=50.0,
+            calories=3000, date=datetime.now(timezone.utc), notes=''
+        )
+        self.assertEqual(self.client.get(url).json()['results'], first)
+
+        self.client.force_authenticate(user=get_user_model()(username='coach'))
+        created = self.client.post('/api/activities/', {
+            'user_id': 1, 'type': 'running', 'duration': 300, 'distance': 50.0, 'calories': 3000,
+            'date': datetime.now(timezone.utc).isoformat(), 'notes': 'Long run',
+        }, format='json')
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([row['_id'] for row in self.client.get(url).json()['results']], [1, 2])
+
+    def test_import_refreshes_the_users_lists(self):
+        url = '/api/users/1/recommended-workouts/'
+        self.assertEqual([row['_id'] for row in self.client.get(url).json()['results']], [2, 1])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'activities.ndjson')
+            with open(path, 'w') as source:
+                source.write(json.dumps({
+                    'user_id': 1, 'type': 'running', 'duration': 300, 'distance': 50.0,
+                    'calories': 3000, 'date': datetime.now(timezone.utc).isoformat(), 'notes': 'Long run',
+                }) + '\n')
+            call_command('import_activities', path, '--workers', '1', stdout=io.StringIO())
+        self.assertEqual([row['_id'] for row in self.client.get(url).json()['results']], [1, 2])
+
+    def test_rebuild_loads_the_catalog_once(self):
+        User.objects.create(
+            _id=2, name='Bruce Banner', email='bruce@marvel.com', team_id=1,
+            role='hero', created_at=datetime.now()
+        )
+        with mock.patch.object(recommendations, 'load_catalog', wraps=recommendations.load_catalog) as load:
+            self.assertEqual(recommendations.rebuild(batch_size=1), 2)
+        load.assert_called_once()
+
+    def test_k_limits_results_and_unknown_users_are_404(self):
+        self.assertEqual(len(self.client.get('/api/users/1/recommended-workouts/', {'k': 1}).json()['results']), 1)
+        self.assertEqual(self.client.get('/api/users/9/recommended-workouts/').status_code, status.HTTP_404_NOT_FOUND)
@@ -21,12 +21,14 @@ from rest_framework.response import Response
 from rest_framework.reverse import reverse
 import os
 
+from .metrics import metrics_view
 from .views import (
     TeamViewSet,
     UserViewSet,
     ActivityViewSet,
     LeaderboardViewSet,
-    WorkoutViewSet
+    WorkoutViewSet,
+    StatsView
 )
 
 # REST API endpoint format for GitHub Codespaces:
@@ -62,6 +64,7 @@ def api_root(request, format=None):
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
+        'stats': reverse('stats', request=request, format=format),
     })
 
 
@@ -69,5 +72,8 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', api_root, name='api-root'),
     path('api/', api_root, name='api-root'),
+    path('api/stats/', StatsView.as_view(), name='stats'),
+    path('metrics', metrics_view, name='metrics'),
+    path('api/async/', include('octofit_tracker.async_views')),
     path('api/', include(router.urls)),
 ]
@@ -1,13 +1,41 @@
-from rest_framework import viewsets
+from collections.abc import Iterator
+from copy import copy
+
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from .models import Team, User, Activity, Leaderboard, Workout
 from .serializers import (
     TeamSerializer, 
     UserSerializer, 
     ActivitySerializer, 
     LeaderboardSerializer, 
-    WorkoutSerializer
+    WorkoutSerializer,
+    TeamStandingSerializer,
+    ActivityRollupSerializer,
+    StatsQuerySerializer,
+    TopQuerySerializer,
+    RankQuerySerializer,
+    RecommendationQuerySerializer,
+    ExportQuerySerializer,
+    parse_fields
 )
+from . import leaderboard, leaderboard_rebuild, recommendations, rollups, windows
+from .rank_index import index as rank_index
+from .expand import ExpandMixin
+from .exports import ExportNegotiation, export_response
+from .filters import ActivityFilterBackend, StableOrderingFilter
+from .ids import AllocatedIdMixin, next_id
+from .ingest import ingest_activities
+from .lean import LeanListMixin
+from .native import NativeQuerySet, NativeReadMixin
+from .pagination import RankedListPagination
+from .response_cache import CachedResponseMixin
+from .signals import activities_changed
+from .parsers import NDJSONParser
 
 # NOTE: User registration validation endpoint is not yet implemented.
 # The PR title mentions "Add registration validation and more activities" but
@@ -19,31 +47,221 @@ from .serializers import (
 # - Custom user creation logic with proper error handling
 
 
-class TeamViewSet(viewsets.ModelViewSet):
+class TeamViewSet(AllocatedIdMixin, LeanListMixin, viewsets.ModelViewSet):
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering = '_id'
+
+    @action(detail=False, url_path='leaderboard')
+    def standings(self, request):
+        """Per-team totals, member counts and ranks, aggregated server-side."""
+        leaderboard_rebuild.watcher.check()
+        return Response(TeamStandingSerializer(leaderboard.team_standings(), many=True).data)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(AllocatedIdMixin, ExpandMixin, LeanListMixin, NativeReadMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering = '_id'
+    expandable = ('team',)
+    native_read_actions = ('list', 'retrieve', 'recommended_workouts')
+
+    @action(detail=True, url_path='recommended-workouts')
+    def recommended_workouts(self, request, pk=None):
+        """
+        The ?k= workouts that best fit this user's recent activity mix,
+        session length and intensity, best first, each with its score.
+        """
+        params = RecommendationQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        self.get_object()  # 404 for unknown users
+        user_id = int(pk)
+        rows = recommendations.recommended_workouts(user_id)
+        return Response({'user_id': user_id, 'results': rows[:params.validated_data['k']]})
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(ExpandMixin, LeanListMixin, NativeReadMixin, viewsets.ModelViewSet):
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering = ('-date', '-_id')
+    filter_backends = [ActivityFilterBackend, StableOrderingFilter]
+    ordering_fields = ['_id', 'date', 'duration', 'distance', 'calories', 'type', 'user_id']
+    expandable = ('user', 'team')
+
+    # Every write announces its delta so the leaderboard and rollups stay
+    # current without a full recompute.
+    def perform_create(self, serializer):
+        activity = serializer.save(_id=next_id(Activity))
+        activities_changed.send(sender=Activity, added=[activity], removed=[])
+
+    def perform_update(self, serializer):
+        previous = copy(serializer.instance)
+        activity = serializer.save()
+        activities_changed.send(sender=Activity, added=[activity], removed=[previous])
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        activities_changed.send(sender=Activity, added=[], removed=[instance])
 
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser])
+    def bulk(self, request):
+        """
+        Ingest a JSON array or an NDJSON stream of activities in batched
+        inserts, reporting validation and write errors per item.
+        """
+        items = request.data
+        # A JSON array, or the lazy line iterator of an NDJSON body. Items
+        # that are not objects are reported per item by the serializer.
+        if not isinstance(items, (list, Iterator)):
+            return Response(
+                {'detail': 'Expected a list of activities.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            chunk_size = max(int(request.query_params.get('chunk_size', 0)), 0) or None
+        except ValueError:
+            return Response(
+                {'detail': 'chunk_size must be an integer.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+        result = ingest_activities(items, chunk_size=chunk_size)
+        if not result['errors']:
+            response_status = status.HTTP_201_CREATED
+        elif result['created']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(result, status=response_status)
+
+    @action(detail=False, content_negotiation_class=ExportNegotiation)
+    def export(self, request):
+        """
+        Stream every matching activity as ?format=csv or ndjson, optionally
+        ?compression=gzip. Takes the same filters, ?fields= and ?ordering= as
+        the list.
+        """
+        params = ExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        queryset = self.filter_queryset(NativeQuerySet(Activity))
+        fields = parse_fields(request.query_params.get('fields', '')) or ActivitySerializer.Meta.fields
+        return export_response(
+            queryset, ActivitySerializer, fields, params.validated_data['format'],
+            params.validated_data.get('compression'), 'activities'
+        )
+
+
+class LeaderboardViewSet(CachedResponseMixin, ExpandMixin, LeanListMixin, NativeReadMixin, viewsets.ModelViewSet):
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering = 'rank'
+    cache_namespace = 'leaderboard'
+    expandable = ('user', 'team')
+
+    def initial(self, request, *args, **kwargs):
+        # Pick up rebuilds run by other processes before reading any cache.
+        leaderboard_rebuild.watcher.check()
+        super().initial(request, *args, **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        if 'window' in request.query_params:
+            return self.cached(self.windowed_list, request, *args, **kwargs)
+        return super().list(request, *args, **kwargs)
 
+    def cache_variant(self, request):
+        # Days leave a window without any leaderboard write.
+        try:
+            return f"{windows.current_start(request.query_params['window']):%Y-%m-%d}"
+        except (KeyError, ValueError):
+            return ''
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+    def windowed_list(self, request, *args, **kwargs):
+        """The board over ?window=Nd (rolling days), week or month."""
+        try:
+            board = windows.get_board(request.query_params['window'])
+        except ValueError as exc:
+            return Response({'window': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        paginator = RankedListPagination()
+        page, offset = paginator.paginate_list(board.ranked(), windows.rank_key, request)
+        entries = windows.entries(page, offset=offset)
+        return self.expand_response(
+            request, paginator.get_paginated_response(LeaderboardSerializer(entries, many=True).data)
+        )
+
+    @action(detail=False, content_negotiation_class=ExportNegotiation)
+    def export(self, request):
+        """Stream the whole board by rank as ?format=csv or ndjson, optionally ?compression=gzip."""
+        params = ExportQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return export_response(
+            NativeQuerySet(Leaderboard).order_by('rank', '_id'), LeaderboardSerializer,
+            LeaderboardSerializer.Meta.fields, params.validated_data['format'],
+            params.validated_data.get('compression'), 'leaderboard'
+        )
+
+    @action(detail=False)
+    def top(self, request):
+        """The first ?k= entries of the board."""
+        params = TopQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        entries = rank_index.top(params.validated_data['k'])
+        return self.expand_response(request, Response(LeaderboardSerializer(entries, many=True).data))
+
+    @action(detail=False, url_path=r'rank/(?P<user_id>\d+)')
+    def rank(self, request, user_id):
+        """One user's rank with up to ?neighbors= entries above and below."""
+        params = RankQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rank, entries = rank_index.around(int(user_id), params.validated_data['neighbors'])
+        if rank is None:
+            return Response({'detail': 'User is not on the leaderboard.'}, status=status.HTTP_404_NOT_FOUND)
+        return self.expand_response(request, Response({
+            'user_id': int(user_id),
+            'rank': rank,
+            'results': LeaderboardSerializer(entries, many=True).data,
+        }))
+
+
+class WorkoutViewSet(AllocatedIdMixin, CachedResponseMixin, LeanListMixin, viewsets.ModelViewSet):
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    ordering = '_id'
+    cache_namespace = 'workouts'
+
+
+class StatsView(APIView):
+    """
+    Activity totals per day, week or month for one user (?user_id=), one
+    team (?team_id=) or everyone, optionally for one activity ?type=, between
+    ?start= and ?end=. Answered from the rollups, one document per bucket.
+    """
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request, format=None):
+        params = StatsQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        params = params.validated_data
+
+        if 'user_id' in params:
+            scope, scope_id = 'user', params['user_id']
+        elif 'team_id' in params:
+            scope, scope_id = 'team', params['team_id']
+        else:
+            scope, scope_id = 'all', 0
+
+        buckets = rollups.query(
+            params['granularity'], scope, scope_id, params['type'],
+            start=params.get('start'), end=params.get('end')
+        )
+        return Response({
+            'granularity': params['granularity'],
+            'scope': scope,
+            'scope_id': scope_id,
+            'type': params['type'],
+            'results': ActivityRollupSerializer(buckets, many=True).data,
+        })
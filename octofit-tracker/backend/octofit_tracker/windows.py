@@ -0,0 +1,195 @@
+"""
+Time-windowed leaderboards: rolling ``Nd`` windows and the current calendar
+``week`` or ``month``.
+
+Each board keeps per-user running totals plus the per-day amounts that make
+them up. Moving the window forward subtracts only the days that fell out of
+it, so expiring activities never rescans them. Boards are seeded from the
+daily rollups, follow activity writes in this process and are re-seeded
+every WINDOW_RESEED_SECONDS to pick up writes handled by other workers.
+"""
+import re
+from bisect import insort
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.dispatch import receiver
+
+from . import leaderboard, rollups
+from .models import ActivityRollup, User
+from .native import NativeQuerySet
+from .signals import activities_changed
+
+ROLLING_WINDOW = re.compile(r'^(\d+)d$')
+
+FIELDS = leaderboard.TOTAL_FIELDS
+RANK_INDEX = FIELDS.index(leaderboard.RANK_METRIC)
+
+
+def _today():
+    return datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def window_start(window, today):
+    """Return the first day covered by ``window`` on ``today``, or raise ValueError."""
+    match = ROLLING_WINDOW.match(window)
+    if match:
+        days = int(match.group(1))
+        if not 1 <= days <= settings.WINDOW_MAX_DAYS:
+            raise ValueError(f'Rolling windows must be 1 to {settings.WINDOW_MAX_DAYS} days.')
+        return today - timedelta(days=days - 1)
+    if window == 'week':
+        return today - timedelta(days=today.weekday())
+    if window == 'month':
+        return today.replace(day=1)
+    raise ValueError('window must be Nd (e.g. 7d, 30d), week or month.')
+
+
+def rank_key(item):
+    """Sort key of a ``(user_id, totals)`` pair in ``ranked()`` order."""
+    user_id, totals = item
+    return (-totals[RANK_INDEX], user_id)
+
+
+class SlidingWindowBoard:
+    def __init__(self, window):
+        self.window = window
+        self.start = None
+        self.days = []  # sorted days that hold amounts
+        self.amounts = {}  # day -> {user_id: [activities, duration, distance, calories]}
+        self.totals = {}  # user_id -> running totals over the window
+        self.seeded_at = None
+        self._ranked = None
+        self._lock = Lock()
+
+    def _add(self, user_id, day, amounts):
+        if day < self.start:
+            return
+        if day not in self.amounts:
+            self.amounts[day] = {}
+            insort(self.days, day)
+        for target in (self.amounts[day].setdefault(user_id, [0] * len(FIELDS)),
+                       self.totals.setdefault(user_id, [0] * len(FIELDS))):
+            for index, amount in enumerate(amounts):
+                target[index] += amount
+        if self.totals[user_id][0] <= 0:
+            del self.totals[user_id]
+        self._ranked = None
+
+    def _advance(self, today):
+        """Move the window start forward, subtracting the days that expired."""
+        self.start = window_start(self.window, today)
+        while self.days and self.days[0] < self.start:
+            for user_id, amounts in self.amounts.pop(self.days.pop(0)).items():
+                totals = self.totals.get(user_id)
+                if totals is None:
+                    continue
+                for index, amount in enumerate(amounts):
+                    totals[index] -= amount
+                if totals[0] <= 0:
+                    del self.totals[user_id]
+                self._ranked = None
+
+    def _seed(self, today):
+        self.start = window_start(self.window, today)
+        self.days, self.amounts, self.totals = [], {}, {}
+        daily = NativeQuerySet(ActivityRollup).filter(
+            granularity='day', scope='user', type=ActivityRollup.TYPE_ALL, bucket__gte=self.start
+        )
+        for rollup in daily:
+            self._add(rollup['scope_id'], rollup['bucket'], [
+                rollup['count'], rollup['duration'], rollup['distance'], rollup['calories']
+            ])
+        self.seeded_at = monotonic()
+        self._ranked = None
+
+    def _reseed_due(self):
+        return self.seeded_at is None or monotonic() - self.seeded_at > settings.WINDOW_RESEED_SECONDS
+
+    def _refresh(self):
+        today = _today()
+        if self._reseed_due():
+            self._seed(today)
+        elif window_start(self.window, today) != self.start:
+            self._advance(today)
+
+    def apply(self, activities, sign):
+        with self._lock:
+            # A board that is due for a reseed will read these activities
+            # back from the rollups on its next read; adding them now as well
+            # would count them twice.
+            if self._reseed_due():
+                return
+            self._refresh()
+            for activity in activities:
+                delta = leaderboard.activity_delta(activity, sign)
+                self._add(
+                    leaderboard.activity_field(activity, 'user_id'),
+                    rollups.bucket_start(leaderboard.activity_field(activity, 'date'), 'day'),
+                    [delta[field] for field in FIELDS],
+                )
+
+    def ranked(self):
+        """Return ``(user_id, totals)`` pairs, best first."""
+        with self._lock:
+            self._refresh()
+            if self._ranked is None:
+                self._ranked = sorted(self.totals.items(), key=rank_key)
+            return self._ranked
+
+
+_boards = {}
+_boards_lock = Lock()
+
+
+def normalize_window(window):
+    """Return the canonical spelling of a valid ``window`` (``07d`` -> ``7d``), or raise ValueError."""
+    window_start(window, _today())
+    match = ROLLING_WINDOW.match(window)
+    return f'{int(match.group(1))}d' if match else window
+
+
+def current_start(window):
+    """The first day ``window`` covers today, or raise ValueError."""
+    return window_start(window, _today())
+
+
+def get_board(window):
+    # One board per distinct window: at most WINDOW_MAX_DAYS rolling ones.
+    window = normalize_window(window)
+    with _boards_lock:
+        if window not in _boards:
+            _boards[window] = SlidingWindowBoard(window)
+        return _boards[window]
+
+
+def entries(ranked, offset=0):
+    """Turn a slice of ranked totals into leaderboard entries."""
+    users = {
+        user['_id']: user
+        for user in NativeQuerySet(User).filter(_id__in=[user_id for user_id, _ in ranked])
+        .only('_id', 'name', 'team_id')
+    }
+    result = []
+    for position, (user_id, totals) in enumerate(ranked, offset + 1):
+        user = users.get(user_id, {})
+        entry = dict(zip(FIELDS, totals))
+        entry['total_distance'] = round(entry['total_distance'], 2)
+        entry.update({
+            '_id': user_id,
+            'user_id': user_id,
+            'user_name': user.get('name', f'User {user_id}'),
+            'team_id': user.get('team_id', 0),
+            'rank': position,
+        })
+        result.append(entry)
+    return result
+
+
+@receiver(activities_changed)
+def _on_activities_changed(sender, added=(), removed=(), **kwargs):
+    for board in list(_boards.values()):
+        board.apply(removed, -1)
+        board.apply(added, 1)
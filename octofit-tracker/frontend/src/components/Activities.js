@@ -14,7 +14,8 @@ function Activities() {
           ? `http://${codespace}` 
           : `https://${codespace}-8000.app.github.dev`;
         
-        const apiEndpoint = `${baseUrl}/api/activities/`;
+        // Users are embedded server-side instead of joined from /api/users/.
+        const apiEndpoint = `${baseUrl}/api/activities/?expand=user`;
         
         const response = await fetch(apiEndpoint);
         
@@ -75,7 +76,7 @@ function Activities() {
             <thead>
               <tr>
                 <th>ID</th>
-                <th>User ID</th>
+                <th>User</th>
                 <th>Type</th>
                 <th>Duration (min)</th>
                 <th>Distance (km)</th>
@@ -88,7 +89,7 @@ function Activities() {
               {activities.map((activity) => (
                 <tr key={activity._id}>
                   <td><strong>#{activity._id}</strong></td>
-                  <td>{activity.user_id}</td>
+                  <td>{activity.user ? activity.user.name : `User ${activity.user_id}`}</td>
                   <td><span className="badge bg-primary">{activity.type}</span></td>
                   <td>{activity.duration} min</td>
                   <td>{activity.distance?.toFixed(2)} km</td>
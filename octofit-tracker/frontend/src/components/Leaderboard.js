@@ -1,57 +1,74 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
+
+const codespace = process.env.REACT_APP_CODESPACE_NAME || 'localhost:8000';
+const baseUrl = codespace.includes('localhost')
+  ? `http://${codespace}`
+  : `https://${codespace}-8000.app.github.dev`;
 
 function Leaderboard() {
   const [leaderboard, setLeaderboard] = useState([]);
-  const [teams, setTeams] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const leaderboardRef = useRef([]);
+  leaderboardRef.current = leaderboard;
+
+  const fetchData = useCallback(async () => {
+    try {
+      // REST API endpoint format: https://$REACT_APP_CODESPACE_NAME-8000.app.github.dev/api/leaderboard/
+      // Team names are embedded server-side with ?expand=team.
+      const response = await fetch(`${baseUrl}/api/leaderboard/?expand=team`);
+
+      if (!response.ok) {
+        throw new Error('Failed to fetch data');
+      }
+
+      const data = await response.json();
+
+      // Handle both paginated (.results) and plain array responses
+      setLeaderboard(Array.isArray(data) ? data : data.results || []);
+      setLoading(false);
+    } catch (err) {
+      if (process.env.NODE_ENV === 'development') {
+        console.error('Error fetching data:', err);
+      }
+      setError(err.message);
+      setLoading(false);
+    }
+  }, []);
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        // REST API endpoint format: https://$REACT_APP_CODESPACE_NAME-8000.app.github.dev/api/leaderboard/
-        const codespace = process.env.REACT_APP_CODESPACE_NAME || 'localhost:8000';
-        const baseUrl = codespace.includes('localhost') 
-          ? `http://${codespace}` 
-          : `https://${codespace}-8000.app.github.dev`;
-        
-        const leaderboardEndpoint = `${baseUrl}/api/leaderboard/`;
-        const teamsEndpoint = `${baseUrl}/api/teams/`;
-        
-        const [leaderboardResponse, teamsResponse] = await Promise.all([
-          fetch(leaderboardEndpoint),
-          fetch(teamsEndpoint)
-        ]);
-        
-        if (!leaderboardResponse.ok || !teamsResponse.ok) {
-          throw new Error('Failed to fetch data');
+    // Rank changes are pushed over Server-Sent Events when the backend runs
+    // under ASGI; the stream is opened before the first fetch so no change
+    // is missed in between. A "resync" event means we fell behind.
+    let stream = null;
+    if (typeof EventSource !== 'undefined') {
+      stream = new EventSource(`${baseUrl}/api/leaderboard/stream/`);
+      stream.addEventListener('rank', (event) => {
+        const { changes } = JSON.parse(event.data);
+        const shown = leaderboardRef.current;
+        // Someone we do not have moved into the ranks on screen: refetch.
+        if (changes.some((change) => change.new_rank <= shown.length
+            && !shown.some((entry) => entry.user_id === change.user_id))) {
+          fetchData();
+          return;
         }
-        
-        const leaderboardData = await leaderboardResponse.json();
-        const teamsData = await teamsResponse.json();
-        
-        // Handle both paginated (.results) and plain array responses
-        const leaderboard = Array.isArray(leaderboardData) ? leaderboardData : leaderboardData.results || [];
-        const allTeams = Array.isArray(teamsData) ? teamsData : teamsData.results || [];
-        setLeaderboard(leaderboard);
-        setTeams(allTeams);
-        setLoading(false);
-      } catch (err) {
-        if (process.env.NODE_ENV === 'development') {
-          console.error('Error fetching data:', err);
-        }
-        setError(err.message);
-        setLoading(false);
-      }
-    };
+        const newRanks = new Map(changes.map((change) => [change.user_id, change.new_rank]));
+        setLeaderboard((current) => current
+          .map((entry) => (newRanks.has(entry.user_id) ? { ...entry, rank: newRanks.get(entry.user_id) } : entry))
+          .sort((a, b) => a.rank - b.rank));
+      });
+      stream.addEventListener('resync', () => fetchData());
+    }
 
     fetchData();
-  }, []);
+    return () => {
+      if (stream) {
+        stream.close();
+      }
+    };
+  }, [fetchData]);
 
-  const getTeamName = (teamId) => {
-    const team = teams.find(t => t._id === teamId);
-    return team ? team.name : `Team ${teamId}`;
-  };
+  const getTeamName = (entry) => (entry.team ? entry.team.name : `Team ${entry.team_id}`);
 
   if (loading) {
     return (
@@ -105,7 +122,7 @@ function Leaderboard() {
                     </span>
                   </td>
                   <td><strong>{entry.user_name}</strong></td>
-                  <td><span className="badge bg-info">{getTeamName(entry.team_id)}</span></td>
+                  <td><span className="badge bg-info">{getTeamName(entry)}</span></td>
                   <td>{entry.total_activities}</td>
                   <td>{entry.total_duration} min</td>
                   <td>{entry.total_distance?.toFixed(2)} km</td>
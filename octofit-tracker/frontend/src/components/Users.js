@@ -18,7 +18,7 @@ function Users() {
           ? `http://${codespace}` 
           : `https://${codespace}-8000.app.github.dev`;
         
-        const usersEndpoint = `${baseUrl}/api/users/`;
+        const usersEndpoint = `${baseUrl}/api/users/?expand=team`;
         const teamsEndpoint = `${baseUrl}/api/teams/`;
         
         const [usersResponse, teamsResponse] = await Promise.all([
@@ -100,8 +100,9 @@ function Users() {
       
       const updatedUser = await response.json();
       
-      // Update the users list
-      setUsers(users.map(u => u._id === updatedUser._id ? updatedUser : u));
+      // Update the users list; the PATCH response carries no embedded team
+      const team = teams.find(t => t._id === updatedUser.team_id);
+      setUsers(users.map(u => u._id === updatedUser._id ? { ...updatedUser, team } : u));
       handleClose();
     } catch (err) {
       if (process.env.NODE_ENV === 'development') {
@@ -162,7 +163,7 @@ function Users() {
                   <td><strong>{user.name}</strong></td>
                   <td><code>{user.email.split('@')[0]}</code></td>
                   <td className="text-muted">{user.email}</td>
-                  <td><span className="badge bg-info">Team {user.team_id}</span></td>
+                  <td><span className="badge bg-info">{user.team ? user.team.name : `Team ${user.team_id}`}</span></td>
                   <td><span className="badge bg-success">{user.role}</span></td>
                   <td>{new Date(user.created_at).toLocaleDateString()}</td>
                   <td>